@@ -0,0 +1,232 @@
+"""
+Control de admisión de updates: límite por usuario, cola global acotada con prioridades y
+descarte de carga (load shedding) con respuestas predefinidas
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, TypeVar
+
+from metrics import REGISTRY
+from models import ConversationState
+from ratelimit import KeyedTokenBuckets
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Clase de prioridad por estado (menor = más prioritario): quien está por convertir va primero
+STATE_PRIORITY = {
+    ConversationState.WAITING_QUOTATION_DATA: 0,
+    ConversationState.WAITING_DISTRIBUTOR: 1,
+    ConversationState.WAITING_EQUIPMENT_QUESTIONS: 1,
+    ConversationState.WAITING_EQUIPMENT: 2,
+    ConversationState.WAITING_NAME: 2,
+    ConversationState.INITIAL: 3,
+    ConversationState.COMPLETED: 3,
+}
+PRIORITY_NAMES = ('high', 'medium', 'normal', 'low')
+
+ADMISSION_SHED = REGISTRY.counter(
+    "chatbot_admission_shed_total", "Turnos atendidos con respuesta predefinida en vez de procesarse",
+    ["reason", "priority"]
+)
+ADMISSION_ADMITTED = REGISTRY.counter(
+    "chatbot_admission_admitted_total", "Turnos admitidos en la cola de trabajo", ["priority"]
+)
+ADMISSION_QUEUE_WAIT = REGISTRY.histogram(
+    "chatbot_admission_queue_wait_seconds", "Espera en la cola de admisión hasta que un worker toma el turno",
+    ["priority"]
+)
+ADMISSION_QUEUE_DEPTH = REGISTRY.gauge(
+    "chatbot_admission_queue_depth", "Turnos esperando en la cola de admisión"
+)
+
+
+class Shed(Exception):
+    """El turno se descartó (límite por usuario, cola llena o desplazado por uno más prioritario)"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class _Job:
+    __slots__ = ('priority', 'seq', 'telegram_id', 'work', 'future', 'enqueued_at', 'shed')
+
+    def __init__(self, priority: int, seq: int, telegram_id: str, work: Callable[[], Awaitable]):
+        self.priority = priority
+        self.seq = seq
+        self.telegram_id = telegram_id
+        self.work = work
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+        self.shed = False
+
+    def __lt__(self, other: "_Job") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """Admite turnos en una cola de prioridad acotada atendida por un pool de workers.
+
+    - Cada usuario tiene un token bucket (`user_rate` mensajes/s, ráfagas de `user_burst`).
+    - Con la cola por encima de `shed_depth`, los turnos de prioridad `shed_priority` o menor se
+      descartan directamente; con la cola llena, un turno nuevo desplaza al menos prioritario
+      encolado (o se descarta si no hay ninguno peor).
+    - Los turnos de un mismo usuario se procesan de uno en uno y en orden de llegada: solo el más
+      antiguo de cada usuario está en la cola de prioridad, los demás esperan en una cola por
+      usuario sin ocupar un worker.
+    """
+
+    def __init__(self, workers: int = 8, max_queue: int = 100, shed_depth: Optional[int] = None,
+                 shed_priority: int = 3, user_rate: float = 0.5, user_burst: float = 3):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.shed_depth = max_queue // 2 if shed_depth is None else shed_depth
+        self.shed_priority = shed_priority
+        self.user_limiter = KeyedTokenBuckets(user_rate, user_burst)
+        self._heap: List[_Job] = []
+        self._queued = 0  # Turnos encolados no desplazados
+        self._seq = itertools.count()
+        self._available: Optional[asyncio.Condition] = None
+        # Turno de cada usuario en la cola de prioridad o en curso, y los siguientes en orden de llegada
+        self._owners: Dict[str, _Job] = {}
+        self._waiting: Dict[str, Deque[_Job]] = {}
+        self._stopping = False
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def capacity(self) -> int:
+        """Turnos que pueden estar en curso o en cola a la vez"""
+        return self.workers + self.max_queue
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    async def start(self):
+        self._stopping = False
+        self._available = asyncio.Condition()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info("Control de admisión iniciado: %s workers, cola de %s", self.workers, self.max_queue)
+
+    async def stop(self):
+        """Detiene los workers; los turnos encolados o en curso se resuelven con Shed("shutdown")"""
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        pending = list(self._heap) + [job for waiting in self._waiting.values() for job in waiting]
+        for job in pending:
+            if not job.future.done():
+                job.future.set_exception(Shed("shutdown"))
+        self._heap.clear()
+        self._owners.clear()
+        self._waiting.clear()
+        self._queued = 0
+        ADMISSION_QUEUE_DEPTH.set(0)
+
+    def priority_for(self, state: ConversationState) -> int:
+        return STATE_PRIORITY.get(state, len(PRIORITY_NAMES) - 1)
+
+    def _shed(self, reason: str, priority: int):
+        ADMISSION_SHED.inc(reason=reason, priority=PRIORITY_NAMES[priority])
+        raise Shed(reason)
+
+    def _evict_lowest(self, priority: int) -> bool:
+        """Desplaza el turno encolado menos prioritario si es peor que `priority`"""
+        candidates = [job for job in self._heap if not job.shed]
+        candidates += [job for waiting in self._waiting.values() for job in waiting if not job.shed]
+        if not candidates:
+            return False
+        worst = max(candidates, key=lambda job: (job.priority, job.seq))
+        if worst.priority <= priority:
+            return False
+        worst.shed = True
+        self._queued -= 1
+        ADMISSION_SHED.inc(reason="evicted", priority=PRIORITY_NAMES[worst.priority])
+        worst.future.set_exception(Shed("evicted"))
+        if self._owners.get(worst.telegram_id) is worst:
+            # Era el turno del usuario en la cola de prioridad: pasa el siguiente suyo
+            self._advance(worst.telegram_id)
+        return True
+
+    def _advance(self, telegram_id: str):
+        """Cede el turno del usuario a su siguiente turno en espera (si queda alguno)"""
+        waiting = self._waiting.get(telegram_id)
+        while waiting and waiting[0].shed:
+            waiting.popleft()
+        if not waiting:
+            self._owners.pop(telegram_id, None)
+            self._waiting.pop(telegram_id, None)
+            return
+        job = waiting.popleft()
+        if not waiting:
+            del self._waiting[telegram_id]
+        self._owners[telegram_id] = job
+        heapq.heappush(self._heap, job)
+
+    async def submit(self, telegram_id: str, priority: int, work: Callable[[], Awaitable[T]]) -> T:
+        """Encola el turno y espera su resultado; lanza Shed si se descarta"""
+        if self._stopping:
+            raise Shed("shutdown")
+        if not self.user_limiter.try_acquire(telegram_id):
+            self._shed("user_rate", priority)
+        if self._queued >= self.shed_depth and priority >= self.shed_priority:
+            self._shed("overload", priority)
+        if self._queued >= self.max_queue and not self._evict_lowest(priority):
+            self._shed("queue_full", priority)
+
+        job = _Job(priority, next(self._seq), telegram_id, work)
+        async with self._available:
+            if telegram_id in self._owners:
+                self._waiting.setdefault(telegram_id, deque()).append(job)
+            else:
+                self._owners[telegram_id] = job
+                heapq.heappush(self._heap, job)
+            self._queued += 1
+            ADMISSION_QUEUE_DEPTH.set(self._queued)
+            ADMISSION_ADMITTED.inc(priority=PRIORITY_NAMES[priority])
+            self._available.notify()
+        return await job.future
+
+    async def _next_job(self) -> _Job:
+        async with self._available:
+            while True:
+                while self._heap and self._heap[0].shed:
+                    heapq.heappop(self._heap)
+                if self._heap:
+                    job = heapq.heappop(self._heap)
+                    self._queued -= 1
+                    ADMISSION_QUEUE_DEPTH.set(self._queued)
+                    if self._heap:
+                        # Puede haber más de un turno listo (p. ej. el siguiente de un usuario)
+                        self._available.notify()
+                    return job
+                await self._available.wait()
+
+    async def _worker(self):
+        while True:
+            job = await self._next_job()
+            ADMISSION_QUEUE_WAIT.observe(time.monotonic() - job.enqueued_at,
+                                         priority=PRIORITY_NAMES[job.priority])
+            try:
+                result = await job.work()
+            except asyncio.CancelledError:
+                # stop(): quien espera el turno recibe Shed en vez de quedarse esperando
+                if not job.future.done():
+                    job.future.set_exception(Shed("shutdown"))
+                raise
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            else:
+                if not job.future.done():
+                    job.future.set_result(result)
+            self._advance(job.telegram_id)
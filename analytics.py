@@ -0,0 +1,217 @@
+"""
+Exportación de conversaciones terminadas a Parquet y consultas de embudo
+
+Las conversaciones terminadas (completadas, reiniciadas o abandonadas) se acumulan en memoria y
+se escriben por lotes en archivos Parquet particionados por fecha (`date=YYYY-MM-DD/`). pandas se
+importa solo al escribir o consultar, para no afectar el arranque del bot.
+
+Una misma conversación puede exportarse más de una vez (abandonada y después completada, o de
+nuevo tras un reinicio del bot): cada fila lleva `conversation_id` y las consultas se quedan con
+la última por `ended_at`.
+
+Uso:
+    python analytics.py funnel --path data/analytics [--since 2025-01-01] [--until 2025-01-31] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from models import ConversationState, STATE_ORDER, get_equipment_family
+
+logger = logging.getLogger(__name__)
+
+STATE_INDEX = {state.value: index for index, state in enumerate(STATE_ORDER)}
+
+COLUMNS = [
+    'conversation_id', 'telegram_id', 'ended_reason', 'final_state', 'state_index', 'completed', 'equipment_interest',
+    'equipment_family', 'is_distributor', 'has_company', 'has_email', 'has_phone', 'turns',
+    'started_at', 'ended_at', 'duration_s', 'date'
+]
+
+
+def conversation_record(conv: Dict, ended_reason: str, ended_at: Optional[float] = None) -> Dict:
+    """Convierte una conversación y los campos de su Lead en una fila de analítica"""
+    lead = conv['lead']
+    state = conv['state']
+    ended = datetime.fromtimestamp(ended_at or time.time())
+    started = datetime.fromisoformat(lead.created_at) if lead.created_at else ended
+    return {
+        'conversation_id': f"{lead.telegram_id}:{lead.created_at or ''}",
+        'telegram_id': lead.telegram_id,
+        'ended_reason': ended_reason,
+        'final_state': state.value,
+        'state_index': STATE_INDEX[state.value],
+        'completed': state == ConversationState.COMPLETED,
+        'equipment_interest': lead.equipment_interest,
+        'equipment_family': get_equipment_family(lead.equipment_interest),
+        'is_distributor': lead.is_distributor,
+        'has_company': bool(lead.company_name),
+        'has_email': bool(lead.email),
+        'has_phone': bool(lead.phone),
+        'turns': conv.get('turns', 0),
+        'started_at': started,
+        'ended_at': ended,
+        'duration_s': max((ended - started).total_seconds(), 0.0),
+        'date': ended.strftime('%Y-%m-%d')
+    }
+
+
+class ConversationExporter:
+    def __init__(self, directory: str, batch_size: int = 5000):
+        self.directory = directory
+        self.batch_size = batch_size
+        self._buffer: List[Dict] = []
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.exported = 0
+
+    def record(self, conv: Dict, ended_reason: str):
+        """Agrega una conversación terminada al buffer; si se llena, programa una escritura"""
+        self._buffer.append(conversation_record(conv, ended_reason))
+        if len(self._buffer) >= self.batch_size and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.create_task(self.flush())
+
+    async def flush(self):
+        """Escribe el buffer actual en Parquet en un hilo"""
+        async with self._flush_lock:
+            rows, self._buffer = self._buffer, []
+            if not rows:
+                return
+            try:
+                await asyncio.to_thread(self._write, rows)
+                self.exported += len(rows)
+            except Exception as e:
+                logger.error("Error exportando conversaciones a Parquet: %s", e)
+                # Conservar las filas para el siguiente intento
+                self._buffer = rows + self._buffer
+
+    def _write(self, rows: List[Dict]):
+        import pandas as pd
+
+        frame = pd.DataFrame(rows, columns=COLUMNS)
+        frame['is_distributor'] = frame['is_distributor'].astype('boolean')
+        for date, partition in frame.groupby('date', sort=False):
+            directory = os.path.join(self.directory, f"date={date}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-{int(time.time() * 1000)}-{uuid.uuid4().hex[:8]}.parquet")
+            partition.drop(columns=['date']).to_parquet(path, index=False)
+        logger.info("Conversaciones exportadas a Parquet: %s", len(rows))
+
+    async def run_periodic_flush(self, interval: float):
+        """Escribe el buffer cada `interval` segundos aunque no se haya llenado"""
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+
+# Consultas
+
+def load_conversations(path: str, since: Optional[str] = None, until: Optional[str] = None,
+                       columns: Optional[List[str]] = None):
+    """Lee el dataset particionado filtrando por fecha a nivel de partición"""
+    import pandas as pd
+
+    filters = []
+    if since:
+        filters.append(('date', '>=', since))
+    if until:
+        filters.append(('date', '<=', until))
+    return pd.read_parquet(path, columns=columns, filters=filters or None)
+
+
+def funnel_metrics(frame) -> Dict:
+    """Métricas de embudo vectorizadas sobre el DataFrame de conversaciones"""
+    import numpy as np
+
+    if 'conversation_id' in frame.columns:
+        # Última escritura gana: una completada reemplaza a su registro previo de abandonada
+        frame = frame.sort_values(['ended_at', 'state_index'], kind='stable')
+        frame = frame.drop_duplicates('conversation_id', keep='last')
+    total = len(frame)
+    if total == 0:
+        return {'conversations': 0}
+    state_index = frame['state_index'].to_numpy()
+    completed = frame['completed'].to_numpy(dtype=bool)
+
+    # Conversaciones que llegaron al menos a cada estado
+    reached = np.bincount(state_index, minlength=len(STATE_ORDER))[::-1].cumsum()[::-1]
+    dropped = frame.loc[~completed, 'final_state'].value_counts()
+
+    distributor = frame['is_distributor'].dropna()
+    turns = frame['turns']
+    return {
+        'conversations': int(total),
+        'completion_rate': round(float(completed.mean()), 4),
+        'funnel': {
+            state.value: {
+                'reached': int(reached[index]),
+                'reached_rate': round(float(reached[index] / total), 4),
+                'dropped': int(dropped.get(state.value, 0)),
+                'drop_off_rate': round(float(dropped.get(state.value, 0) / reached[index]), 4) if reached[index] else 0.0
+            }
+            for index, state in enumerate(STATE_ORDER)
+        },
+        'equipment_mix': {
+            family: round(float(share), 4)
+            for family, share in frame['equipment_family'].value_counts(normalize=True).items()
+        },
+        'distributor_ratio': round(float(distributor.astype(bool).mean()), 4) if len(distributor) else None,
+        'turns': {
+            'all': {'mean': round(float(turns.mean()), 2), 'p50': float(turns.quantile(0.5)),
+                    'p95': float(turns.quantile(0.95))},
+            'completed': {'mean': round(float(turns[completed].mean()), 2) if completed.any() else None},
+            'not_completed': {'mean': round(float(turns[~completed].mean()), 2) if (~completed).any() else None}
+        },
+        'ended_reason': {
+            reason: int(count) for reason, count in frame['ended_reason'].value_counts().items()
+        }
+    }
+
+
+FUNNEL_COLUMNS = ['conversation_id', 'ended_at', 'final_state', 'state_index', 'completed', 'equipment_family',
+                  'is_distributor', 'turns', 'ended_reason']
+
+
+def _print_funnel(metrics: Dict):
+    print(f"Conversaciones: {metrics['conversations']}  completadas: {metrics['completion_rate']:.1%}")
+    print("\nEmbudo (alcanzaron / abandonaron en el estado):")
+    for state, data in metrics['funnel'].items():
+        print(f"  {state:<30} {data['reached']:>10} ({data['reached_rate']:>6.1%})  "
+              f"abandono {data['dropped']:>8} ({data['drop_off_rate']:>6.1%})")
+    print("\nMezcla de equipos:")
+    for family, share in metrics['equipment_mix'].items():
+        print(f"  {family:<20} {share:>6.1%}")
+    if metrics['distributor_ratio'] is not None:
+        print(f"\nDistribuidores: {metrics['distributor_ratio']:.1%}")
+    print(f"Turnos: {metrics['turns']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consultas de analítica de conversaciones")
+    parser.add_argument("command", choices=["funnel"])
+    parser.add_argument("--path", default=os.getenv("ANALYTICS_DIR", "data/analytics"))
+    parser.add_argument("--since", default=None, help="Fecha inicial YYYY-MM-DD")
+    parser.add_argument("--until", default=None, help="Fecha final YYYY-MM-DD")
+    parser.add_argument("--json", action="store_true", help="Imprime el resultado en JSON")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    frame = load_conversations(args.path, args.since, args.until, columns=FUNNEL_COLUMNS)
+    metrics = funnel_metrics(frame)
+    metrics['query_seconds'] = round(time.perf_counter() - start, 3)
+    if args.json:
+        print(json.dumps(metrics, indent=2, ensure_ascii=False))
+    else:
+        _print_funnel(metrics)
+        print(f"\nConsulta en {metrics['query_seconds']} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,43 +3,109 @@ Chatbot automatizado para calificación de leads de maquinaria ligera
 Integra Telegram + Groq LLM + HubSpot CRM + inventario CSV
 """
 
-from inventory import InventoryManager
-from hubspot import HubSpotManager
-from llm import LLMManager
-from conversation import ConversationManager
-from telegram_bot import TelegramBot
-from config import (
-    TELEGRAM_BOT_TOKEN, 
-    GROQ_API_KEY, 
-    HUBSPOT_ACCESS_TOKEN, 
-    validate_environment,
-    logger
-)
+import logging
+import config
+
+logger = logging.getLogger(__name__)
 
 def main():
     """Función principal"""
+    # Cargar .env y configurar logging antes de importar el resto de los módulos
+    config.load_environment()
+    
     # Validar variables de entorno
-    if not validate_environment():
+    if not config.validate_environment():
         return
     
     try:
-        # Inicializar componentes
-        inventory_manager = InventoryManager()
-        hubspot_manager = HubSpotManager(HUBSPOT_ACCESS_TOKEN)
-        llm_manager = LLMManager(GROQ_API_KEY)
+        # Importaciones diferidas: los módulos pesados se cargan después de validar el entorno
+        from tracing import configure_structlog
+        from inventory import InventoryManager
+        from hubspot import HubSpotManager
+        from llm import LLMManager
+        from llm_backends import LlamaCppBackend, parse_task_backends
+        from conversation import ConversationManager
+        from journal import LeadJournal
+        from analytics import ConversationExporter
+        from replies import ReplyPlanner
+        from speculation import ReplySpeculator
+        from admission import AdmissionController
+        from speech import Transcriber, speech_available, default_cpu_threads
+        from telegram_bot import TelegramBot
+        
+        configure_structlog()
+        
+        # Inicializar componentes; el inventario se carga en segundo plano al iniciar el bot
+        # y el cliente del LLM se crea en el primer uso
+        inventory_manager = InventoryManager(autoload=False)
+        hubspot_manager = HubSpotManager(config.HUBSPOT_ACCESS_TOKEN)
+        task_backends = parse_task_backends(config.LLM_TASK_BACKENDS)
+        backends = {}
+        if config.LLM_BACKEND == 'local' or any(name == 'local' for _, name in task_backends):
+            backends['local'] = LlamaCppBackend(
+                config.LOCAL_LLM_URL,
+                model=config.LOCAL_LLM_MODEL,
+                parallel=config.LOCAL_LLM_PARALLEL,
+                timeout=config.LOCAL_LLM_TIMEOUT
+            )
+        llm_manager = LLMManager(
+            config.GROQ_API_KEY,
+            batch_window=config.EXTRACTION_BATCH_WINDOW_MS / 1000,
+            max_batch=config.EXTRACTION_BATCH_MAX,
+            backends=backends,
+            default_backend=config.LLM_BACKEND,
+            task_backends=task_backends
+        )
+        # Journal local: el estado se restaura al iniciar el bot (post_init)
+        journal = LeadJournal(config.JOURNAL_DIR, config.JOURNAL_SEGMENT_MAX_BYTES) if config.JOURNAL_DIR else None
+        exporter = (
+            ConversationExporter(config.ANALYTICS_DIR, config.ANALYTICS_BATCH_SIZE)
+            if config.ANALYTICS_DIR else None
+        )
         
         conversation_manager = ConversationManager(
             inventory_manager,
             hubspot_manager, 
-            llm_manager
+            llm_manager,
+            journal,
+            exporter,
+            ReplyPlanner() if config.REPLY_TEMPLATES else None,
+            ReplySpeculator(llm_manager, config.SPECULATION_WASTE_TOKEN_BUDGET) if config.SPECULATIVE_REPLIES else None
+        )
+        
+        # Control de admisión: cola de prioridad acotada y descarte de carga ante picos
+        admission = (
+            AdmissionController(
+                workers=config.ADMISSION_WORKERS,
+                max_queue=config.ADMISSION_QUEUE_SIZE,
+                shed_depth=config.ADMISSION_SHED_DEPTH,
+                user_rate=config.ADMISSION_USER_RATE,
+                user_burst=config.ADMISSION_USER_BURST
+            )
+            if config.ADMISSION_WORKERS > 0 else None
         )
         
+        # Notas de voz: pool de transcripción local (requiere faster-whisper)
+        transcriber = None
+        if config.SPEECH_WORKERS > 0:
+            if speech_available():
+                transcriber = Transcriber(
+                    model_size=config.SPEECH_MODEL,
+                    workers=config.SPEECH_WORKERS,
+                    max_queue=config.SPEECH_QUEUE_SIZE,
+                    max_duration=config.SPEECH_MAX_DURATION,
+                    language=config.SPEECH_LANGUAGE,
+                    cpu_threads=config.SPEECH_CPU_THREADS or default_cpu_threads(config.SPEECH_WORKERS)
+                )
+            else:
+                logger.warning("faster-whisper no está instalado: las notas de voz no se procesarán")
+        
         # Crear y ejecutar bot
-        bot = TelegramBot(TELEGRAM_BOT_TOKEN, conversation_manager)
+        bot = TelegramBot(config.TELEGRAM_BOT_TOKEN, conversation_manager, admission, transcriber)
         bot.run()
         
     except Exception as e:
-        logger.error(f"Error iniciando la aplicación: {e}")
+        logger.error("Error iniciando la aplicación: %s", e)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,358 @@
+"""
+Backfill histórico de propiedades de HubSpot (giro_empresa, caracteristicas_maquina, tipo_cliente)
+
+Recorre transcripciones guardadas (JSONL o el journal de leads) en streaming y vuelve a extraer
+los campos: las reglas (regex/palabras clave) se ejecutan en un pool de procesos y lo que las
+reglas no resuelven (el giro de la empresa) se pide al LLM con concurrencia limitada. Los
+resultados se envían con el endpoint batch de HubSpot (100 contactos por llamada) respetando
+su límite de tasa, y el avance se guarda en un checkpoint para poder reanudar.
+
+Uso:
+    python backfill.py --transcripts data/transcripts.jsonl --checkpoint data/backfill.json
+    python backfill.py --journal data/journal --dry-run
+
+Cada línea del JSONL es una conversación:
+    {"telegram_id": "...", "hubspot_contact_id": "...", "lead": {...}, "history": [{"role": ..., "content": ...}]}
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from llm import normalize_extracted_value
+from models import Lead, characteristic_description, equipment_question_count, get_equipment_family
+
+logger = logging.getLogger(__name__)
+
+# Campos del Lead que se rellenan y propiedades de HubSpot correspondientes
+BACKFILL_FIELDS = ('company_business', 'machine_characteristics', 'is_distributor')
+BACKFILL_PROPERTIES = ('giro_empresa', 'caracteristicas_maquina', 'tipo_cliente')
+
+BUSINESS_RE = re.compile(
+    r"(?:giro(?:\s+de\s+(?:la|mi)\s+empresa)?(?:\s+es)?|nos\s+dedicamos\s+a|se\s+dedica\s+a|"
+    r"somos\s+una\s+empresa\s+de)\s*:?\s*(?:la\s+|el\s+)?([^,.;\n]{3,60})",
+    re.IGNORECASE
+)
+DISTRIBUTOR_RE = re.compile(r"\b(distribuidor|distribuimos|distribuir|revend|reventa|para\s+rentar|rentamos)",
+                            re.IGNORECASE)
+END_USER_RE = re.compile(r"\b(uso\s+propio|uso\s+de\s+la\s+empresa|uso\s+interno|cliente\s+final|"
+                         r"para\s+(?:la|mi|nuestra)\s+empresa|para\s+nosotros)", re.IGNORECASE)
+# Mensajes del bot que piden los datos de cotización (de ahí sale el texto que se manda al LLM)
+QUOTATION_PROMPT_RE = re.compile(r"giro|empresa|correo|tel[eé]fono", re.IGNORECASE)
+LLM_TEXT_MAX_CHARS = 1500
+
+
+def normalize_record(record: Dict) -> Tuple[str, Optional[str], Dict, List[Dict]]:
+    """Reduce una conversación a (telegram_id, contact_id, lead, history)"""
+    lead = record.get('lead') or {}
+    contact_id = record.get('hubspot_contact_id') or lead.get('hubspot_contact_id')
+    history = record.get('history') or record.get('messages') or []
+    return str(record.get('telegram_id') or lead.get('telegram_id')), contact_id, lead, history
+
+
+def _user_messages(history: List[Dict]) -> List[str]:
+    return [message['content'] for message in history if message.get('role') == 'user']
+
+
+def _rule_characteristics(lead: Dict, history: List[Dict]) -> Optional[List[str]]:
+    """Reconstruye las respuestas a las preguntas del equipo: son los mensajes del usuario que
+    siguen al mensaje en el que indicó el equipo de interés"""
+    equipment = (lead.get('equipment_interest') or '').strip()
+    if not equipment:
+        return None
+    family = get_equipment_family(equipment)
+    user_messages = _user_messages(history)
+    equipment_index = None
+    for index, content in enumerate(user_messages):
+        lowered = content.lower()
+        if equipment.lower() in lowered or (family != 'otro' and get_equipment_family(lowered) == family):
+            equipment_index = index
+    if equipment_index is None:
+        return None
+    answers = user_messages[equipment_index + 1:equipment_index + 1 + equipment_question_count(equipment)]
+    return [characteristic_description(equipment, answer, index) for index, answer in enumerate(answers)] or None
+
+
+def _rule_distributor(history: List[Dict]) -> Optional[bool]:
+    """Tipo de cliente según la última mención explícita del usuario"""
+    for content in reversed(_user_messages(history)):
+        if DISTRIBUTOR_RE.search(content):
+            return True
+        if END_USER_RE.search(content):
+            return False
+    return None
+
+
+def _llm_text(history: List[Dict]) -> str:
+    """Texto para extraer el giro con el LLM: las respuestas a las preguntas de cotización"""
+    texts = []
+    for previous, message in zip(history, history[1:]):
+        if (message.get('role') == 'user' and previous.get('role') == 'assistant'
+                and QUOTATION_PROMPT_RE.search(previous['content'])):
+            texts.append(message['content'])
+    if not texts:
+        texts = _user_messages(history)[-3:]
+    return "\n".join(texts)[-LLM_TEXT_MAX_CHARS:]
+
+
+def extract_rule_fields(record: Union[str, Dict]) -> Optional[Dict]:
+    """Extrae con reglas los campos del backfill; los valores ya presentes en el lead tienen prioridad.
+
+    `record` es la conversación o su línea JSON sin parsear (el parseo también se hace en el pool).
+    Devuelve {'telegram_id', 'contact_id', 'fields', 'llm_text'}, donde `llm_text` solo se incluye
+    si el giro necesita el LLM, o None si la línea es inválida.
+    """
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError:
+            return None
+    telegram_id, contact_id, lead, history = normalize_record(record)
+    fields = {}
+    characteristics = lead.get('machine_characteristics') or _rule_characteristics(lead, history)
+    if characteristics:
+        fields['machine_characteristics'] = characteristics
+    is_distributor = lead.get('is_distributor')
+    if is_distributor is None:
+        is_distributor = _rule_distributor(history)
+    if is_distributor is not None:
+        fields['is_distributor'] = is_distributor
+    business = lead.get('company_business')
+    if not business:
+        for content in reversed(_user_messages(history)):
+            match = BUSINESS_RE.search(content)
+            if match:
+                business = match.group(1).strip()
+                break
+    if business:
+        fields['company_business'] = business
+    llm_text = None if business or not history else _llm_text(history)
+    return {'telegram_id': telegram_id, 'contact_id': contact_id, 'fields': fields, 'llm_text': llm_text}
+
+
+def extract_rule_fields_batch(records: List[Union[str, Dict]]) -> List[Optional[Dict]]:
+    """Procesa un bloque de conversaciones en un solo envío al pool (menos serialización)"""
+    return [extract_rule_fields(record) for record in records]
+
+
+def iter_transcripts(path: str) -> Iterator[str]:
+    """Lee un JSONL de transcripciones en streaming; las líneas se parsean en el pool"""
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield line
+
+
+def iter_journal_transcripts(directory: str) -> Iterator[Dict]:
+    """Conversaciones del journal de leads (último estado conocido), en orden estable por telegram_id"""
+    from journal import LeadJournal
+    conversations = LeadJournal(directory).replay()
+    for telegram_id in sorted(conversations):
+        entry = conversations[telegram_id]
+        yield {'telegram_id': telegram_id, 'lead': entry['lead'], 'history': entry['history']}
+
+
+class Checkpoint:
+    """Posición de la última conversación procesada por completo, escrita de forma atómica"""
+
+    def __init__(self, path: Optional[str], source: str):
+        self.path = path
+        self.source = source
+        self.position = 0
+        self.stats: Counter = Counter()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('source') != self.source:
+            raise ValueError(f"El checkpoint {self.path} corresponde a otra fuente: {data.get('source')}")
+        self.position = data['position']
+        self.stats = Counter(data.get('stats', {}))
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'source': self.source, 'position': self.position, 'stats': dict(self.stats),
+                       'updated_at': time.time()}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+
+class Backfill:
+    """Orquesta el pool de reglas, las llamadas al LLM y las actualizaciones batch a HubSpot"""
+
+    def __init__(self, hubspot_manager, llm_manager=None, *, workers: Optional[int] = None,
+                 window_size: int = 2000, llm_concurrency: int = 8, llm_rate: Optional[float] = None,
+                 crm_rate: float = 9.0, dry_run: bool = False, failed_path: Optional[str] = None):
+        from hubspot import BATCH_LIMIT
+        from ratelimit import TokenBucket
+        self.hubspot = hubspot_manager
+        self.llm = llm_manager
+        self.workers = workers or os.cpu_count() or 1
+        self.window_size = window_size
+        self.batch_size = BATCH_LIMIT
+        self.llm_semaphore = asyncio.Semaphore(llm_concurrency)
+        self.llm_bucket = TokenBucket(llm_rate) if llm_rate else None
+        # HubSpot (apps privadas): 100 llamadas cada 10 s; se deja margen
+        self.crm_bucket = TokenBucket(crm_rate, capacity=crm_rate)
+        self.dry_run = dry_run
+        self.failed_path = failed_path
+
+    def _windows(self, records: Iterator[Union[str, Dict]]) -> Iterator[List[Union[str, Dict]]]:
+        while True:
+            window = list(islice(records, self.window_size))
+            if not window:
+                return
+            yield window
+
+    def _submit_rules(self, executor: ProcessPoolExecutor, window: List[Union[str, Dict]]) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        chunk = max(1, -(-len(window) // (self.workers * 4)))
+        return asyncio.gather(*[
+            loop.run_in_executor(executor, extract_rule_fields_batch, window[start:start + chunk])
+            for start in range(0, len(window), chunk)
+        ])
+
+    async def _extract_business(self, result: Dict, stats: Counter):
+        """Extrae el giro con el LLM para las conversaciones donde las reglas no lo encontraron"""
+        async with self.llm_semaphore:
+            if self.llm_bucket:
+                await self.llm_bucket.acquire()
+            value = normalize_extracted_value(
+                await self.llm.extract_field(result['llm_text'], "company_business")
+            )
+        stats['llm_calls'] += 1
+        if value:
+            result['fields']['company_business'] = value
+            stats['llm_business'] += 1
+
+    async def _push(self, leads: List[Lead], stats: Counter):
+        await self.crm_bucket.acquire()
+        result = await self.hubspot.batch_update_contacts(leads, BACKFILL_FIELDS)
+        stats['crm_batches'] += 1
+        stats['updated'] += len(result.updated)
+        if result.failed:
+            stats['failed'] += len(result.failed)
+            self._record_failed(result.failed)
+
+    def _record_failed(self, leads: List[Lead]):
+        """Guarda los leads que HubSpot no actualizó para reintentarlos con --transcripts"""
+        if not self.failed_path:
+            return
+        with open(self.failed_path, 'a', encoding='utf-8') as f:
+            for lead in leads:
+                f.write(json.dumps({'telegram_id': lead.telegram_id, 'lead': lead.to_dict()},
+                                   ensure_ascii=False) + "\n")
+
+    async def _complete_window(self, results: List[Dict], stats: Counter):
+        if self.llm is not None:
+            await asyncio.gather(*[
+                self._extract_business(result, stats) for result in results if result['llm_text']
+            ])
+        leads = []
+        for result in results:
+            stats['processed'] += 1
+            if not result['fields']:
+                stats['no_data'] += 1
+            elif not result['contact_id']:
+                stats['no_contact'] += 1
+            else:
+                leads.append(Lead(result['telegram_id'], hubspot_contact_id=result['contact_id'],
+                                  **result['fields']))
+        if self.dry_run:
+            stats['would_update'] += len(leads)
+            return
+        await asyncio.gather(*[
+            self._push(leads[start:start + self.batch_size], stats)
+            for start in range(0, len(leads), self.batch_size)
+        ])
+
+    async def run(self, records: Iterator[Union[str, Dict]], checkpoint: Checkpoint, limit: Optional[int] = None) -> Counter:
+        """Procesa las conversaciones a partir del checkpoint; las reglas de la ventana siguiente
+        se calculan en el pool mientras la ventana actual espera al LLM y a HubSpot"""
+        records = islice(records, checkpoint.position, None if limit is None else checkpoint.position + limit)
+        windows = self._windows(records)
+        start_position = checkpoint.position
+        started = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            window = next(windows, None)
+            pending = self._submit_rules(executor, window) if window else None
+            while pending is not None:
+                results = [result for chunk in await pending for result in chunk]
+                window = next(windows, None)
+                pending = self._submit_rules(executor, window) if window else None
+                valid = [result for result in results if result is not None]
+                checkpoint.stats['invalid'] += len(results) - len(valid)
+                await self._complete_window(valid, checkpoint.stats)
+                checkpoint.position += len(results)
+                checkpoint.save()
+                elapsed = time.perf_counter() - started
+                logger.info("Backfill: %s conversaciones (%.0f/s), %s contactos actualizados",
+                            checkpoint.position, (checkpoint.position - start_position) / max(elapsed, 1e-9),
+                            checkpoint.stats['updated'])
+        return checkpoint.stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill de propiedades nuevas de HubSpot desde transcripciones")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--transcripts", help="JSONL con una conversación por línea")
+    source.add_argument("--journal", help="Directorio del journal de leads")
+    parser.add_argument("--checkpoint", help="Archivo de checkpoint para reanudar (por defecto <fuente>.backfill.json)")
+    parser.add_argument("--restart", action="store_true", help="Ignora el checkpoint existente")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos para la extracción por reglas")
+    parser.add_argument("--window", type=int, default=2000, help="Conversaciones por ventana de checkpoint")
+    parser.add_argument("--llm-concurrency", type=int, default=8)
+    parser.add_argument("--llm-rps", type=float, default=None, help="Límite de llamadas por segundo al LLM")
+    parser.add_argument("--no-llm", action="store_true", help="Solo reglas, sin completar el giro con el LLM")
+    parser.add_argument("--crm-rps", type=float, default=9.0,
+                        help="Llamadas batch por segundo a HubSpot (límite de apps privadas: 10/s)")
+    parser.add_argument("--properties", default=",".join(BACKFILL_PROPERTIES),
+                        help="Propiedades opcionales ya creadas en HubSpot")
+    parser.add_argument("--limit", type=int, default=None, help="Procesa como máximo N conversaciones")
+    parser.add_argument("--dry-run", action="store_true", help="Extrae pero no escribe en HubSpot")
+    args = parser.parse_args(argv)
+
+    import config
+    config.load_environment()
+    from hubspot import HubSpotManager
+
+    source_path = os.path.abspath(args.transcripts or args.journal)
+    checkpoint_path = args.checkpoint or f"{source_path.rstrip(os.sep)}.backfill.json"
+    # En dry-run no se guarda el avance para no saltar conversaciones en la ejecución real
+    checkpoint = Checkpoint(None if args.dry_run else checkpoint_path, source_path)
+    if not args.restart:
+        checkpoint.load()
+    if checkpoint.position:
+        logger.info("Reanudando backfill desde la conversación %s", checkpoint.position)
+
+    hubspot_manager = HubSpotManager(config.HUBSPOT_ACCESS_TOKEN,
+                                     optional_properties=[p.strip() for p in args.properties.split(",")])
+    llm_manager = None
+    if not args.no_llm:
+        from llm import LLMManager
+        llm_manager = LLMManager(config.GROQ_API_KEY)
+
+    records = iter_transcripts(args.transcripts) if args.transcripts else iter_journal_transcripts(args.journal)
+    backfill = Backfill(hubspot_manager, llm_manager, workers=args.workers, window_size=args.window,
+                        llm_concurrency=args.llm_concurrency, llm_rate=args.llm_rps, crm_rate=args.crm_rps,
+                        dry_run=args.dry_run, failed_path=f"{checkpoint_path}.failed.jsonl")
+    stats = asyncio.run(backfill.run(records, checkpoint, limit=args.limit))
+    print(json.dumps(dict(stats), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,3 @@
+"""
+Benchmarks y arneses de reproducción offline del chatbot
+"""
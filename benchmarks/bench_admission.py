@@ -0,0 +1,149 @@
+"""
+Benchmark del control de admisión ante un pico de tráfico
+
+Genera llegadas Poisson de usuarios en distintos estados (más unos pocos usuarios que envían
+ráfagas de mensajes) contra un LLM simulado con capacidad limitada (`--llm-slots`), y compara
+la latencia por clase de prioridad y los turnos descartados con y sin control de admisión.
+
+Uso:
+    python -m benchmarks.bench_admission --rate 60 --duration 20 --llm-slots 16
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+from admission import AdmissionController, PRIORITY_NAMES, STATE_PRIORITY, ADMISSION_SHED
+from benchmarks.common import summarize, write_results
+from benchmarks.stubs import build_stub_stack, current_lead
+from logging_config import setup_logging
+from models import ConversationState
+from telegram_bot import TelegramBot
+
+# Estado inicial -> (proporción de usuarios, mensaje que envían en ese estado)
+STATE_MIX = {
+    ConversationState.WAITING_QUOTATION_DATA: (0.2, "Soy Ana López, mi empresa es Aceros, giro construcción, "
+                                                    "correo ana@aceros.mx, teléfono 55 1234 5678"),
+    ConversationState.WAITING_EQUIPMENT: (0.3, "Busco un generador"),
+    ConversationState.INITIAL: (0.5, "Hola, quiero información sobre maquinaria"),
+}
+SPAM_MESSAGE = "hola?? hay alguien"
+
+
+def _limit_llm(fake_groq, slots: int):
+    """Limita las llamadas simultáneas al LLM simulado (como la cuota del proveedor)"""
+    semaphore = asyncio.Semaphore(slots)
+    complete = fake_groq.complete
+
+    async def _limited(messages):
+        async with semaphore:
+            return await complete(messages)
+
+    fake_groq.complete = _limited
+
+
+def _prepare_user(conversation_manager, telegram_id: str, state: ConversationState):
+    conv = conversation_manager.get_conversation(telegram_id)
+    conv['state'] = state
+    if state == ConversationState.WAITING_QUOTATION_DATA:
+        lead = conv['lead']
+        lead.name, lead.equipment_interest, lead.is_distributor = "Ana López", "generador", False
+
+
+async def run_mode(use_admission: bool, args) -> Dict:
+    conversation_manager, fake_groq, _ = build_stub_stack(args.llm_latency, args.crm_latency, args.seed)
+    _limit_llm(fake_groq, args.llm_slots)
+    admission = AdmissionController(workers=args.workers, max_queue=args.queue_size,
+                                    user_rate=args.user_rate, user_burst=args.user_burst) if use_admission else None
+    bot = TelegramBot("123456:bench", conversation_manager, admission)
+    if admission:
+        await admission.start()
+
+    rng = random.Random(args.seed)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    outcomes: Counter = Counter()
+    shed_before = {key: value for key, value in ADMISSION_SHED.values.items()}
+
+    async def _turn(telegram_id: str, message: str, priority_name: str):
+        current_lead.set(telegram_id)
+        start = time.perf_counter()
+        await bot._process(telegram_id, message)
+        latencies[priority_name].append(time.perf_counter() - start)
+        outcomes[priority_name] += 1
+
+    tasks = []
+    states, weights = zip(*[(state, mix[0]) for state, mix in STATE_MIX.items()])
+    started = time.perf_counter()
+    user_index = 0
+    next_spam = 0.0
+    while (elapsed := time.perf_counter() - started) < args.duration:
+        state = rng.choices(states, weights)[0]
+        telegram_id = f"user-{user_index}"
+        user_index += 1
+        _prepare_user(conversation_manager, telegram_id, state)
+        priority_name = PRIORITY_NAMES[STATE_PRIORITY[state]]
+        tasks.append(asyncio.create_task(_turn(telegram_id, STATE_MIX[state][1], priority_name)))
+        if elapsed >= next_spam:
+            # Usuarios que envían ráfagas de mensajes seguidos
+            for spammer in range(args.spammers):
+                tasks.append(asyncio.create_task(_turn(f"spam-{spammer}", SPAM_MESSAGE, "spam")))
+            next_spam = elapsed + 0.1
+        await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - started
+    if admission:
+        await admission.stop()
+
+    shed = Counter()
+    for key, value in ADMISSION_SHED.values.items():
+        delta = value - shed_before.get(key, 0)
+        if delta:
+            shed[" ".join(key)] += int(delta)
+    return {
+        "admission": use_admission,
+        "turns": sum(outcomes.values()),
+        "wall_s": round(wall, 2),
+        "llm_calls": sum(fake_groq.calls_by_kind.values()),
+        "latency_ms_by_priority": {name: summarize(values) for name, values in sorted(latencies.items())},
+        "shed": dict(shed)
+    }
+
+
+async def main_async(args) -> Dict:
+    setup_logging(level="WARNING", mode="sync")
+    results = {}
+    for use_admission in (False, True):
+        result = await run_mode(use_admission, args)
+        results["admission" if use_admission else "baseline"] = result
+        print(f"admisión={str(use_admission):>5} turnos={result['turns']} llamadas LLM={result['llm_calls']} "
+              f"descartados={result['shed']}")
+        for name, summary in result["latency_ms_by_priority"].items():
+            print(f"    {name:>7}: p50={summary['p50']:>8.1f}ms p99={summary['p99']:>8.1f}ms")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=60.0, help="Usuarios nuevos por segundo")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--spammers", type=int, default=3)
+    parser.add_argument("--llm-slots", type=int, default=16)
+    parser.add_argument("--llm-latency", default="lognormal:0.35:0.4")
+    parser.add_argument("--crm-latency", default="lognormal:0.15:0.3")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--queue-size", type=int, default=100)
+    parser.add_argument("--user-rate", type=float, default=0.5)
+    parser.add_argument("--user-burst", type=float, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+    results = asyncio.run(main_async(args))
+    path = write_results("admission", results, args.output)
+    print(f"Resultados escritos en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark de la exportación a Parquet y de la consulta de embudo
+
+1. Throughput del exportador: conversaciones terminadas -> record() -> flush() a Parquet.
+2. Consulta de embudo sobre un dataset sintético de millones de filas particionado por fecha.
+
+Uso:
+    python -m benchmarks.bench_analytics --export-rows 200000 --query-rows 5000000
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from analytics import COLUMNS, FUNNEL_COLUMNS, ConversationExporter, funnel_metrics, load_conversations
+from benchmarks.common import write_results
+from models import STATE_ORDER, ConversationState, Lead
+
+FAMILIES = ['soldadora', 'compresor', 'torre_iluminacion', 'lgmg', 'generador', 'rompedor', 'otro', 'desconocido']
+
+
+async def bench_export(rows: int, batch_size: int) -> dict:
+    directory = tempfile.mkdtemp(prefix="bench-analytics-export-")
+    exporter = ConversationExporter(directory, batch_size=batch_size)
+    created_at = datetime.now().isoformat()
+    start = time.perf_counter()
+    for index in range(rows):
+        lead = Lead(telegram_id=str(index), name="Ana", equipment_interest="generador",
+                    is_distributor=index % 3 == 0, email="a@b.com", created_at=created_at)
+        conv = {'lead': lead, 'state': STATE_ORDER[index % len(STATE_ORDER)], 'turns': 8}
+        exporter.record(conv, "completed" if conv['state'] == ConversationState.COMPLETED else "abandoned")
+        if index % batch_size == 0:
+            await asyncio.sleep(0)
+    await exporter.flush()
+    if exporter._flush_task is not None:
+        await exporter._flush_task
+    wall = time.perf_counter() - start
+    shutil.rmtree(directory)
+    return {"rows": rows, "batch_size": batch_size, "seconds": round(wall, 3),
+            "rows_per_s": round(rows / wall, 1), "exported": exporter.exported}
+
+
+def build_dataset(directory: str, rows: int, days: int, seed: int) -> float:
+    """Genera un dataset sintético vectorizado con la misma estructura que el exportador"""
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    state_index = rng.choice(len(STATE_ORDER), size=rows, p=[0.05, 0.15, 0.1, 0.1, 0.1, 0.1, 0.4])
+    ended = datetime(2025, 1, 1) + pd.to_timedelta(rng.integers(0, days * 86400, size=rows), unit='s')
+    telegram_ids = rng.integers(10**8, 10**10, size=rows).astype(str)
+    frame = pd.DataFrame({
+        'conversation_id': np.char.add(np.char.add(telegram_ids, ':'), np.arange(rows).astype(str)),
+        'telegram_id': telegram_ids,
+        'ended_reason': np.where(state_index == len(STATE_ORDER) - 1, 'completed', 'abandoned'),
+        'final_state': np.array([state.value for state in STATE_ORDER])[state_index],
+        'state_index': state_index,
+        'completed': state_index == len(STATE_ORDER) - 1,
+        'equipment_interest': None,
+        'equipment_family': np.array(FAMILIES)[rng.integers(0, len(FAMILIES), size=rows)],
+        'is_distributor': pd.array(np.where(state_index >= 5, rng.random(rows) < 0.3, None), dtype='boolean'),
+        'has_company': rng.random(rows) < 0.6,
+        'has_email': rng.random(rows) < 0.7,
+        'has_phone': rng.random(rows) < 0.7,
+        'turns': rng.integers(1, 20, size=rows),
+        'started_at': ended - timedelta(minutes=10),
+        'ended_at': ended,
+        'duration_s': 600.0,
+        'date': ended.strftime('%Y-%m-%d')
+    }, columns=COLUMNS)
+    for date, partition in frame.groupby('date'):
+        partition_dir = os.path.join(directory, f"date={date}")
+        os.makedirs(partition_dir, exist_ok=True)
+        partition.drop(columns=['date']).to_parquet(os.path.join(partition_dir, "part-0.parquet"), index=False)
+    return time.perf_counter() - start
+
+
+def bench_query(rows: int, days: int, seed: int) -> dict:
+    directory = tempfile.mkdtemp(prefix="bench-analytics-query-")
+    build_s = build_dataset(directory, rows, days, seed)
+
+    start = time.perf_counter()
+    frame = load_conversations(directory, columns=FUNNEL_COLUMNS)
+    load_s = time.perf_counter() - start
+    start = time.perf_counter()
+    metrics = funnel_metrics(frame)
+    compute_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    week = load_conversations(directory, since="2025-01-01", until="2025-01-07", columns=FUNNEL_COLUMNS)
+    funnel_metrics(week)
+    filtered_s = time.perf_counter() - start
+    shutil.rmtree(directory)
+    return {
+        "rows": rows, "days": days, "build_s": round(build_s, 3),
+        "load_s": round(load_s, 3), "funnel_s": round(compute_s, 3),
+        "total_query_s": round(load_s + compute_s, 3),
+        "one_week_query_s": round(filtered_s, 3), "one_week_rows": len(week),
+        "completion_rate": metrics["completion_rate"]
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--export-rows", type=int, default=200_000)
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--query-rows", type=int, default=5_000_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    results = {
+        "export": asyncio.run(bench_export(args.export_rows, args.batch_size)),
+        "query": bench_query(args.query_rows, args.days, args.seed)
+    }
+    print(f"exportación: {results['export']}")
+    print(f"consulta: {results['query']}")
+    path = write_results("analytics", results, args.output)
+    print(f"Resultados escritos en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Benchmark del backfill de HubSpot: throughput de las reglas por número de procesos y corrida
+completa (LLM + batch al CRM con límite de tasa) interrumpida y reanudada desde el checkpoint
+
+Uso:
+    python -m benchmarks.bench_backfill --conversations 50000 --workers 1,2,4 --full-conversations 5000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Dict
+
+from backfill import BACKFILL_PROPERTIES, Backfill, Checkpoint, iter_transcripts
+from benchmarks.common import LatencyModel, write_results
+from benchmarks.scenarios import build_dialog, assign_family, EQUIPMENT_FAMILIES
+from benchmarks.stubs import FakeGroqClient, StubHubSpotManager
+from llm import LLMManager
+
+
+def write_transcripts(path: str, conversations: int, seed: int = 7) -> None:
+    """Transcripciones sintéticas de leads antiguos: con equipo pero sin características ni tipo
+    de cliente guardados; el 40 % menciona el giro de forma que las reglas no lo detectan"""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for index in range(conversations):
+            family = assign_family(index)
+            turns = build_dialog(family, index, rng)
+            if rng.random() < 0.4:
+                turns[-2] = turns[-2].replace("giro ", "trabajamos en ")
+            history = []
+            for turn_index, turn in enumerate(turns):
+                if turn_index == len(turns) - 2:
+                    prompt = "¿Me compartes el nombre de tu empresa, giro, correo y teléfono?"
+                else:
+                    prompt = "Entendido, cuéntame un poco más."
+                history.append({"role": "assistant", "content": prompt})
+                history.append({"role": "user", "content": turn})
+            lead = {"telegram_id": str(index), "equipment_interest": EQUIPMENT_FAMILIES[family][0],
+                    "hubspot_contact_id": str(100000 + index)}
+            f.write(json.dumps({"telegram_id": str(index), "lead": lead, "history": history},
+                               ensure_ascii=False) + "\n")
+
+
+async def bench_rules(path: str, workers: int) -> Dict:
+    """Solo reglas (sin LLM ni CRM): conversaciones por segundo según el número de procesos"""
+    backfill = Backfill(StubHubSpotManager(LatencyModel("const:0"), BACKFILL_PROPERTIES), None,
+                        workers=workers, dry_run=True)
+    checkpoint = Checkpoint(None, path)
+    start = time.perf_counter()
+    stats = await backfill.run(iter_transcripts(path), checkpoint)
+    wall = time.perf_counter() - start
+    return {
+        "workers": workers,
+        "conversations": stats["processed"],
+        "conversations_per_s": round(stats["processed"] / wall, 1),
+        "with_data": stats["would_update"]
+    }
+
+
+async def bench_full(path: str, workers: int, llm_latency: str, crm_latency: str, crm_rate: float,
+                     llm_concurrency: int) -> Dict:
+    """Corrida completa interrumpida a la mitad y reanudada desde el checkpoint"""
+    directory = tempfile.mkdtemp(prefix="bench-backfill-")
+    checkpoint_path = os.path.join(directory, "checkpoint.json")
+    rng = random.Random(11)
+    fake_groq = FakeGroqClient(LatencyModel(llm_latency, rng))
+    llm_manager = LLMManager("bench-key")
+    llm_manager.client = fake_groq
+    hubspot_manager = StubHubSpotManager(LatencyModel(crm_latency, rng), BACKFILL_PROPERTIES)
+    total = sum(1 for _ in iter_transcripts(path))
+
+    start = time.perf_counter()
+    for limit in (total // 2, None):
+        checkpoint = Checkpoint(checkpoint_path, path)
+        checkpoint.load()
+        backfill = Backfill(hubspot_manager, llm_manager, workers=workers, window_size=1000,
+                            llm_concurrency=llm_concurrency, crm_rate=crm_rate)
+        stats = await backfill.run(iter_transcripts(path), checkpoint, limit=limit)
+    wall = time.perf_counter() - start
+    shutil.rmtree(directory)
+
+    filled = sum(1 for properties in hubspot_manager.contacts.values() if len(properties) == 3)
+    batches = hubspot_manager.calls_by_kind["batch_update"]
+    rate = stats["processed"] / wall
+    return {
+        "conversations": stats["processed"],
+        "wall_s": round(wall, 2),
+        "conversations_per_s": round(rate, 1),
+        "llm_calls": stats["llm_calls"],
+        "crm_batches": batches,
+        "contacts_updated": stats["updated"],
+        "contacts_with_all_properties": filled,
+        "duplicate_updates": stats["updated"] - len(hubspot_manager.contacts),
+        # Con el CRM como cuello de botella: 100 contactos por llamada a crm_rate llamadas/s
+        "estimated_500k_min": round(500_000 / min(rate, crm_rate * 100) / 60, 1)
+    }
+
+
+async def main_async(args) -> Dict:
+    directory = tempfile.mkdtemp(prefix="bench-backfill-data-")
+    try:
+        path = os.path.join(directory, "transcripts.jsonl")
+        write_transcripts(path, args.conversations)
+        results = {"rules": [], "full": None}
+        for workers in args.workers:
+            result = await bench_rules(path, workers)
+            results["rules"].append(result)
+            print(f"workers={workers:>3} {result['conversations_per_s']:>10} conversaciones/s (solo reglas)")
+
+        full_path = os.path.join(directory, "full.jsonl")
+        write_transcripts(full_path, args.full_conversations)
+        results["full"] = await bench_full(full_path, max(args.workers), args.llm_latency, args.crm_latency,
+                                           args.crm_rps, args.llm_concurrency)
+        print(f"corrida completa con reanudación: {results['full']}")
+        return results
+    finally:
+        shutil.rmtree(directory)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=50_000)
+    parser.add_argument("--workers", type=lambda v: [int(x) for x in v.split(",")], default=[1, 2, 4])
+    parser.add_argument("--full-conversations", type=int, default=5000)
+    parser.add_argument("--llm-latency", default="lognormal:0.35:0.5")
+    parser.add_argument("--crm-latency", default="uniform:0.15:0.4")
+    parser.add_argument("--crm-rps", type=float, default=9.0)
+    parser.add_argument("--llm-concurrency", type=int, default=32)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+    results = asyncio.run(main_async(args))
+    path = write_results("backfill", results, args.output)
+    print(f"Resultados escritos en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark del micro-batching de extract_field entre usuarios
+
+Lanza llamadas a `extract_field` con llegadas Poisson y tipos de campo mezclados contra el LLM
+simulado y compara, por ventana de batching, las solicitudes por segundo al proveedor, la
+latencia por llamada, el tamaño medio de batch y que los valores coincidan con la extracción
+individual (también con respuestas de batch malformadas para ejercitar el fallback).
+
+Uso:
+    python -m benchmarks.bench_batching --rate 300 --duration 10 --windows 0,2,5,10
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List
+
+from batching import ExtractionBatcher, BATCH_FALLBACKS
+from benchmarks.common import summarize, write_results
+from benchmarks.scenarios import build_dialog, assign_family
+from benchmarks.stubs import build_stub_stack, rule_based_extract
+from logging_config import setup_logging
+
+FIELD_MESSAGES = {
+    "name": lambda turns: turns[-4 if "Me llamo" not in turns[1] else 1],
+    "equipment": lambda turns: next(turn for turn in turns if turn.startswith("Busco")),
+    "is_distributor": lambda turns: turns[-3],
+    "email": lambda turns: turns[-2],
+}
+# Tiempo extra por cada mensaje adicional del batch (más tokens de salida)
+PER_ITEM_LATENCY = 0.008
+
+
+def _expected(field_type: str, message: str) -> str:
+    value = rule_based_extract(field_type, message)
+    return "" if value is None else str(value).strip()
+
+
+async def run_window(window_ms: float, args, batch_error_rate: float = 0.0) -> Dict:
+    conversation_manager, fake_groq, _ = build_stub_stack(args.llm_latency, "0", args.seed)
+    llm_manager = conversation_manager.llm
+    if window_ms > 0:
+        llm_manager.batcher = ExtractionBatcher(llm_manager, window_ms / 1000, args.max_batch)
+    fake_groq.batch_error_rate = batch_error_rate
+    complete = fake_groq.complete
+
+    async def _complete(messages):
+        content = messages[0]["content"]
+        if "Mensajes: " in content:
+            items = len(json.loads(content.split("Mensajes: ", 1)[1]))
+            await asyncio.sleep(PER_ITEM_LATENCY * (items - 1))
+        return await complete(messages)
+
+    fake_groq.complete = _complete
+    fallbacks_before = sum(BATCH_FALLBACKS.values.values())
+
+    rng = random.Random(args.seed)
+    latencies: List[float] = []
+    mismatches = 0
+
+    async def _call(field_type: str, message: str):
+        nonlocal mismatches
+        start = time.perf_counter()
+        value = await llm_manager.extract_field(message, field_type)
+        latencies.append(time.perf_counter() - start)
+        if value != _expected(field_type, message):
+            mismatches += 1
+
+    tasks = []
+    started = time.perf_counter()
+    index = 0
+    while time.perf_counter() - started < args.duration:
+        turns = build_dialog(assign_family(index), index, rng)
+        field_type = rng.choice(list(FIELD_MESSAGES))
+        tasks.append(asyncio.create_task(_call(field_type, FIELD_MESSAGES[field_type](turns))))
+        index += 1
+        await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - started
+
+    provider_calls = sum(fake_groq.calls_by_kind.values())
+    return {
+        "window_ms": window_ms,
+        "batch_error_rate": batch_error_rate,
+        "calls": len(latencies),
+        "provider_requests": provider_calls,
+        "provider_rps": round(provider_calls / wall, 1),
+        "items_per_request": round(len(latencies) / max(provider_calls, 1), 2),
+        "latency_ms": summarize(latencies),
+        "mismatches": mismatches,
+        "fallbacks": int(sum(BATCH_FALLBACKS.values.values()) - fallbacks_before)
+    }
+
+
+async def main_async(args) -> Dict:
+    setup_logging(level="ERROR", mode="sync")
+    results = {"windows": [], "malformed": None}
+    baseline = None
+    for window_ms in args.windows:
+        result = await run_window(window_ms, args)
+        baseline = baseline or result
+        results["windows"].append(result)
+        added = result["latency_ms"]["p50"] - baseline["latency_ms"]["p50"]
+        print(f"ventana={window_ms:>5}ms {result['provider_rps']:>7} req/s al proveedor "
+              f"({result['items_per_request']} extracciones/req) p50={result['latency_ms']['p50']:.1f}ms "
+              f"(+{added:.1f}ms) p99={result['latency_ms']['p99']:.1f}ms discrepancias={result['mismatches']}")
+    window_ms = max(args.windows)
+    results["malformed"] = await run_window(window_ms, args, batch_error_rate=args.batch_error_rate)
+    print(f"con {args.batch_error_rate:.0%} de batches malformados: {results['malformed']}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=300.0, help="Llamadas a extract_field por segundo")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--windows", type=lambda v: [float(x) for x in v.split(",")], default=[0, 2, 5, 10])
+    parser.add_argument("--max-batch", type=int, default=20)
+    parser.add_argument("--batch-error-rate", type=float, default=0.1)
+    parser.add_argument("--llm-latency", default="lognormal:0.3:0.3")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+    results = asyncio.run(main_async(args))
+    path = write_results("batching", results, args.output)
+    print(f"Resultados escritos en {path}")
+
+
+if __name__ == "__main__":
+    main()
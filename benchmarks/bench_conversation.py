@@ -0,0 +1,198 @@
+"""
+Benchmark de latencia de extremo a extremo de ConversationManager.process_message
+
+Reproduce diálogos guionizados (todas las familias de equipo y todos los estados) contra
+stand-ins locales de Groq y HubSpot y reporta latencia por turno (p50/p95/p99), llamadas
+al LLM y al CRM por lead y throughput por nivel de concurrencia.
+
+Uso:
+    python -m benchmarks.bench_conversation --concurrency 1,10,100,1000 \
+        --llm-latency lognormal:0.35:0.4 --crm-latency lognormal:0.15:0.3
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+from benchmarks.common import summarize, write_results
+from benchmarks.scenarios import EQUIPMENT_FAMILIES, assign_family, build_dialog
+from benchmarks.stubs import build_stub_stack, current_lead
+from logging_config import setup_logging
+from models import ConversationState
+from replies import ReplyPlanner
+from speculation import ReplySpeculator
+
+
+async def _run_user(conversation_manager, user_index: int, rng: random.Random,
+                    samples: Dict[str, List[float]], states_seen: set, completed: List[str]):
+    """Ejecuta el diálogo completo de un usuario simulado"""
+    telegram_id = f"bench-{user_index}"
+    current_lead.set(telegram_id)
+    family = assign_family(user_index)
+    for message in build_dialog(family, user_index, rng):
+        state = conversation_manager.get_conversation(telegram_id)['state']
+        states_seen.add(state)
+        start = time.perf_counter()
+        await conversation_manager.process_message(telegram_id, message)
+        elapsed = time.perf_counter() - start
+        samples['all'].append(elapsed)
+        samples[state.value].append(elapsed)
+    if conversation_manager.get_conversation(telegram_id)['state'] == ConversationState.COMPLETED:
+        completed.append(family)
+
+
+async def run_level(concurrency: int, leads: int, args) -> Dict:
+    """Ejecuta `leads` usuarios con `concurrency` conversaciones simultáneas"""
+    conversation_manager, fake_groq, stub_hubspot = build_stub_stack(
+        args.llm_latency, args.crm_latency, args.seed
+    )
+    conversation_manager.reply_planner = None if args.no_reply_templates else ReplyPlanner()
+    speculator = ReplySpeculator(conversation_manager.llm, args.waste_token_budget) if args.speculative else None
+    conversation_manager.speculator = speculator
+    rng = random.Random(args.seed)
+    samples: Dict[str, List[float]] = defaultdict(list)
+    states_seen: set = set()
+    completed: List[str] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _bounded(user_index: int):
+        async with semaphore:
+            await _run_user(conversation_manager, user_index, rng, samples, states_seen, completed)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[asyncio.create_task(_bounded(i)) for i in range(leads)])
+    wall = time.perf_counter() - start
+
+    lead_ids = [f"bench-{i}" for i in range(leads)]
+    llm_per_lead = [float(fake_groq.calls_by_lead[lead_id]) for lead_id in lead_ids]
+    crm_per_lead = [float(stub_hubspot.calls_by_lead[lead_id]) for lead_id in lead_ids]
+    crm_avoided_per_lead = [
+        float(conversation_manager.conversations[lead_id]['lead'].avoided_syncs) for lead_id in lead_ids
+    ]
+
+    return {
+        "concurrency": concurrency,
+        "leads": leads,
+        "turns": len(samples['all']),
+        "wall_seconds": round(wall, 3),
+        "throughput_turns_per_s": round(len(samples['all']) / wall, 2),
+        "throughput_leads_per_s": round(leads / wall, 2),
+        "completed_leads": len(completed),
+        "turn_latency_ms": summarize(samples['all']),
+        "turn_latency_ms_by_state": {
+            state: summarize(values) for state, values in samples.items() if state != 'all'
+        },
+        "llm_calls_per_lead": summarize(llm_per_lead, scale=1.0),
+        "crm_calls_per_lead": summarize(crm_per_lead, scale=1.0),
+        "crm_avoided_calls_per_lead": summarize(crm_avoided_per_lead, scale=1.0),
+        "llm_calls_by_kind": dict(fake_groq.calls_by_kind),
+        "crm_calls_by_kind": dict(stub_hubspot.calls_by_kind),
+        "llm_tokens": {
+            "prompt": fake_groq.prompt_tokens,
+            "completion": fake_groq.completion_tokens
+        },
+        "llm_bypassed_by_state": (
+            {state.value: count for state, count in conversation_manager.reply_planner.bypassed.items()}
+            if conversation_manager.reply_planner else {}
+        ),
+        "speculation": {
+            "hits": speculator.hits,
+            "misses": speculator.misses,
+            "hit_rate": round(speculator.hit_rate, 3),
+            "seconds_saved": round(speculator.seconds_saved, 2),
+            "wasted_tokens": speculator.wasted_tokens
+        } if speculator else {},
+        "states_covered": sorted(state.value for state in states_seen),
+        "families_completed": sorted(set(completed))
+    }
+
+
+def _compare(current: Dict, baseline_path: str):
+    """Imprime la variación de p95 y throughput contra un resultado previo"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {level["concurrency"]: level for level in baseline["results"]["levels"]}
+    print(f"\nComparación contra {baseline.get('git_revision')}:")
+    for level in current["levels"]:
+        before = previous.get(level["concurrency"])
+        if not before:
+            continue
+        p95_before = before["turn_latency_ms"]["p95"]
+        p95_after = level["turn_latency_ms"]["p95"]
+        delta = (p95_after - p95_before) / p95_before * 100 if p95_before else 0.0
+        print(
+            f"  c={level['concurrency']:>5}  p95 {p95_before:.1f} -> {p95_after:.1f} ms ({delta:+.1f}%)  "
+            f"throughput {before['throughput_turns_per_s']} -> {level['throughput_turns_per_s']} turnos/s"
+        )
+
+
+async def main_async(args) -> Dict:
+    levels = []
+    for concurrency in args.concurrency:
+        leads = args.leads or max(10, concurrency * 2)
+        result = await run_level(concurrency, leads, args)
+        levels.append(result)
+        latency = result["turn_latency_ms"]
+        print(
+            f"c={concurrency:>5} leads={leads:>5} p50={latency['p50']:.1f}ms p95={latency['p95']:.1f}ms "
+            f"p99={latency['p99']:.1f}ms throughput={result['throughput_turns_per_s']} turnos/s "
+            f"llm/lead={result['llm_calls_per_lead']['mean']} crm/lead={result['crm_calls_per_lead']['mean']} "
+            f"crm evitadas/lead={result['crm_avoided_calls_per_lead']['mean']}"
+        )
+        if result["speculation"]:
+            print(f"  especulación: {result['speculation']}")
+        if result["llm_bypassed_by_state"]:
+            print(f"  respuestas sin LLM por estado: {result['llm_bypassed_by_state']}")
+        missing_states = {state.value for state in ConversationState} - set(result["states_covered"])
+        if missing_states:
+            print(f"  Estados no cubiertos: {sorted(missing_states)}")
+    return {
+        "config": {
+            "llm_latency": args.llm_latency,
+            "crm_latency": args.crm_latency,
+            "seed": args.seed,
+            "reply_templates": not args.no_reply_templates,
+            "speculative": args.speculative,
+            "families": list(EQUIPMENT_FAMILIES)
+        },
+        "levels": levels
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")],
+                        default=[1, 10, 100, 1000], help="Niveles de concurrencia separados por coma")
+    parser.add_argument("--leads", type=int, default=0,
+                        help="Leads por nivel (por defecto max(10, 2 x concurrencia))")
+    parser.add_argument("--llm-latency", default="lognormal:0.35:0.4", help="Distribución de latencia de Groq")
+    parser.add_argument("--crm-latency", default="lognormal:0.15:0.3", help="Distribución de latencia de HubSpot")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None, help="Ruta del JSON de resultados")
+    parser.add_argument("--compare", default=None, help="JSON de un resultado previo para comparar")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--no-reply-templates", action="store_true",
+                        help="Genera todas las respuestas con el LLM (sin ReplyPlanner)")
+    parser.add_argument("--speculative", action="store_true",
+                        help="Pre-genera la respuesta del estado predicho mientras corre la extracción")
+    parser.add_argument("--waste-token-budget", type=int, default=50_000,
+                        help="Tokens especulativos desperdiciados permitidos por hora")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    setup_logging(level=args.log_level)
+    results = asyncio.run(main_async(args))
+    path = write_results("conversation", results, args.output)
+    print(f"Resultados escritos en {path}")
+    if args.compare:
+        _compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
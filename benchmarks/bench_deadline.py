@@ -0,0 +1,116 @@
+"""
+Benchmark del presupuesto de tiempo por update ante latencias de cola pesada
+
+Reproduce diálogos completos pasando por `TelegramBot._process` contra un LLM y un CRM simulados
+con latencia lognormal de sigma alta (colas de varios segundos) y compara, sin deadline y con
+`--budgets`, la latencia por turno (p50/p99/máx.), las etapas que agotaron su parte del
+presupuesto (`crm`: sincronizaciones diferidas) y si todos los leads con datos terminan en el CRM
+tras los reintentos.
+
+Uso:
+    python -m benchmarks.bench_deadline --leads 200 --concurrency 50 --budgets 0,3,5
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import Dict, List
+
+from benchmarks.common import summarize, write_results
+from benchmarks.scenarios import assign_family, build_dialog
+from benchmarks.stubs import build_stub_stack, current_lead
+from deadline import DEADLINE_EXCEEDED, Deadline
+from logging_config import setup_logging
+from models import ConversationState
+from telegram_bot import TelegramBot
+
+
+async def run_budget(budget: float, args) -> Dict:
+    conversation_manager, fake_groq, stub_hubspot = build_stub_stack(args.llm_latency, args.crm_latency, args.seed)
+    bot = TelegramBot("123456:bench", conversation_manager)
+    rng = random.Random(args.seed)
+    latencies: List[float] = []
+    exceeded_before = dict(DEADLINE_EXCEEDED.values)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def _user(user_index: int):
+        telegram_id = f"bench-{user_index}"
+        current_lead.set(telegram_id)
+        async with semaphore:
+            for message in build_dialog(assign_family(user_index), user_index, rng):
+                start = time.perf_counter()
+                await bot._process(telegram_id, message, Deadline(budget) if budget > 0 else None)
+                latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[asyncio.create_task(_user(i)) for i in range(args.leads)])
+    wall = time.perf_counter() - started
+
+    # Las sincronizaciones diferidas que siguen en curso terminan y las pendientes se reintentan sin deadline
+    pending = len(conversation_manager.pending_sync)
+    await asyncio.sleep(max(args.crm_drain, 0))
+    for telegram_id in list(conversation_manager.pending_sync):
+        await conversation_manager._sync_to_hubspot(conversation_manager.conversations[telegram_id]['lead'])
+    synced = {properties.get("telegram_id") for properties in stub_hubspot.contacts.values()}
+    # Leads con datos capturados (al menos el nombre) que no llegaron al CRM
+    missing = [
+        telegram_id for telegram_id, conv in conversation_manager.conversations.items()
+        if conv['lead'].name and telegram_id not in synced
+    ]
+
+    exceeded = Counter()
+    for key, value in DEADLINE_EXCEEDED.values.items():
+        delta = value - exceeded_before.get(key, 0)
+        if delta:
+            exceeded[key[0]] += int(delta)
+    completed = sum(
+        1 for conv in conversation_manager.conversations.values() if conv['state'] == ConversationState.COMPLETED
+    )
+    return {
+        "budget_s": budget,
+        "turns": len(latencies),
+        "wall_s": round(wall, 2),
+        "turn_latency_ms": summarize(latencies),
+        "deadline_exceeded_by_stage": dict(exceeded),
+        "pending_sync_at_end": pending,
+        "completed_leads": completed,
+        "leads_missing_in_crm_after_retry": len(missing),
+        "llm_calls": sum(fake_groq.calls_by_kind.values())
+    }
+
+
+async def main_async(args) -> Dict:
+    setup_logging(level="ERROR", mode="sync")
+    results = []
+    for budget in args.budgets:
+        result = await run_budget(budget, args)
+        results.append(result)
+        latency = result["turn_latency_ms"]
+        print(f"presupuesto={budget or 'sin límite':>10} p50={latency['p50']:.0f}ms p99={latency['p99']:.0f}ms "
+              f"máx={latency['max']:.0f}ms completados={result['completed_leads']}/{args.leads} "
+              f"agotados={result['deadline_exceeded_by_stage']} pendientes={result['pending_sync_at_end']} "
+              f"faltantes en CRM={result['leads_missing_in_crm_after_retry']}")
+    return {"budgets": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--budgets", type=lambda v: [float(x) for x in v.split(",")], default=[0, 3, 5])
+    parser.add_argument("--llm-latency", default="lognormal:0.35:1.0")
+    parser.add_argument("--crm-latency", default="lognormal:0.15:1.2")
+    parser.add_argument("--crm-drain", type=float, default=2.0,
+                        help="Segundos para que terminen las sincronizaciones en segundo plano")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+    results = asyncio.run(main_async(args))
+    path = write_results("deadline", results, args.output)
+    print(f"Resultados escritos en {path}")
+
+
+if __name__ == "__main__":
+    main()
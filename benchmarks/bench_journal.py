@@ -0,0 +1,134 @@
+"""
+Benchmark del journal de leads: throughput de append con group commit y tiempo de recuperación
+
+Uso:
+    python -m benchmarks.bench_journal --concurrency 1,10,100,1000 --recovery-leads 100000
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+from benchmarks.common import summarize, write_results
+from journal import LeadJournal
+from models import Lead
+
+
+def _lead_event(telegram_id: str, turn: int) -> Dict:
+    lead = Lead(telegram_id=telegram_id, name="Ana López", equipment_interest="generador",
+                current_question_index=turn, created_at="2025-01-01T00:00:00")
+    return {"type": "lead", "telegram_id": telegram_id, "state": "waiting_equipment_questions",
+            "lead": lead.to_dict(), "pending_sync": turn % 7 == 0}
+
+
+async def bench_append(concurrency: int, events_per_writer: int, fsync: bool) -> Dict:
+    """`concurrency` escritores agregando eventos y esperando la confirmación de cada uno"""
+    directory = tempfile.mkdtemp(prefix="bench-journal-")
+    journal = LeadJournal(directory, fsync=fsync)
+    await journal.start()
+    latencies: List[float] = []
+
+    async def _writer(writer_id: int):
+        for turn in range(events_per_writer):
+            start = time.perf_counter()
+            await journal.append(
+                {"type": "message", "telegram_id": f"w{writer_id}", "role": "user", "content": "Unos 60 kVA"},
+                _lead_event(f"w{writer_id}", turn)
+            )
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[_writer(i) for i in range(concurrency)])
+    wall = time.perf_counter() - start
+    await journal.stop()
+    shutil.rmtree(directory)
+    return {
+        "concurrency": concurrency,
+        "fsync": fsync,
+        "events": journal.appends,
+        "commits": journal.commits,
+        "events_per_commit": round(journal.appends / max(journal.commits, 1), 1),
+        "events_per_s": round(journal.appends / wall, 1),
+        "append_latency_ms": summarize(latencies)
+    }
+
+
+async def bench_recovery(leads: int, turns: int) -> Dict:
+    """Escribe el historial de `leads` conversaciones y mide replay antes y después de compactar"""
+    directory = tempfile.mkdtemp(prefix="bench-journal-recovery-")
+    journal = LeadJournal(directory, segment_max_bytes=16 * 1024 * 1024, fsync=False)
+    await journal.start()
+    batch: List[Dict] = []
+    for turn in range(turns):
+        for lead_index in range(leads):
+            telegram_id = f"lead-{lead_index}"
+            batch.append({"type": "message", "telegram_id": telegram_id, "role": "user", "content": "respuesta"})
+            batch.append(_lead_event(telegram_id, turn))
+            if len(batch) >= 10_000:
+                await journal.append(*batch)
+                batch = []
+    if batch:
+        await journal.append(*batch)
+    await journal.stop()
+    size = sum(os.path.getsize(path) for _, path in journal.segments())
+
+    start = time.perf_counter()
+    restored = LeadJournal(directory).replay()
+    replay_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    LeadJournal(directory).compact()
+    compact_s = time.perf_counter() - start
+    compacted_size = sum(os.path.getsize(path) for _, path in LeadJournal(directory).segments())
+
+    start = time.perf_counter()
+    LeadJournal(directory).replay()
+    replay_compacted_s = time.perf_counter() - start
+    shutil.rmtree(directory)
+    return {
+        "leads": leads,
+        "events": leads * turns * 2,
+        "journal_mb": round(size / 1e6, 2),
+        "replay_s": round(replay_s, 3),
+        "compact_s": round(compact_s, 3),
+        "compacted_mb": round(compacted_size / 1e6, 2),
+        "replay_after_compaction_s": round(replay_compacted_s, 3),
+        "conversations_restored": len(restored)
+    }
+
+
+async def main_async(args) -> Dict:
+    results = {"append": [], "recovery": None}
+    for concurrency in args.concurrency:
+        for fsync in (True, False):
+            result = await bench_append(concurrency, args.events_per_writer, fsync)
+            results["append"].append(result)
+            print(
+                f"c={concurrency:>5} fsync={str(fsync):>5} {result['events_per_s']:>10} eventos/s "
+                f"eventos/commit={result['events_per_commit']:>7} "
+                f"p99={result['append_latency_ms']['p99']:.2f}ms"
+            )
+    results["recovery"] = await bench_recovery(args.recovery_leads, args.recovery_turns)
+    print(f"recuperación: {results['recovery']}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[1, 10, 100, 1000])
+    parser.add_argument("--events-per-writer", type=int, default=50)
+    parser.add_argument("--recovery-leads", type=int, default=100_000)
+    parser.add_argument("--recovery-turns", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+    results = asyncio.run(main_async(args))
+    path = write_results("journal", results, args.output)
+    print(f"Resultados escritos en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Benchmark de backends del LLM: Groq remoto contra un servidor local de llama.cpp en CPU
+
+Reproduce diálogos guionizados con cada asignación de backends y reporta latencia por turno
+(p50/p99), turnos por segundo y solicitudes por backend. En los modos locales agrega el tamaño
+medio del batch continuo del servidor y la proporción de tokens de prompt servidos desde la
+caché de prefijos.
+
+Modos:
+  remote         todas las tareas en Groq (stub con `--llm-latency`)
+  local-extract  extracción en local (`extract*=local`) y respuestas con Groq
+  local          todas las tareas en local
+  local-nocache  todas en local sin `cache_prompt`, para medir lo que aporta la caché
+
+Sin `--local-url` se usa el servidor simulado de benchmarks/stubs.py (costo por paso de
+decodificación y prefill configurables); con `--local-url` se mide un `llama-server` real.
+
+Uso:
+    python -m benchmarks.bench_llm_backends --leads 20 --concurrency 1,20
+    python -m benchmarks.bench_llm_backends --local-url http://127.0.0.1:8080 --parallel 4 --modes remote,local
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from typing import Dict, List
+
+from benchmarks.common import summarize, write_results
+from benchmarks.scenarios import assign_family, build_dialog
+from benchmarks.stubs import SimulatedLlamaServer, build_stub_stack, current_lead
+from llm_backends import LLM_BACKEND_REQUESTS, LlamaCppBackend, parse_task_backends
+from logging_config import setup_logging
+from models import ConversationState
+from replies import ReplyPlanner
+
+MODES = {
+    "remote": ("groq", ""),
+    "local-extract": ("groq", "extract*=local"),
+    "local": ("local", ""),
+    "local-nocache": ("local", "")
+}
+
+
+def _requests_by_backend(before: Dict) -> Dict[str, int]:
+    totals: Dict[str, int] = {}
+    for key, value in LLM_BACKEND_REQUESTS.values.items():
+        delta = int(value - before.get(key, 0))
+        if delta:
+            totals[f"{key[0]}:{key[1]}"] = delta
+    return totals
+
+
+async def run_mode(mode: str, concurrency: int, args) -> Dict:
+    conversation_manager, _, _ = build_stub_stack(args.llm_latency, args.crm_latency, args.seed)
+    conversation_manager.reply_planner = ReplyPlanner()
+    server = None
+    url = args.local_url
+    if url is None:
+        server = SimulatedLlamaServer(parallel=args.parallel, prefill_tps=args.prefill_tps,
+                                      step_base=args.step_base, step_per_seq=args.step_per_seq,
+                                      response_tokens=args.response_tokens)
+        url = await server.start()
+    local = LlamaCppBackend(url, parallel=args.parallel, cache_prompt=mode != "local-nocache", seed=args.seed)
+    llm_manager = conversation_manager.llm
+    llm_manager.backends["local"] = local
+    llm_manager.default_backend, rules = MODES[mode]
+    llm_manager.task_backends = parse_task_backends(rules)
+
+    rng = random.Random(args.seed)
+    latencies: List[float] = []
+    requests_before = dict(LLM_BACKEND_REQUESTS.values)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def _user(user_index: int):
+        telegram_id = f"bench-{user_index}"
+        current_lead.set(telegram_id)
+        async with semaphore:
+            for message in build_dialog(assign_family(user_index), user_index, rng):
+                start = time.perf_counter()
+                await conversation_manager.process_message(telegram_id, message)
+                latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[asyncio.create_task(_user(i)) for i in range(args.leads)])
+    wall = time.perf_counter() - started
+    await local.close()
+
+    completed = sum(
+        1 for conv in conversation_manager.conversations.values() if conv['state'] == ConversationState.COMPLETED
+    )
+    result = {
+        "mode": mode,
+        "concurrency": concurrency,
+        "turns": len(latencies),
+        "turns_per_s": round(len(latencies) / wall, 2),
+        "turn_latency_ms": summarize(latencies),
+        "completed_leads": completed,
+        "requests_by_backend": _requests_by_backend(requests_before)
+    }
+    if server is not None:
+        await server.stop()
+        result["local_server"] = {
+            "requests": server.requests,
+            "mean_batch_size": round(server.mean_batch_size, 2),
+            "prompt_cache_hit_ratio": round(server.cached_tokens / server.prompt_tokens, 3) if server.prompt_tokens else 0.0
+        }
+    return result
+
+
+async def main_async(args) -> Dict:
+    setup_logging(level="ERROR", mode="sync")
+    results = []
+    for concurrency in args.concurrency:
+        for mode in args.modes:
+            result = await run_mode(mode, concurrency, args)
+            results.append(result)
+            latency = result["turn_latency_ms"]
+            line = (f"c={concurrency:<4} {mode:<14} p50={latency['p50']:.0f}ms p99={latency['p99']:.0f}ms "
+                    f"{result['turns_per_s']} turnos/s completados={result['completed_leads']}/{args.leads} "
+                    f"solicitudes={result['requests_by_backend']}")
+            if result.get("local_server", {}).get("requests"):
+                server = result["local_server"]
+                line += f" batch medio={server['mean_batch_size']} caché={server['prompt_cache_hit_ratio']:.0%}"
+            print(line)
+    return {"local_url": args.local_url or "simulated", "runs": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", type=lambda v: v.split(","), default=list(MODES))
+    parser.add_argument("--leads", type=int, default=20)
+    parser.add_argument("--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[1, 20])
+    parser.add_argument("--local-url", default=None, help="URL de un llama-server real (por defecto, simulado)")
+    parser.add_argument("--parallel", type=int, default=4, help="Slots del servidor local (--parallel de llama-server)")
+    parser.add_argument("--prefill-tps", type=float, default=400.0, help="Tokens de prompt por segundo (simulado)")
+    parser.add_argument("--step-base", type=float, default=0.025, help="Segundos por paso de decodificación (simulado)")
+    parser.add_argument("--step-per-seq", type=float, default=0.005,
+                        help="Segundos extra por secuencia en el batch (simulado)")
+    parser.add_argument("--response-tokens", type=int, default=40,
+                        help="Tokens que genera una respuesta conversacional (simulado)")
+    parser.add_argument("--llm-latency", default="lognormal:0.35:0.4")
+    parser.add_argument("--crm-latency", default="lognormal:0.15:0.3")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+    unknown = [mode for mode in args.modes if mode not in MODES]
+    if unknown:
+        parser.error(f"Modos desconocidos: {unknown}")
+    results = asyncio.run(main_async(args))
+    path = write_results("llm_backends", results, args.output)
+    print(f"Resultados escritos en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Benchmark de la búsqueda de inventario por cercanía
+
+Genera un catálogo sintético de `--units` unidades repartidas entre las ciudades del gazetteer
+(con una proporción `--available` disponible) y mide, por consulta: la extracción de la ciudad
+del mensaje del usuario, las unidades disponibles más cercanas de una familia con el KD-tree y
+la misma consulta con un recorrido lineal del catálogo como referencia. Además mide el KD-tree
+solo con `--sites` sitios aleatorios dentro de México (sucursales con coordenadas propias) contra
+la búsqueda exhaustiva, verificando que ambos devuelven los mismos vecinos. También verifica la
+extracción de la ciudad con mensajes etiquetados, incluidos apellidos que coinciden con ciudades.
+
+Uso:
+    python -m benchmarks.bench_location --units 10000,100000 --queries 2000 --sites 1000,10000,100000
+"""
+
+import argparse
+import heapq
+import random
+import time
+from typing import Dict, List
+
+from benchmarks.common import summarize, write_results
+from location import (
+    GAZETTEER, KDTree, LocationIndex, _CITIES, chord_to_km, extract_user_place, find_place, to_unit_vector
+)
+from models import InventoryItem, get_equipment_family
+
+FAMILIES = ["Generador", "Soldadora", "Compresor", "Torre de iluminacion", "Rompedor", "LGMG"]
+MESSAGE_TEMPLATES = [
+    "Hola, estoy en {city} y necesito un equipo",
+    "La obra es en {city}, ¿tienen disponible?",
+    "Somos de {city}",
+    "¿Cuánto tarda el envío a {city}?",
+]
+# Mensaje -> ciudad esperada (None: no hay ubicación del usuario, aunque aparezca un nombre de ciudad)
+EXTRACTION_CASES = [
+    ("me llamo Ana de León y estoy en Mérida", "Mérida"),
+    ("Soy Luis de León", None),
+    ("Me llamo Pedro Córdoba", None),
+    ("Ana de la Paz, de la empresa Constructora del Norte", None),
+    ("María de Guadalupe Torreón", None),
+    ("Me atiende Jorge Monterrey, ¿le paso sus datos a Colima?", None),
+    ("vivo en León", "León"),
+    ("Somos de La Paz", "La Paz"),
+    ("soy de cdmx", "Ciudad de México"),
+    ("¿Cuánto tarda el envío a Puebla?", "Puebla"),
+    ("estamos en el Estado de México", "Estado de México"),
+    ("La obra es en Cd. Juárez", "Ciudad Juárez"),
+]
+
+
+def _catalog(units: int, available: float, rng: random.Random) -> List[InventoryItem]:
+    return [
+        InventoryItem(
+            tipo_maquina=rng.choice(FAMILIES),
+            modelo=f"M-{index}",
+            ubicacion=f"Sucursal {rng.choice(_CITIES)[0]}",
+            disponible=rng.random() < available
+        )
+        for index in range(units)
+    ]
+
+
+def _linear_nearest(items: List[InventoryItem], place, equipment: str, limit: int):
+    """Referencia: recorre todo el catálogo calculando la distancia de cada unidad disponible"""
+    family = get_equipment_family(equipment)
+    target = to_unit_vector(place.lat, place.lon)
+    candidates = []
+    for item in items:
+        if not item.disponible or get_equipment_family(item.tipo_maquina) != family:
+            continue
+        site = find_place(item.ubicacion)
+        if site is None:
+            continue
+        vector = to_unit_vector(site.lat, site.lon)
+        candidates.append((sum((a - b) ** 2 for a, b in zip(vector, target)), id(item), item))
+    return [(item, chord_to_km(distance)) for distance, _, item in heapq.nsmallest(limit, candidates)]
+
+
+def run_catalog(units: int, args, rng: random.Random) -> Dict:
+    items = _catalog(units, args.available, rng)
+    start = time.perf_counter()
+    index = LocationIndex(items)
+    build = time.perf_counter() - start
+
+    cities = [name for name, *_ in _CITIES]
+    extract_times: List[float] = []
+    query_times: List[float] = []
+    mismatches = 0
+    for _ in range(args.queries):
+        message = rng.choice(MESSAGE_TEMPLATES).format(city=rng.choice(cities))
+        equipment = rng.choice(FAMILIES).lower()
+        start = time.perf_counter()
+        place = extract_user_place(message)
+        extract_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        results = index.nearest(place, equipment, args.limit)
+        query_times.append(time.perf_counter() - start)
+        if len(results) != args.limit:
+            mismatches += 1
+
+    # Recorrido lineal con menos consultas (es varios órdenes de magnitud más lento)
+    linear_times: List[float] = []
+    for _ in range(args.linear_queries):
+        place = GAZETTEER[rng.choice(list(GAZETTEER))]
+        equipment = rng.choice(FAMILIES).lower()
+        start = time.perf_counter()
+        expected = _linear_nearest(items, place, equipment, args.limit)
+        linear_times.append(time.perf_counter() - start)
+        got = index.nearest(place, equipment, args.limit)
+        if [round(d, 6) for _, d in got] != [round(d, 6) for _, d in expected]:
+            mismatches += 1
+    return {
+        "units": units,
+        "sites": len(index.sites),
+        "index_build_ms": round(build * 1000, 2),
+        "extract_city_us": summarize(extract_times, 1e6),
+        "nearest_kdtree_us": summarize(query_times, 1e6),
+        "nearest_linear_us": summarize(linear_times, 1e6),
+        "mismatches": mismatches
+    }
+
+
+def run_sites(sites: int, args, rng: random.Random) -> Dict:
+    """KD-tree solo, con sitios aleatorios dentro del rectángulo de México"""
+    points = [
+        (to_unit_vector(rng.uniform(14.5, 32.7), rng.uniform(-117.1, -86.7)), index) for index in range(sites)
+    ]
+    start = time.perf_counter()
+    tree = KDTree(points)
+    build = time.perf_counter() - start
+    tree_times: List[float] = []
+    scan_times: List[float] = []
+    mismatches = 0
+    for query in range(args.queries):
+        target = to_unit_vector(rng.uniform(14.5, 32.7), rng.uniform(-117.1, -86.7))
+        start = time.perf_counter()
+        nearest = tree.nearest(target, args.limit)
+        tree_times.append(time.perf_counter() - start)
+        if query < args.linear_queries:
+            start = time.perf_counter()
+            expected = heapq.nsmallest(
+                args.limit, ((sum((a - b) ** 2 for a, b in zip(point, target)), value) for point, value in points)
+            )
+            scan_times.append(time.perf_counter() - start)
+            if [value for _, value in nearest] != [value for _, value in expected]:
+                mismatches += 1
+    return {
+        "sites": sites,
+        "build_ms": round(build * 1000, 2),
+        "kdtree_us": summarize(tree_times, 1e6),
+        "linear_us": summarize(scan_times, 1e6),
+        "mismatches": mismatches
+    }
+
+
+def check_extraction() -> List[Dict]:
+    """Casos de EXTRACTION_CASES en los que la ciudad extraída no es la esperada"""
+    failures = []
+    for message, expected in EXTRACTION_CASES:
+        place = extract_user_place(message)
+        got = place.name if place is not None else None
+        if got != expected:
+            failures.append({"message": message, "expected": expected, "got": got})
+    return failures
+
+
+def run_benchmark(args) -> Dict:
+    rng = random.Random(args.seed)
+    failures = check_extraction()
+    print(f"extracción de ciudad: {len(EXTRACTION_CASES) - len(failures)}/{len(EXTRACTION_CASES)} casos correctos")
+    for failure in failures:
+        print(f"  {failure['message']!r}: esperada={failure['expected']} obtenida={failure['got']}")
+    results = {"extraction_failures": failures, "catalog": [], "sites": []}
+    for units in args.units:
+        result = run_catalog(units, args, rng)
+        results["catalog"].append(result)
+        print(f"unidades={units:>7} sitios={result['sites']} índice={result['index_build_ms']}ms "
+              f"ciudad p50={result['extract_city_us']['p50']:.1f}µs "
+              f"cercanas p50={result['nearest_kdtree_us']['p50']:.1f}µs p99={result['nearest_kdtree_us']['p99']:.1f}µs "
+              f"lineal p50={result['nearest_linear_us']['p50']:.0f}µs diferencias={result['mismatches']}")
+    for sites in args.sites:
+        result = run_sites(sites, args, rng)
+        results["sites"].append(result)
+        print(f"sitios={sites:>7} construcción={result['build_ms']}ms "
+              f"kd-tree p50={result['kdtree_us']['p50']:.1f}µs p99={result['kdtree_us']['p99']:.1f}µs "
+              f"lineal p50={result['linear_us']['p50']:.0f}µs diferencias={result['mismatches']}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--units", type=lambda v: [int(x) for x in v.split(",")], default=[10000, 100000])
+    parser.add_argument("--sites", type=lambda v: [int(x) for x in v.split(",")], default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--linear-queries", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--available", type=float, default=0.7)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+    results = run_benchmark(args)
+    path = write_results("location", results, args.output)
+    print(f"Resultados escritos en {path}")
+
+
+if __name__ == "__main__":
+    main()
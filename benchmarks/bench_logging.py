@@ -0,0 +1,121 @@
+"""
+Benchmark del costo de logging en el event loop a tasas altas de mensajes
+
+Reproduce conversaciones sin latencia contra los stand-ins locales para que el tiempo del
+event loop sea dominado por el procesamiento y el logging, y compara modos de logging:
+deshabilitado (línea base), síncrono, en cola (QueueHandler/QueueListener) y en cola con muestreo.
+Reporta tiempo de CPU del hilo del event loop por mensaje y el ahorro frente al modo síncrono.
+
+Uso:
+    python -m benchmarks.bench_logging --leads 2000 --concurrency 200
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import tempfile
+import time
+import timeit
+
+from benchmarks.common import write_results
+from benchmarks.scenarios import assign_family, build_dialog
+from benchmarks.stubs import build_stub_stack, current_lead
+from logging_config import setup_logging, stop_logging
+
+MODES = {
+    "disabled": dict(level="CRITICAL", mode="sync"),
+    "sync": dict(level="INFO", mode="sync"),
+    "queue": dict(level="INFO", mode="queue"),
+    "queue_sampled": dict(level="INFO", mode="queue", sample_rate=0.1)
+}
+
+
+async def _drive(leads: int, concurrency: int, seed: int) -> int:
+    conversation_manager, _, _ = build_stub_stack("0", "0", seed)
+    rng = random.Random(seed)
+    semaphore = asyncio.Semaphore(concurrency)
+    turns = 0
+
+    async def _user(user_index: int):
+        nonlocal turns
+        async with semaphore:
+            telegram_id = f"bench-{user_index}"
+            current_lead.set(telegram_id)
+            for message in build_dialog(assign_family(user_index), user_index, rng):
+                await conversation_manager.process_message(telegram_id, message)
+                turns += 1
+
+    await asyncio.gather(*[_user(i) for i in range(leads)])
+    return turns
+
+
+def run_mode(name: str, leads: int, concurrency: int, seed: int) -> dict:
+    """Ejecuta la carga con un modo de logging escribiendo a un archivo real"""
+    fd, path = tempfile.mkstemp(prefix=f"bench-logging-{name}-", suffix=".log")
+    os.close(fd)
+    with open(path, "a", encoding="utf-8") as stream:
+        setup_logging(stream=stream, **MODES[name])
+        cpu_start = time.thread_time()
+        wall_start = time.perf_counter()
+        turns = asyncio.run(_drive(leads, concurrency, seed))
+        loop_cpu = time.thread_time() - cpu_start
+        wall = time.perf_counter() - wall_start
+        stop_logging()
+    size = os.path.getsize(path)
+    os.remove(path)
+    return {
+        "turns": turns,
+        "wall_seconds": round(wall, 3),
+        "messages_per_s": round(turns / wall, 1),
+        "loop_cpu_us_per_message": round(loop_cpu / turns * 1e6, 2),
+        "log_bytes": size
+    }
+
+
+def format_microbench() -> dict:
+    """Costo de construir el mensaje con f-string vs. formato diferido cuando el nivel está deshabilitado"""
+    logger = logging.getLogger("bench.format")
+    logger.setLevel(logging.INFO)
+    properties = {
+        "telegram_id": "123456789", "telegram_lead": "true", "lifecyclestage": "lead",
+        "firstname": "Ana López", "email": "ana@ejemplo.com", "phone": "55 1234 5678",
+        "empresa_asociada": "Constructora del Norte", "equipo_interesado": "generador"
+    }
+    number = 200_000
+    eager = timeit.timeit(lambda: logger.debug(f"Propiedades a enviar: {properties}"), number=number)
+    lazy = timeit.timeit(lambda: logger.debug("Propiedades a enviar: %s", properties), number=number)
+    return {
+        "eager_fstring_ns": round(eager / number * 1e9, 1),
+        "lazy_percent_ns": round(lazy / number * 1e9, 1)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leads", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    results = {"modes": {}, "format_disabled_level": format_microbench()}
+    for name in MODES:
+        results["modes"][name] = run_mode(name, args.leads, args.concurrency, args.seed)
+        print(f"{name:>14}: {results['modes'][name]}")
+
+    baseline = results["modes"]["disabled"]["loop_cpu_us_per_message"]
+    sync_cost = results["modes"]["sync"]["loop_cpu_us_per_message"] - baseline
+    for name in ("queue", "queue_sampled"):
+        cost = results["modes"][name]["loop_cpu_us_per_message"] - baseline
+        results["modes"][name]["loop_us_saved_vs_sync"] = round(sync_cost - cost, 2)
+    print(f"formato con nivel deshabilitado: {results['format_disabled_level']}")
+
+    setup_logging()
+    path = write_results("logging", results, args.output)
+    print(f"Resultados escritos en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Benchmark de /reset: latencia y contactos vacíos en el CRM con creación anticipada y diferida
+
+Cada usuario simulado da su nombre (se crea su contacto), ejecuta /reset y solo una parte
+(`--continue-ratio`) vuelve a dar su nombre; el resto abandona. Se compara el comportamiento
+anterior (POST de un contacto vacío antes de responder al /reset, reproducido aquí) con la
+creación diferida a la primera sincronización con datos: latencia del reset, contactos creados,
+contactos vacíos y que el contacto nuevo no sobrescriba al anterior. Al final, un usuario envía
+una ráfaga de /reset para medir el límite por usuario.
+
+Uso:
+    python -m benchmarks.bench_reset --users 500 --crm-latency lognormal:0.15:0.3
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from collections import Counter
+from typing import Dict, List
+
+from benchmarks.common import summarize, write_results
+from benchmarks.stubs import build_stub_stack, current_lead
+from logging_config import setup_logging
+from ratelimit import KeyedTokenBuckets
+
+NAME_MESSAGES = ["Hola, quiero información sobre maquinaria", "Me llamo Ana López"]
+
+
+async def _eager_reset(conversation_manager, telegram_id: str):
+    """Comportamiento anterior: además del reinicio local, crea un contacto vacío antes de responder"""
+    await conversation_manager.reset_conversation(telegram_id)
+    lead = conversation_manager.conversations[telegram_id]['lead']
+    lead.hubspot_contact_id = await conversation_manager.hubspot._create_contact(
+        conversation_manager.hubspot._build_properties(lead)
+    )
+    lead.force_new_contact = False
+
+
+async def run_mode(eager: bool, args) -> Dict:
+    conversation_manager, _, stub_hubspot = build_stub_stack(args.llm_latency, args.crm_latency, args.seed)
+    # Sin límite de reinicios para comparar solo la latencia
+    conversation_manager.reset_limiter = KeyedTokenBuckets(1e9, 1e9)
+    rng = random.Random(args.seed)
+    reset_latencies: List[float] = []
+    continued: List[str] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def _user(user_index: int):
+        telegram_id = f"bench-{user_index}"
+        current_lead.set(telegram_id)
+        async with semaphore:
+            for message in NAME_MESSAGES:
+                await conversation_manager.process_message(telegram_id, message)
+            start = time.perf_counter()
+            if eager:
+                await _eager_reset(conversation_manager, telegram_id)
+            else:
+                await conversation_manager.reset_conversation(telegram_id)
+            reset_latencies.append(time.perf_counter() - start)
+            if rng.random() < args.continue_ratio:
+                continued.append(telegram_id)
+                for message in NAME_MESSAGES:
+                    await conversation_manager.process_message(telegram_id, message)
+
+    await asyncio.gather(*[asyncio.create_task(_user(i)) for i in range(args.users)])
+
+    contacts_by_user = Counter(properties.get("telegram_id") for properties in stub_hubspot.contacts.values())
+    blank = sum(
+        1 for properties in stub_hubspot.contacts.values()
+        if not properties.get("firstname") and not properties.get("equipo_interesado")
+    )
+    return {
+        "mode": "eager" if eager else "lazy",
+        "reset_latency_ms": summarize(reset_latencies),
+        "contacts_created": len(stub_hubspot.contacts),
+        "blank_contacts": blank,
+        "crm_calls_by_kind": dict(stub_hubspot.calls_by_kind),
+        # Usuarios que continuaron tras el reset: deben tener dos contactos (el anterior intacto)
+        "continued_users": len(continued),
+        "continued_with_new_contact": sum(1 for telegram_id in continued if contacts_by_user[telegram_id] == 2)
+    }
+
+
+async def reset_storm(args) -> Dict:
+    """Un usuario envía `--storm` /reset seguidos con el límite por usuario de la configuración"""
+    conversation_manager, _, stub_hubspot = build_stub_stack(args.llm_latency, args.crm_latency, args.seed)
+    results = [await conversation_manager.reset_conversation("storm") for _ in range(args.storm)]
+    return {"resets": args.storm, "allowed": sum(results), "crm_calls": sum(stub_hubspot.calls_by_kind.values())}
+
+
+async def main_async(args) -> Dict:
+    setup_logging(level="ERROR", mode="sync")
+    results = {}
+    for eager in (True, False):
+        result = await run_mode(eager, args)
+        results[result["mode"]] = result
+        latency = result["reset_latency_ms"]
+        print(f"{result['mode']:>5}: /reset p50={latency['p50']:.2f}ms p99={latency['p99']:.2f}ms "
+              f"contactos={result['contacts_created']} vacíos={result['blank_contacts']} "
+              f"llamadas CRM={result['crm_calls_by_kind']} "
+              f"continuaron con contacto nuevo={result['continued_with_new_contact']}/{result['continued_users']}")
+    results["storm"] = await reset_storm(args)
+    print(f"ráfaga de /reset: {results['storm']}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--continue-ratio", type=float, default=0.4)
+    parser.add_argument("--storm", type=int, default=50)
+    parser.add_argument("--llm-latency", default="lognormal:0.35:0.4")
+    parser.add_argument("--crm-latency", default="lognormal:0.15:0.3")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+    results = asyncio.run(main_async(args))
+    path = write_results("reset", results, args.output)
+    print(f"Resultados escritos en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Benchmark de throughput de transcripción de notas de voz
+
+Envía clips al `Transcriber` con llegadas Poisson (`--rate` clips/s) y reporta, por número de
+workers: clips transcritos por segundo, segundos de audio por segundo de reloj, latencia por
+clip (p50/p99), clips rechazados por cola llena y el retraso máximo del event loop mientras
+el pool trabaja (debe mantenerse en milisegundos).
+
+Con `--engine whisper` usa faster-whisper sobre los archivos de `--clips` (OGG/MP3/WAV); con
+`--engine synthetic` (por defecto) usa un worker que ocupa la CPU `--rtf` segundos por segundo
+de audio, para medir el pool y la cola sin el modelo.
+
+Uso:
+    python -m benchmarks.bench_speech --workers 1,2,4 --clips-count 40 --rate 2
+    python -m benchmarks.bench_speech --engine whisper --clips data/voice --model base --workers 1,2
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks.common import summarize, write_results
+from benchmarks.stubs import synthetic_audio, synthetic_speech_init, synthetic_transcribe
+from logging_config import setup_logging
+from speech import Transcriber, TranscriptionRejected, default_cpu_threads
+
+
+def _load_clips(args, rng: random.Random) -> List[Tuple[bytes, float]]:
+    """Clips (audio, duración declarada) a enviar"""
+    if args.engine == "whisper":
+        files = sorted(os.path.join(args.clips, name) for name in os.listdir(args.clips))
+        clips = []
+        for path in files:
+            with open(path, "rb") as f:
+                clips.append((f.read(), None))
+        return [clips[index % len(clips)] for index in range(args.clips_count)]
+    # Duraciones típicas de notas de voz (lognormal, mediana ~8 s)
+    durations = [min(rng.lognormvariate(0, 0.7) * 8, args.max_duration) for _ in range(args.clips_count)]
+    return [(synthetic_audio(duration), duration) for duration in durations]
+
+
+def _build_transcriber(workers: int, args) -> Transcriber:
+    if args.engine == "whisper":
+        return Transcriber(model_size=args.model, workers=workers, max_queue=args.queue_size,
+                           max_duration=args.max_duration, cpu_threads=default_cpu_threads(workers))
+    return Transcriber(workers=workers, max_queue=args.queue_size, max_duration=args.max_duration,
+                       initializer=synthetic_speech_init, transcribe_fn=synthetic_transcribe,
+                       initargs=(args.rtf,))
+
+
+async def _warm_up(transcriber: Transcriber, clip: bytes):
+    """Arranca todos los workers (y carga el modelo) antes de medir"""
+    await asyncio.gather(*[transcriber.transcribe(clip) for _ in range(transcriber.workers)],
+                         return_exceptions=True)
+
+
+async def run_workers(workers: int, clips: List[Tuple[bytes, float]], args) -> Dict:
+    transcriber = _build_transcriber(workers, args)
+    await _warm_up(transcriber, clips[0][0])
+    rng = random.Random(args.seed)
+    latencies: List[float] = []
+    audio_seconds = 0.0
+    rejected = 0
+    lag_max = 0.0
+    running = True
+
+    async def _measure_lag():
+        nonlocal lag_max
+        while running:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lag_max = max(lag_max, time.perf_counter() - start - 0.01)
+
+    async def _clip(audio: bytes, duration):
+        nonlocal audio_seconds, rejected
+        start = time.perf_counter()
+        try:
+            await transcriber.transcribe(audio, duration)
+        except TranscriptionRejected:
+            rejected += 1
+            return
+        latencies.append(time.perf_counter() - start)
+        audio_seconds += duration if duration is not None else 0.0
+
+    lag_task = asyncio.create_task(_measure_lag())
+    tasks = []
+    started = time.perf_counter()
+    for audio, duration in clips:
+        tasks.append(asyncio.create_task(_clip(audio, duration)))
+        await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - started
+    running = False
+    await lag_task
+    transcriber.stop()
+    return {
+        "workers": workers,
+        "clips": len(latencies),
+        "rejected_queue_full": rejected,
+        "clips_per_s": round(len(latencies) / wall, 2),
+        "audio_s_per_s": round(audio_seconds / wall, 2) if audio_seconds else None,
+        "latency_ms": summarize(latencies),
+        "event_loop_lag_max_ms": round(lag_max * 1000, 2)
+    }
+
+
+async def main_async(args) -> Dict:
+    setup_logging(level="WARNING", mode="sync")
+    clips = _load_clips(args, random.Random(args.seed))
+    results = {"engine": args.engine, "cpu_count": os.cpu_count(), "runs": []}
+    for workers in args.workers:
+        result = await run_workers(workers, clips, args)
+        results["runs"].append(result)
+        latency = result["latency_ms"]
+        print(f"workers={workers} {result['clips_per_s']} clips/s audio={result['audio_s_per_s']} s/s "
+              f"p50={latency['p50']:.0f}ms p99={latency['p99']:.0f}ms rechazados={result['rejected_queue_full']} "
+              f"lag máx. del loop={result['event_loop_lag_max_ms']}ms")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engine", choices=["synthetic", "whisper"], default="synthetic")
+    parser.add_argument("--clips", default=None, help="Directorio con clips de audio (engine whisper)")
+    parser.add_argument("--model", default="base")
+    parser.add_argument("--workers", type=lambda v: [int(x) for x in v.split(",")], default=[1, 2, 4])
+    parser.add_argument("--clips-count", type=int, default=40)
+    parser.add_argument("--rate", type=float, default=2.0, help="Clips por segundo")
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--max-duration", type=float, default=60.0)
+    parser.add_argument("--rtf", type=float, default=0.1,
+                        help="Segundos de CPU por segundo de audio del worker simulado")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+    if args.engine == "whisper" and not args.clips:
+        parser.error("--engine whisper requiere --clips")
+    results = asyncio.run(main_async(args))
+    path = write_results("speech", results, args.output)
+    print(f"Resultados escritos en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark de arranque: perfil de tiempos de importación y tiempo hasta la primera respuesta
+
+Cada medición corre en un proceso nuevo (arranque en frío). El modo "lazy" sigue el camino de
+app.main (importaciones diferidas, cliente de Groq creado en el primer uso, inventario cargado en
+segundo plano); el modo "eager" importa groq/requests/pandas y construye todo por adelantado como
+lo hacía el arranque anterior. El LLM responde a través de un httpx.MockTransport, así que el
+cliente real de Groq se importa y se construye pero no hay red.
+
+Uso:
+    python -m benchmarks.bench_startup --runs 5
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+
+from benchmarks.common import summarize, write_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD_SCRIPT = r'''
+import time
+t0 = time.perf_counter()
+import asyncio, json, os, sys
+mode = sys.argv[1]
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123456:bench-token")
+os.environ.setdefault("GROQ_API_KEY", "bench-key")
+os.environ.setdefault("HUBSPOT_ACCESS_TOKEN", "bench-token")
+os.environ["LOG_LEVEL"] = "WARNING"
+os.environ["METRICS_PORT"] = "0"
+os.environ["JOURNAL_DIR"] = ""
+
+if mode == "eager":
+    import groq, requests, pandas, httpx, telegram.ext
+
+import app, config
+config.load_environment()
+t_import = time.perf_counter()
+
+import httpx
+from tracing import configure_structlog
+from inventory import InventoryManager
+from hubspot import HubSpotManager
+from llm import LLMManager
+from conversation import ConversationManager
+from telegram_bot import TelegramBot
+configure_structlog()
+
+def _completion(request):
+    return httpx.Response(200, json={
+        "id": "bench", "object": "chat.completion", "created": 0, "model": "bench",
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "message": {"role": "assistant", "content": "¡Hola! Soy Juan, ¿con quién tengo el gusto?"}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20}
+    })
+
+http_client = httpx.AsyncClient(transport=httpx.MockTransport(_completion))
+inventory_manager = InventoryManager(autoload=(mode == "eager"))
+llm_manager = LLMManager(config.GROQ_API_KEY, http_client=http_client)
+if mode == "eager":
+    llm_manager.client
+conversation_manager = ConversationManager(inventory_manager, HubSpotManager(config.HUBSPOT_ACCESS_TOKEN), llm_manager)
+bot = TelegramBot(config.TELEGRAM_BOT_TOKEN, conversation_manager)
+t_construct = time.perf_counter()
+
+async def first_reply():
+    await conversation_manager.start_background_tasks()
+    reply = await conversation_manager.process_message("bench-user", "Hola")
+    return reply
+
+reply = asyncio.run(first_reply())
+t_reply = time.perf_counter()
+print("RESULT " + json.dumps({
+    "import_s": t_import - t0,
+    "construct_s": t_construct - t_import,
+    "first_reply_s": t_reply - t0,
+    "reply_ok": bool(reply)
+}))
+'''
+
+
+def _run_child(mode: str) -> dict:
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, mode],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    wall = time.perf_counter() - start
+    line = next(l for l in output.stdout.splitlines() if l.startswith("RESULT "))
+    result = json.loads(line[len("RESULT "):])
+    result["process_wall_s"] = wall
+    return result
+
+
+def import_profile(top: int = 15) -> dict:
+    """Perfil de python -X importtime para el conjunto de módulos que usa el bot al arrancar"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         "import app, config; config.load_environment(); import conversation, telegram_bot"],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    entries = []
+    for line in output.stderr.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            entries.append({
+                "module": name, "self_ms": int(self_us) / 1000,
+                "cumulative_ms": int(cumulative_us) / 1000, "depth": (len(indent) - 1) // 2
+            })
+    top_level = [entry for entry in entries if entry["depth"] == 0]
+    return {
+        "total_ms": round(sum(entry["cumulative_ms"] for entry in top_level), 2),
+        "top_cumulative": sorted(top_level, key=lambda e: e["cumulative_ms"], reverse=True)[:top],
+        "top_self": sorted(entries, key=lambda e: e["self_ms"], reverse=True)[:top],
+        "groq_imported_at_startup": any(entry["module"] == "groq" for entry in entries)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+
+    results = {"import_profile": import_profile(), "modes": {}}
+    for mode in ("eager", "lazy"):
+        runs = [_run_child(mode) for _ in range(args.runs)]
+        results["modes"][mode] = {
+            metric: summarize([run[metric] for run in runs])
+            for metric in ("import_s", "construct_s", "first_reply_s", "process_wall_s")
+        }
+        results["modes"][mode]["reply_ok"] = all(run["reply_ok"] for run in runs)
+        print(
+            f"{mode:>5}: import p50={results['modes'][mode]['import_s']['p50']:.1f}ms "
+            f"primera respuesta p50={results['modes'][mode]['first_reply_s']['p50']:.1f}ms "
+            f"proceso p50={results['modes'][mode]['process_wall_s']['p50']:.1f}ms"
+        )
+    print(f"Importación total al arrancar: {results['import_profile']['total_ms']} ms")
+    path = write_results("startup", results, args.output)
+    print(f"Resultados escritos en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Utilidades comunes para los benchmarks: distribuciones de latencia, percentiles y resultados en JSON
+"""
+
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+class LatencyModel:
+    """Distribución de latencia configurable para los stand-ins locales.
+
+    Formatos aceptados (segundos):
+      - "0.2"                   constante
+      - "const:0.2"             constante
+      - "uniform:0.1:0.4"       uniforme entre min y max
+      - "lognormal:0.35:0.4"    lognormal con mediana y sigma
+      - "normal:0.3:0.05"       normal con media y desviación (truncada en 0)
+    """
+
+    def __init__(self, spec: str, rng: Optional[random.Random] = None):
+        self.spec = spec
+        self.rng = rng or random.Random()
+        parts = spec.split(":")
+        if len(parts) == 1:
+            parts = ["const", parts[0]]
+        self.kind = parts[0]
+        self.params = [float(p) for p in parts[1:]]
+        if self.kind not in ("const", "uniform", "lognormal", "normal"):
+            raise ValueError(f"Distribución de latencia desconocida: {spec}")
+
+    def sample(self) -> float:
+        """Devuelve una latencia en segundos"""
+        if self.kind == "const":
+            return self.params[0]
+        if self.kind == "uniform":
+            return self.rng.uniform(self.params[0], self.params[1])
+        if self.kind == "lognormal":
+            median, sigma = self.params
+            if median <= 0:
+                return 0.0
+            return self.rng.lognormvariate(0, sigma) * median
+        return max(0.0, self.rng.gauss(self.params[0], self.params[1]))
+
+    async def wait(self):
+        """Duerme la latencia muestreada"""
+        delay = self.sample()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentil por interpolación lineal (pct en 0-100)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def summarize(values: List[float], scale: float = 1000.0) -> Dict[str, float]:
+    """Resumen p50/p95/p99/mean/max (por defecto en milisegundos)"""
+    if not values:
+        return {"count": 0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "mean": 0.0, "max": 0.0}
+    return {
+        "count": len(values),
+        "p50": round(percentile(values, 50) * scale, 3),
+        "p95": round(percentile(values, 95) * scale, 3),
+        "p99": round(percentile(values, 99) * scale, 3),
+        "mean": round(sum(values) / len(values) * scale, 3),
+        "max": round(max(values) * scale, 3)
+    }
+
+
+def git_revision() -> str:
+    """Commit actual del repositorio (o 'unknown' si no se puede determinar)"""
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def write_results(name: str, results: Dict, output: Optional[str] = None) -> str:
+    """Escribe los resultados en JSON junto con metadatos para comparar entre commits"""
+    revision = git_revision()
+    payload = {
+        "benchmark": name,
+        "git_revision": revision,
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{name}-{revision}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, ensure_ascii=False)
+    return output
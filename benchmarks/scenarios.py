@@ -0,0 +1,56 @@
+"""
+Diálogos guionizados que recorren todos los estados de la conversación por familia de equipo
+"""
+
+import random
+from typing import List
+
+# Familia -> (texto del equipo, respuestas a las preguntas específicas del equipo)
+EQUIPMENT_FAMILIES = {
+    "soldadora": ("soldadora", ["Necesito unos 250 amperes con electrodo 6013"]),
+    "compresor": ("compresor", ["Para herramienta neumática, unos 185 CFM"]),
+    "torre_iluminacion": ("torre de iluminacion", ["Sí, de LED"]),
+    "lgmg": ("plataforma lgmg", ["Unos 12 metros", "Mantenimiento de naves", "Interior"]),
+    "generador": ("generador", ["Para una obra", "Unos 60 kVA"]),
+    "rompedor": ("rompedor", ["Para demoler concreto"]),
+    "otro": ("retroexcavadora", ["Con martillo hidráulico"])
+}
+
+NAMES = ["Ana López", "Carlos Pérez", "María Torres", "Jorge Ramírez", "Lucía Gómez", "Raúl Díaz"]
+BUSINESSES = ["construcción", "minería", "renta de equipo", "mantenimiento industrial"]
+
+
+def build_dialog(family: str, user_index: int, rng: random.Random) -> List[str]:
+    """Genera los mensajes de un usuario que completa el flujo para la familia indicada.
+
+    Incluye de forma aleatoria mensajes fuera de guion (preguntas, respuestas sin dato) para
+    cubrir los reintentos dentro de un mismo estado y un mensaje final ya en COMPLETED.
+    """
+    equipment, answers = EQUIPMENT_FAMILIES[family]
+    name = rng.choice(NAMES)
+    is_distributor = rng.random() < 0.3
+
+    turns = ["Hola, quiero información sobre maquinaria"]  # INITIAL
+    if rng.random() < 0.3:
+        turns.append("¿Qué marcas manejan?")  # WAITING_NAME sin nombre
+    turns.append(f"Me llamo {name}")  # WAITING_NAME
+    if rng.random() < 0.2:
+        turns.append("Todavía no sé bien")  # WAITING_EQUIPMENT sin equipo
+    turns.append(f"Busco una {equipment}")  # WAITING_EQUIPMENT
+    turns.extend(answers)  # WAITING_EQUIPMENT_QUESTIONS
+    if is_distributor:
+        turns.append("Sí, soy distribuidor")  # WAITING_DISTRIBUTOR
+    else:
+        turns.append("No, es para uso de la empresa")
+    turns.append(
+        f"Soy {name}, mi empresa es Empresa{user_index}, giro {rng.choice(BUSINESSES)}, "
+        f"correo lead{user_index}@ejemplo.com, teléfono 55 {1000 + user_index % 9000} {2000 + user_index % 8000}"
+    )  # WAITING_QUOTATION_DATA
+    turns.append("Gracias")  # COMPLETED
+    return turns
+
+
+def assign_family(user_index: int) -> str:
+    """Reparte a los usuarios entre todas las familias de equipo de forma round-robin"""
+    families = list(EQUIPMENT_FAMILIES)
+    return families[user_index % len(families)]
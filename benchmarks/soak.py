@@ -0,0 +1,377 @@
+"""
+Modo soak: tráfico sintético durante horas con instrumentación de memoria y del event loop
+
+Conduce diálogos completos por `TelegramBot._process` y `ConversationManager` contra los
+stand-ins locales (usuarios nuevos y recurrentes con llegadas Poisson, algunos /reset) y cada
+`--sample-interval` segundos registra:
+
+- RSS del proceso y snapshot de tracemalloc agrupado por sitio de asignación (archivo:línea)
+- objetos vivos por tipo (gc.get_objects)
+- retraso del event loop (p99 y máximo de la ventana)
+- pausas del recolector de basura por generación (callbacks de gc)
+- tamaño de las estructuras del bot: conversaciones, mensajes en historial, leads pendientes
+
+Al terminar ajusta una recta (mínimos cuadrados) a cada serie después del calentamiento y
+marca como crecimiento sostenido las que suben más de `--growth-threshold` bytes/hora (u objetos
+por hora) con R² alto, con el traceback del sitio de asignación.
+
+Con `--crm http` se usa el HubSpotManager real contra una API de HubSpot local (un cliente httpx
+por solicitud, como en producción); con `--journal` se escribe el journal en un directorio
+temporal.
+
+Uso:
+    python -m benchmarks.soak --duration 14400 --rate 20 --sample-interval 60
+    python -m benchmarks.soak --duration 600 --sample-interval 15 --crm http --journal
+"""
+
+import argparse
+import asyncio
+import gc
+import os
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from benchmarks.common import LatencyModel, percentile, write_results
+from benchmarks.scenarios import assign_family, build_dialog
+from benchmarks.stubs import StubHubSpotServer, build_stub_stack, current_lead
+from hubspot import HubSpotManager
+from journal import LeadJournal
+from logging_config import setup_logging
+from telegram_bot import TelegramBot
+
+# Trazas que no son del bot: la instrumentación, el import de módulos y los stand-ins de benchmarks/
+# (el CRM en memoria crece por diseño)
+TRACE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, os.path.join(os.path.dirname(os.path.abspath(__file__)), "*")),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def _rss_bytes() -> int:
+    """RSS actual (Linux); en otros sistemas, el máximo que reporta getrusage"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _linear_fit(points: List[Tuple[float, float]]) -> Tuple[float, float]:
+    """Pendiente (por segundo) y R² de la recta de mínimos cuadrados"""
+    n = len(points)
+    if n < 3:
+        return 0.0, 0.0
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    sxx = sum((x - mean_x) ** 2 for x, _ in points)
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    syy = sum((y - mean_y) ** 2 for _, y in points)
+    if sxx == 0:
+        return 0.0, 0.0
+    slope = sxy / sxx
+    r2 = (sxy * sxy) / (sxx * syy) if syy else 0.0
+    return slope, r2
+
+
+class SoakMonitor:
+    """Muestras periódicas de memoria, objetos, retraso del event loop y pausas del GC"""
+
+    def __init__(self, frames: int = 10, min_site_bytes: int = 16 * 1024, min_objects: int = 500,
+                 lag_interval: float = 0.05):
+        self.frames = frames
+        self.min_site_bytes = min_site_bytes
+        self.min_objects = min_objects
+        self.lag_interval = lag_interval
+        self.started = 0.0
+        self.samples: List[Dict] = []
+        # Series por clave: [(segundos desde el inicio, valor)]
+        self.sites: Dict[str, List[Tuple[float, float]]] = {}
+        self.types: Dict[str, List[Tuple[float, float]]] = {}
+        self.last_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._lags: List[float] = []
+        self._gc_pauses: List[Tuple[int, float]] = []
+        self._gc_started = 0.0
+        # Tiempo con el loop detenido por las propias muestras, que no cuenta como retraso ni como pausa del GC
+        self._sampling = False
+        self._sampling_total = 0.0
+        self._lag_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        tracemalloc.start(self.frames)
+        gc.callbacks.append(self._gc_callback)
+        self.started = time.monotonic()
+        self._lag_task = asyncio.create_task(self._measure_lag())
+
+    async def stop(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            await asyncio.gather(self._lag_task, return_exceptions=True)
+        if self._gc_callback in gc.callbacks:
+            gc.callbacks.remove(self._gc_callback)
+        tracemalloc.stop()
+
+    def _gc_callback(self, phase: str, info: Dict):
+        if self._sampling:
+            return
+        if phase == "start":
+            self._gc_started = time.perf_counter()
+        else:
+            self._gc_pauses.append((info["generation"], time.perf_counter() - self._gc_started))
+
+    async def _measure_lag(self):
+        while True:
+            start = time.perf_counter()
+            sampling_before = self._sampling_total
+            await asyncio.sleep(self.lag_interval)
+            elapsed = time.perf_counter() - start - (self._sampling_total - sampling_before)
+            self._lags.append(max(0.0, elapsed - self.lag_interval))
+
+    def sample(self, app: Dict) -> Dict:
+        """Toma una muestra; `app` son contadores del bot (conversaciones, historial...)"""
+        elapsed = time.monotonic() - self.started
+        sample_start = time.perf_counter()
+        self._sampling = True
+        gc.collect()  # Solo cuenta lo que sigue vivo
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(TRACE_FILTERS)
+        traced = 0
+        for stat in snapshot.statistics("lineno"):
+            traced += stat.size
+            if stat.size < self.min_site_bytes:
+                continue
+            frame = stat.traceback[0]
+            self.sites.setdefault(f"{frame.filename}:{frame.lineno}", []).append((elapsed, stat.size))
+        self.last_snapshot = snapshot
+
+        counts = Counter(type(obj).__qualname__ for obj in gc.get_objects())
+        for name, count in counts.items():
+            if count >= self.min_objects or name in self.types:
+                self.types.setdefault(name, []).append((elapsed, count))
+
+        self._sampling = False
+        sample_cost = time.perf_counter() - sample_start
+        self._sampling_total += sample_cost
+
+        lags, self._lags = self._lags, []
+        pauses, self._gc_pauses = self._gc_pauses, []
+        pauses_by_generation = {}
+        for generation in sorted({generation for generation, _ in pauses}):
+            durations = [duration for gen, duration in pauses if gen == generation]
+            pauses_by_generation[generation] = {
+                "count": len(durations),
+                "total_ms": round(sum(durations) * 1000, 2),
+                "max_ms": round(max(durations) * 1000, 3)
+            }
+        sample = {
+            "t_s": round(elapsed, 1),
+            "rss_mb": round(_rss_bytes() / 2 ** 20, 2),
+            "traced_mb": round(traced / 2 ** 20, 2),
+            "loop_lag_p99_ms": round(percentile(lags, 99) * 1000, 2),
+            "loop_lag_max_ms": round(max(lags, default=0.0) * 1000, 2),
+            "gc_pauses": pauses_by_generation,
+            "app": app,
+            "sample_cost_ms": round(sample_cost * 1000, 1)
+        }
+        self.samples.append(sample)
+        return sample
+
+    def _traceback(self, site: str) -> List[str]:
+        """Traceback más pesado de las asignaciones del sitio en el último snapshot"""
+        filename, _, lineno = site.rpartition(":")
+        snapshot = self.last_snapshot.filter_traces([tracemalloc.Filter(True, filename, int(lineno))])
+        stats = snapshot.statistics("traceback")
+        return stats[0].traceback.format(limit=self.frames) if stats else []
+
+    def report(self, warmup: float, growth_threshold: float, object_threshold: float, top: int) -> Dict:
+        """Tendencias después del calentamiento (fracción `warmup` de la corrida)"""
+        if not self.samples:
+            return {}
+        cutoff = self.samples[-1]["t_s"] * warmup
+
+        def _trends(series: Dict[str, List[Tuple[float, float]]], threshold: float) -> List[Dict]:
+            trends = []
+            for key, points in series.items():
+                points = [point for point in points if point[0] >= cutoff]
+                slope, r2 = _linear_fit(points)
+                per_hour = slope * 3600
+                if per_hour >= threshold and r2 >= 0.8:
+                    trends.append({
+                        "key": key,
+                        "growth_per_hour": round(per_hour),
+                        "r2": round(r2, 3),
+                        "first": points[0][1],
+                        "last": points[-1][1]
+                    })
+            return sorted(trends, key=lambda trend: trend["growth_per_hour"], reverse=True)[:top]
+
+        sites = _trends(self.sites, growth_threshold)
+        for trend in sites:
+            trend["traceback"] = self._traceback(trend["key"])
+        rss_points = [(s["t_s"], s["rss_mb"] * 2 ** 20) for s in self.samples if s["t_s"] >= cutoff]
+        rss_slope, rss_r2 = _linear_fit(rss_points)
+        app_trends = {}
+        for name in self.samples[-1]["app"]:
+            slope, r2 = _linear_fit([(s["t_s"], s["app"][name]) for s in self.samples if s["t_s"] >= cutoff])
+            app_trends[name] = {"growth_per_hour": round(slope * 3600, 1), "r2": round(r2, 3)}
+        lags = [s["loop_lag_max_ms"] for s in self.samples]
+        return {
+            "rss_growth_mb_per_hour": round(rss_slope * 3600 / 2 ** 20, 2),
+            "rss_r2": round(rss_r2, 3),
+            "growing_sites": sites,
+            "growing_types": _trends(self.types, object_threshold),
+            "app_trends": app_trends,
+            "loop_lag_max_ms": max(lags, default=0.0),
+            "gc_pause_max_ms": max(
+                (pause["max_ms"] for s in self.samples for pause in s["gc_pauses"].values()), default=0.0
+            )
+        }
+
+
+def _app_stats(conversation_manager) -> Dict:
+    conversations = conversation_manager.conversations
+    return {
+        "conversations": len(conversations),
+        "history_messages": sum(len(conv['history']) for conv in conversations.values()),
+        "pending_sync": len(conversation_manager.pending_sync),
+        "sync_queue": conversation_manager.sync_queue.qsize(),
+        "asyncio_tasks": len(asyncio.all_tasks())
+    }
+
+
+async def drive_traffic(bot: TelegramBot, conversation_manager, args, stop_at: float, stats: Counter):
+    """Llegadas Poisson de mensajes: usuarios nuevos, diálogos en curso y algunos /reset"""
+    rng = random.Random(args.seed)
+    dialogs: Dict[str, List[str]] = {}
+    busy: set = set()
+    next_user = 0
+    semaphore = asyncio.Semaphore(args.max_inflight)
+    tasks: set = set()
+
+    async def _turn(telegram_id: str):
+        current_lead.set(telegram_id)
+        try:
+            if dialogs[telegram_id] == ["/reset"]:
+                await conversation_manager.reset_conversation(telegram_id)
+                dialogs.pop(telegram_id)
+                stats["resets"] += 1
+            else:
+                await bot._process(telegram_id, dialogs[telegram_id].pop(0), bot._new_deadline())
+                stats["turns"] += 1
+                if not dialogs[telegram_id]:
+                    dialogs.pop(telegram_id)
+                    stats["completed_dialogs"] += 1
+        except Exception:
+            stats["errors"] += 1
+        finally:
+            busy.discard(telegram_id)
+            semaphore.release()
+
+    while time.monotonic() < stop_at:
+        await asyncio.sleep(rng.expovariate(args.rate))
+        idle = [telegram_id for telegram_id in dialogs if telegram_id not in busy]
+        if not idle or rng.random() < args.new_user_ratio:
+            telegram_id = f"soak-{next_user}"
+            dialog = build_dialog(assign_family(next_user), next_user, rng)
+            if rng.random() < args.reset_ratio:
+                # Abandona a mitad del diálogo con /reset
+                dialog = dialog[:rng.randint(1, len(dialog) - 1)] + ["/reset"]
+            dialogs[telegram_id] = dialog
+            next_user += 1
+        else:
+            telegram_id = rng.choice(idle)
+        if semaphore.locked():
+            stats["dropped_overload"] += 1
+            continue
+        await semaphore.acquire()
+        busy.add(telegram_id)
+        task = asyncio.create_task(_turn(telegram_id))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def main_async(args) -> Dict:
+    setup_logging(level="ERROR", mode="sync")
+    conversation_manager, _, _ = build_stub_stack(args.llm_latency, args.crm_latency, args.seed)
+    crm_server = None
+    if args.crm == "http":
+        crm_server = StubHubSpotServer(LatencyModel(args.crm_latency, random.Random(args.seed)))
+        hubspot_manager = HubSpotManager("soak-token")
+        hubspot_manager.base_url = await crm_server.start()
+        conversation_manager.hubspot = hubspot_manager
+    journal_dir = None
+    if args.journal:
+        journal_dir = tempfile.TemporaryDirectory(prefix="soak-journal-")
+        conversation_manager.journal = LeadJournal(journal_dir.name, fsync=False)
+    await conversation_manager.start_background_tasks()
+    bot = TelegramBot("123456:soak", conversation_manager)
+
+    monitor = SoakMonitor(frames=args.frames)
+    monitor.start()
+    stats: Counter = Counter()
+    stop_at = time.monotonic() + args.duration
+    traffic = asyncio.create_task(drive_traffic(bot, conversation_manager, args, stop_at, stats))
+    while not traffic.done():
+        await asyncio.wait([traffic], timeout=args.sample_interval)
+        sample = monitor.sample(_app_stats(conversation_manager))
+        print(f"t={sample['t_s']:>7.0f}s rss={sample['rss_mb']}MB traced={sample['traced_mb']}MB "
+              f"lag p99={sample['loop_lag_p99_ms']}ms máx={sample['loop_lag_max_ms']}ms "
+              f"conversaciones={sample['app']['conversations']} turnos={stats['turns']} "
+              f"muestra={sample['sample_cost_ms']}ms")
+    report = monitor.report(args.warmup, args.growth_threshold, args.object_threshold, args.top)
+    await monitor.stop()
+    await conversation_manager.stop_background_tasks()
+    if crm_server is not None:
+        await crm_server.stop()
+    if journal_dir is not None:
+        journal_dir.cleanup()
+
+    print(f"RSS: {report['rss_growth_mb_per_hour']} MB/h (R²={report['rss_r2']})")
+    for trend in report["growing_sites"]:
+        print(f"  +{trend['growth_per_hour'] / 2 ** 20:.2f} MB/h R²={trend['r2']} {trend['key']}")
+    for trend in report["growing_types"]:
+        print(f"  +{trend['growth_per_hour']} objetos/h R²={trend['r2']} {trend['key']}")
+    print(f"estructuras del bot (por hora): {report['app_trends']}")
+    print(f"lag máx. del loop={report['loop_lag_max_ms']}ms pausa máx. del GC={report['gc_pause_max_ms']}ms "
+          f"tráfico={dict(stats)}")
+    return {"config": vars(args), "traffic": dict(stats), "samples": monitor.samples, "report": report}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=3600, help="Segundos de tráfico")
+    parser.add_argument("--rate", type=float, default=20.0, help="Mensajes por segundo")
+    parser.add_argument("--new-user-ratio", type=float, default=0.15,
+                        help="Proporción de mensajes que inician la conversación de un usuario nuevo")
+    parser.add_argument("--reset-ratio", type=float, default=0.05, help="Usuarios nuevos que terminan con /reset")
+    parser.add_argument("--max-inflight", type=int, default=200)
+    parser.add_argument("--sample-interval", type=float, default=60.0)
+    parser.add_argument("--frames", type=int, default=10, help="Profundidad de traceback de tracemalloc")
+    parser.add_argument("--warmup", type=float, default=0.2, help="Fracción inicial excluida de las tendencias")
+    parser.add_argument("--growth-threshold", type=float, default=1024 * 1024,
+                        help="Bytes por hora a partir de los que un sitio se marca como creciente")
+    parser.add_argument("--object-threshold", type=float, default=10000,
+                        help="Objetos por hora a partir de los que un tipo se marca como creciente")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--crm", choices=["stub", "http"], default="stub")
+    parser.add_argument("--journal", action="store_true")
+    parser.add_argument("--llm-latency", default="lognormal:0.35:0.4")
+    parser.add_argument("--crm-latency", default="lognormal:0.15:0.3")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args(argv)
+    results = asyncio.run(main_async(args))
+    path = write_results("soak", results, args.output)
+    print(f"Resultados escritos en {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+"""
+Stand-ins locales de Groq y HubSpot para reproducir conversaciones sin red
+"""
+
+import asyncio
+import json
+import re
+import sys
+import os
+import random
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Set, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import LatencyModel
+from conversation import ConversationManager
+from hubspot import HubSpotManager
+from inventory import InventoryManager
+from llm import LLMManager, EXTRACTION_PROMPTS
+from batching import BATCH_PROMPT_HEADER
+
+# Lead (telegram_id) al que se atribuyen las llamadas simuladas; el arnés lo fija por usuario
+current_lead: ContextVar[Optional[str]] = ContextVar("current_lead", default=None)
+
+EQUIPMENT_KEYWORDS = [
+    "torre de iluminacion", "soldadora", "compresor", "lgmg",
+    "generador", "rompedor", "retroexcavadora", "minicargador"
+]
+EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.]+")
+PHONE_RE = re.compile(r"\+?\d[\d\s-]{7,}\d")
+NAME_RE = re.compile(r"(?i:me llamo|mi nombre es|soy)\s+([A-ZÁÉÍÓÚÑ][a-záéíóúñ]+(?:\s+[A-ZÁÉÍÓÚÑ][a-záéíóúñ]+)?)")
+COMPANY_RE = re.compile(r"(?:mi empresa es|trabajo en)\s+([\w&.-]+)", re.IGNORECASE)
+BUSINESS_RE = re.compile(r"giro\s+(?:de\s+)?([\w\s]+?)(?:,|\.|$)", re.IGNORECASE)
+
+
+def _estimate_tokens(text: str) -> int:
+    """Aproximación de tokens (~4 caracteres por token)"""
+    return max(1, len(text) // 4)
+
+
+def rule_based_extract(field_type: str, message: str):
+    """Extracción determinista que imita la respuesta del LLM para cada tipo de campo"""
+    lowered = message.lower()
+    if field_type == "name":
+        match = NAME_RE.search(message)
+        return match.group(1) if match else None
+    if field_type == "equipment":
+        return next((keyword for keyword in EQUIPMENT_KEYWORDS if keyword in lowered), None)
+    if field_type == "email":
+        match = EMAIL_RE.search(message)
+        return match.group(0) if match else None
+    if field_type == "phone":
+        match = PHONE_RE.search(message)
+        return match.group(0).strip() if match else None
+    if field_type == "company_name":
+        match = COMPANY_RE.search(message)
+        return match.group(1).strip(",.") if match else None
+    if field_type == "company_business":
+        match = BUSINESS_RE.search(message)
+        return match.group(1).strip() if match else None
+    if field_type == "is_distributor":
+        if "distribuidor" in lowered or "revend" in lowered:
+            return True
+        if "uso de la empresa" in lowered or "uso propio" in lowered:
+            return False
+        return None
+    if field_type == "use_type":
+        if "distribuidor" in lowered or "revend" in lowered or "venta" in lowered:
+            return "venta"
+        if "uso de la empresa" in lowered or "uso propio" in lowered:
+            return "uso_empresa"
+        return None
+    return None
+
+
+class _FakeCompletions:
+    def __init__(self, owner: "FakeGroqClient"):
+        self.owner = owner
+
+    async def create(self, model: str, messages: List[Dict], max_tokens: int = 100,
+                     temperature: float = 0.0, **kwargs):
+        return await self.owner.complete(messages)
+
+
+class FakeGroqClient:
+    """Sustituto de AsyncGroq con latencia configurable y respuestas deterministas"""
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=_FakeCompletions(self))
+        self.calls_by_lead: Counter = Counter()
+        self.calls_by_kind: Counter = Counter()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.batch_error_rate = 0.0  # Proporción de respuestas de batch malformadas
+        self.rng = random.Random(0)
+
+    def _classify(self, messages: List[Dict]) -> Tuple[str, str]:
+        """Identifica el tipo de llamada: respuesta conversacional, cotización o campo"""
+        first = messages[0]["content"]
+        if messages[0]["role"] == "system":
+            state = re.search(r"Estado: ([^\n]+)", first)
+            return "response", state.group(1) if state else "BASE"
+        if first.startswith("Extrae los siguientes datos de cotización"):
+            return "quotation", ""
+        if first.startswith(BATCH_PROMPT_HEADER):
+            instruction = first.split("Instrucción: ", 1)[1]
+            for field_type, prompt in EXTRACTION_PROMPTS.items():
+                if instruction.startswith(prompt):
+                    return "field_batch", field_type
+        for field_type, prompt in EXTRACTION_PROMPTS.items():
+            if first.startswith(prompt):
+                return "field", field_type
+        return "unknown", ""
+
+    def _content(self, kind: str, detail: str, messages: List[Dict]) -> str:
+        user_message = messages[-1]["content"]
+        if kind == "response":
+            return f"Respuesta simulada ({detail})"
+        message = user_message.rsplit("Mensaje: ", 1)[-1]
+        if kind == "quotation":
+            data = {
+                field: rule_based_extract(field, message)
+                for field in ("use_type", "name", "company_name", "company_business", "email", "phone")
+            }
+            return json.dumps(data, ensure_ascii=False)
+        if kind == "field":
+            return json.dumps({"value": rule_based_extract(detail, message)}, ensure_ascii=False)
+        if kind == "field_batch":
+            if self.rng.random() < self.batch_error_rate:
+                return "No pude procesar la lista"
+            items = json.loads(user_message.split("Mensajes: ", 1)[1])
+            return json.dumps([
+                {"id": item["id"], "value": rule_based_extract(detail, item["mensaje"])} for item in items
+            ], ensure_ascii=False)
+        return json.dumps({"value": None})
+
+    async def complete(self, messages: List[Dict]):
+        await self.latency.wait()
+        kind, detail = self._classify(messages)
+        content = self._content(kind, detail, messages)
+        prompt_tokens = sum(_estimate_tokens(m["content"]) for m in messages)
+        completion_tokens = _estimate_tokens(content)
+        self.calls_by_lead[current_lead.get()] += 1
+        self.calls_by_kind[f"{kind}:{detail}" if detail else kind] += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens
+            )
+        )
+
+
+class StubHubSpotManager(HubSpotManager):
+    """HubSpotManager con las llamadas HTTP sustituidas por un almacén en memoria"""
+
+    def __init__(self, latency: LatencyModel, optional_properties: Optional[List[str]] = None):
+        super().__init__("bench-token", optional_properties)
+        self.latency = latency
+        self.contacts: Dict[str, Dict] = {}
+        self.calls_by_lead: Counter = Counter()
+        self.calls_by_kind: Counter = Counter()
+        self._next_id = 1
+
+    def _record(self, kind: str):
+        self.calls_by_lead[current_lead.get()] += 1
+        self.calls_by_kind[kind] += 1
+
+    async def _create_contact(self, properties: Dict) -> Optional[str]:
+        await self.latency.wait()
+        self._record("create")
+        contact_id = str(self._next_id)
+        self._next_id += 1
+        self.contacts[contact_id] = dict(properties)
+        return contact_id
+
+    async def _update_contact(self, contact_id: str, properties: Dict) -> Optional[str]:
+        await self.latency.wait()
+        self._record("update")
+        if contact_id not in self.contacts:
+            return None
+        self.contacts[contact_id].update(properties)
+        return contact_id
+
+    async def _batch_update(self, inputs: List[Dict]) -> Set[str]:
+        await self.latency.wait()
+        self.calls_by_kind["batch_update"] += 1
+        for item in inputs:
+            self.contacts.setdefault(item["id"], {}).update(item["properties"])
+        return {item["id"] for item in inputs}
+
+    async def _find_contact_by_telegram_id(self, telegram_id: str) -> Optional[str]:
+        await self.latency.wait()
+        self._record("search")
+        for contact_id, properties in self.contacts.items():
+            if properties.get("telegram_id") == telegram_id:
+                return contact_id
+        return None
+
+
+def build_stub_stack(llm_latency: str, crm_latency: str,
+                     seed: Optional[int] = None) -> Tuple[ConversationManager, FakeGroqClient, StubHubSpotManager]:
+    """Construye un ConversationManager completo sobre los stand-ins locales"""
+    rng = random.Random(seed)
+    fake_groq = FakeGroqClient(LatencyModel(llm_latency, rng))
+    llm_manager = LLMManager("bench-key")
+    llm_manager.client = fake_groq
+    hubspot_manager = StubHubSpotManager(LatencyModel(crm_latency, rng))
+    conversation_manager = ConversationManager(InventoryManager(), hubspot_manager, llm_manager)
+    return conversation_manager, fake_groq, hubspot_manager
+
+
+
+async def serve_json(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, handler):
+    """Atiende solicitudes HTTP/1.1 con cuerpo JSON en una conexión (keep-alive).
+
+    `handler(método, ruta, payload)` devuelve (status, respuesta JSON).
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            method, path = request_line.decode("latin-1").split(" ")[:2]
+            length = 0
+            while True:
+                header = await reader.readline()
+                if header in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = header.decode("latin-1").partition(":")
+                if name.strip().lower() == "content-length":
+                    length = int(value.strip())
+            payload = json.loads(await reader.readexactly(length)) if length else {}
+            status, response = await handler(method, path, payload)
+            body = json.dumps(response, ensure_ascii=False).encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+class StubHubSpotServer:
+    """API de contactos de HubSpot en memoria servida por HTTP local, para ejercitar HubSpotManager
+    completo (clientes httpx incluidos) sin red"""
+
+    def __init__(self, latency: LatencyModel):
+        self.latency = latency
+        self.contacts: Dict[str, Dict] = {}
+        self.requests: Counter = Counter()
+        self._next_id = 1
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self) -> str:
+        self._server = await asyncio.start_server(
+            lambda reader, writer: serve_json(reader, writer, self._handle), "127.0.0.1", 0
+        )
+        port = self._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, method: str, path: str, payload: Dict):
+        await self.latency.wait()
+        if path.endswith("/contacts/search"):
+            self.requests["search"] += 1
+            value = payload["filterGroups"][0]["filters"][0]["value"]
+            results = [
+                {"id": contact_id} for contact_id, properties in self.contacts.items()
+                if properties.get("telegram_id") == value
+            ]
+            return 200, {"results": results[:1]}
+        if path.endswith("/contacts/batch/update"):
+            self.requests["batch_update"] += 1
+            for item in payload["inputs"]:
+                self.contacts.setdefault(item["id"], {}).update(item["properties"])
+            return 200, {"results": [{"id": item["id"]} for item in payload["inputs"]]}
+        if method == "PATCH":
+            self.requests["update"] += 1
+            contact_id = path.rsplit("/", 1)[1]
+            if contact_id not in self.contacts:
+                return 404, {"message": "not found"}
+            self.contacts[contact_id].update(payload["properties"])
+            return 200, {"id": contact_id}
+        self.requests["create"] += 1
+        contact_id = str(self._next_id)
+        self._next_id += 1
+        self.contacts[contact_id] = dict(payload["properties"])
+        return 201, {"id": contact_id}
+
+
+class _Sequence:
+    """Solicitud en el servidor simulado: tokens por evaluar y por generar"""
+
+    def __init__(self, prompt: str, prompt_tokens: int, decode_tokens: int):
+        self.prompt = prompt
+        self.prompt_tokens = prompt_tokens
+        self.decode_tokens = decode_tokens
+        self.cached_tokens = 0
+        self.slot = -1
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class SimulatedLlamaServer:
+    """Servidor HTTP local que imita `llama-server` de llama.cpp en CPU (API /v1/chat/completions).
+
+    Modelo de costo: `parallel` slots con batching continuo; cada paso de decodificación genera un
+    token para todas las secuencias activas y tarda `step_base + step_per_seq × activas`. Una
+    secuencia que entra a un slot evalúa en ese paso, a `prefill_tps`, los tokens de su prompt que
+    no están en caché (si `cache_prompt`): el prefijo común más largo con el prompt anterior de
+    algún slot o con los `cache_entries` prompts más recientes (la caché en RAM de llama-server).
+    Las respuestas conversacionales generan `response_tokens` tokens; el contenido sale de
+    FakeGroqClient para que el flujo de la conversación sea el mismo que con el stub remoto.
+    """
+
+    def __init__(self, parallel: int = 4, prefill_tps: float = 400.0, step_base: float = 0.025,
+                 step_per_seq: float = 0.005, response_tokens: int = 40, cache_entries: int = 32):
+        self.parallel = parallel
+        self.prefill_tps = prefill_tps
+        self.step_base = step_base
+        self.step_per_seq = step_per_seq
+        self.response_tokens = response_tokens
+        self.content = FakeGroqClient(LatencyModel("0"))
+        self.slot_prompts: List[str] = [""] * parallel
+        self.prompt_cache: deque = deque(maxlen=cache_entries)
+        self.free_slots = list(range(parallel))
+        self.waiting: deque = deque()
+        self.active: List[_Sequence] = []
+        self.steps = 0
+        self.batched_sequences = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.requests = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._scheduler: Optional[asyncio.Task] = None
+
+    async def start(self) -> str:
+        """Inicia el servidor en un puerto libre y devuelve su URL"""
+        self._wakeup = asyncio.Event()
+        self._scheduler = asyncio.create_task(self._run_scheduler())
+        self._server = await asyncio.start_server(self._handle_connection, "127.0.0.1", 0)
+        port = self._server.sockets[0].getsockname()[1]
+        return f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.batched_sequences / self.steps if self.steps else 0.0
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def _handler(method: str, path: str, payload: Dict):
+            return 200, await self.complete(payload)
+        await serve_json(reader, writer, _handler)
+
+    async def complete(self, payload: Dict) -> Dict:
+        messages = payload["messages"]
+        kind, detail = self.content._classify(messages)
+        content = self.content._content(kind, detail, messages)
+        prompt = "".join(f"<{m['role']}>{m['content']}" for m in messages)
+        decode_tokens = self.response_tokens if kind == "response" else _estimate_tokens(content)
+        decode_tokens = min(decode_tokens, payload.get("max_tokens") or decode_tokens)
+        sequence = _Sequence(prompt, _estimate_tokens(prompt), decode_tokens)
+        if not payload.get("cache_prompt", False):
+            sequence.prompt = ""
+        self.waiting.append(sequence)
+        self._wakeup.set()
+        await sequence.future
+        self.requests += 1
+        self.prompt_tokens += sequence.prompt_tokens
+        self.cached_tokens += sequence.cached_tokens
+        return {
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": sequence.prompt_tokens, "completion_tokens": _estimate_tokens(content)},
+            "timings": {"prompt_n": sequence.prompt_tokens - sequence.cached_tokens, "predicted_n": decode_tokens}
+        }
+
+    def _admit(self) -> int:
+        """Asigna slots libres a las solicitudes en espera; devuelve los tokens a evaluar en este paso"""
+        prefill = 0
+        while self.waiting and self.free_slots:
+            sequence = self.waiting.popleft()
+            # Como llama-server: el slot libre cuyo prompt anterior comparte más prefijo
+            slot = max(self.free_slots,
+                       key=lambda index: len(os.path.commonprefix([self.slot_prompts[index], sequence.prompt])))
+            self.free_slots.remove(slot)
+            if sequence.prompt:
+                common = max(
+                    (len(os.path.commonprefix([cached, sequence.prompt]))
+                     for cached in [self.slot_prompts[slot], *self.prompt_cache]),
+                    default=0
+                )
+                sequence.cached_tokens = min(common // 4, sequence.prompt_tokens - 1)
+                self.prompt_cache.append(sequence.prompt)
+            self.slot_prompts[slot] = sequence.prompt
+            sequence.slot = slot
+            prefill += sequence.prompt_tokens - sequence.cached_tokens
+            self.active.append(sequence)
+        return prefill
+
+    async def _run_scheduler(self):
+        while True:
+            prefill = self._admit()
+            if not self.active:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            await asyncio.sleep(self.step_base + self.step_per_seq * len(self.active) + prefill / self.prefill_tps)
+            self.steps += 1
+            self.batched_sequences += len(self.active)
+            still_active = []
+            for sequence in self.active:
+                sequence.decode_tokens -= 1
+                if sequence.decode_tokens > 0:
+                    still_active.append(sequence)
+                    continue
+                self.free_slots.append(sequence.slot)
+                if not sequence.future.done():
+                    sequence.future.set_result(None)
+            self.active = still_active
+
+
+# Transcripción simulada: ocupa la CPU del worker `rtf` segundos por segundo de audio
+_synthetic_rtf = 0.1
+
+
+def synthetic_speech_init(rtf: float):
+    """Inicializador de los workers del pool de transcripción simulado"""
+    global _synthetic_rtf
+    _synthetic_rtf = rtf
+
+
+def synthetic_audio(duration: float) -> bytes:
+    """Clip simulado: PCM de 16 bits a 16 kHz en silencio"""
+    return bytes(int(duration * 16000) * 2)
+
+
+def synthetic_transcribe(audio: bytes, max_duration: float, language: str) -> Tuple[str, float]:
+    """Sustituto de speech.transcribe_clip que consume CPU en proporción a la duración del clip"""
+    duration = min(len(audio) / (16000 * 2), max_duration)
+    deadline = time.process_time() + duration * _synthetic_rtf
+    while time.process_time() < deadline:
+        pass
+    return f"Busco un generador ({duration:.1f} s de audio)", duration
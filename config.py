@@ -4,30 +4,129 @@ Configuración del chatbot
 
 import os
 import logging
-from dotenv import load_dotenv
 
-# Cargar variables de entorno
-load_dotenv()
-
-# Configuración de logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
-# Configuración desde variables de entorno
-TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
-GROQ_API_KEY = os.getenv('GROQ_API_KEY')
-HUBSPOT_ACCESS_TOKEN = os.getenv('HUBSPOT_ACCESS_TOKEN')
+
+def _bool(value: str) -> bool:
+    return str(value).lower() == 'true'
+
+
+# Configuración desde variables de entorno: nombre -> (conversión, valor por defecto).
+# Se leen al primer acceso (PEP 562) para que load_environment() pueda cargar el .env antes
+# y para que importar este módulo no tenga efectos secundarios.
+_SETTINGS = {
+    'TELEGRAM_BOT_TOKEN': (str, None),
+    'GROQ_API_KEY': (str, None),
+    'HUBSPOT_ACCESS_TOKEN': (str, None),
+
+    # Endpoint de métricas estilo Prometheus, sin autenticación: solo en loopback salvo que se configure
+    # otra interfaz (METRICS_PORT=0 lo deshabilita; 9100 es el de node_exporter)
+    'METRICS_HOST': (str, '127.0.0.1'),
+    'METRICS_PORT': (int, '9464'),
+
+    # Presupuesto de tiempo por update, repartido entre extracción, CRM y respuesta (0 lo deshabilita)
+    'TURN_DEADLINE_SECONDS': (float, '8'),
+
+    # Backend del LLM: 'groq' o 'local' (servidor llama.cpp con modelo GGUF en CPU) y reglas por tarea,
+    # p. ej. LLM_TASK_BACKENDS='extract*=local' extrae en local y responde con Groq
+    'LLM_BACKEND': (str, 'groq'),
+    'LLM_TASK_BACKENDS': (str, ''),
+    'LOCAL_LLM_URL': (str, 'http://127.0.0.1:8080'),
+    'LOCAL_LLM_MODEL': (str, 'local'),
+    'LOCAL_LLM_PARALLEL': (int, '4'),
+    'LOCAL_LLM_TIMEOUT': (float, '60'),
+
+    # Extracción de datos de cotización: extractores por campo en paralelo (opt-in: hasta
+    # EXTRACTION_MAX_CONCURRENCY llamadas extra al LLM por mensaje; PARALLEL_FIELD_EXTRACTION=true lo habilita)
+    'PARALLEL_FIELD_EXTRACTION': (_bool, 'false'),
+    'EXTRACTION_MAX_CONCURRENCY': (int, '4'),
+    'EXTRACTION_MIN_CONFIDENCE': (float, '0.5'),
+    # Unidades disponibles más cercanas a la ciudad del usuario que se incluyen en el prompt (0 lo deshabilita)
+    'NEAREST_INVENTORY_LIMIT': (int, '3'),
+    # Respuestas de plantilla en turnos deterministas (opt-in: REPLY_TEMPLATES=true deja el LLM solo para
+    # preguntas fuera de guion)
+    'REPLY_TEMPLATES': (_bool, 'false'),
+    # Pre-generación especulativa de respuestas del LLM, con tope de tokens desperdiciados por hora
+    # (opt-in: SPECULATIVE_REPLIES=true la habilita)
+    'SPECULATIVE_REPLIES': (_bool, 'false'),
+    'SPECULATION_WASTE_TOKEN_BUDGET': (int, '50000'),
+    # Micro-batching de extract_field entre usuarios (opt-in: 0 lo deshabilita; p. ej. 5 agrupa por 5 ms)
+    'EXTRACTION_BATCH_WINDOW_MS': (float, '0'),
+    'EXTRACTION_BATCH_MAX': (int, '20'),
+
+    # Journal local de leads (JOURNAL_DIR vacío lo deshabilita) y reintentos de sincronización con HubSpot
+    'JOURNAL_DIR': (str, 'data/journal'),
+    'JOURNAL_SEGMENT_MAX_BYTES': (int, str(64 * 1024 * 1024)),
+    'JOURNAL_COMPACT_INTERVAL': (float, '3600'),
+    'HUBSPOT_SYNC_RETRY_DELAY': (float, '30'),
+    # Límite de /reset por usuario: reinicios por segundo y ráfaga permitida
+    'RESET_USER_RATE': (float, '0.05'),
+    'RESET_USER_BURST': (float, '3'),
+
+    # Exportación de conversaciones terminadas a Parquet (ANALYTICS_DIR vacío lo deshabilita)
+    'ANALYTICS_DIR': (str, 'data/analytics'),
+    'ANALYTICS_BATCH_SIZE': (int, '5000'),
+    'ANALYTICS_FLUSH_INTERVAL': (float, '60'),
+    'ANALYTICS_IDLE_TIMEOUT': (float, '86400'),
+
+    # Notas de voz: transcripción local con faster-whisper (SPEECH_WORKERS=0 lo deshabilita;
+    # SPEECH_CPU_THREADS=0 reparte los núcleos entre los workers)
+    'SPEECH_WORKERS': (int, '2'),
+    'SPEECH_MODEL': (str, 'base'),
+    'SPEECH_QUEUE_SIZE': (int, '8'),
+    'SPEECH_MAX_DURATION': (float, '60'),
+    'SPEECH_CPU_THREADS': (int, '0'),
+    'SPEECH_LANGUAGE': (str, 'es'),
+
+    # Control de admisión de updates (ADMISSION_WORKERS=0 lo deshabilita y procesa en orden de llegada)
+    'ADMISSION_WORKERS': (int, '8'),
+    'ADMISSION_QUEUE_SIZE': (int, '100'),
+    'ADMISSION_SHED_DEPTH': (int, '50'),
+    'ADMISSION_USER_RATE': (float, '0.5'),
+    'ADMISSION_USER_BURST': (float, '3'),
+}
+
+
+def __getattr__(name: str):
+    if name in _SETTINGS:
+        convert, default = _SETTINGS[name]
+        raw = os.getenv(name, default)
+        value = convert(raw) if raw is not None else None
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def load_environment():
+    """Carga el .env y configura el logging; debe llamarse al arrancar, antes de leer la configuración"""
+    from dotenv import load_dotenv
+    from logging_config import setup_logging
+
+    # Cargar variables de entorno
+    load_dotenv()
+    for name in _SETTINGS:
+        globals().pop(name, None)
+
+    # Configuración de logging (LOG_MODE=queue: handler en cola que no bloquea el event loop)
+    setup_logging(
+        level=os.getenv('LOG_LEVEL', 'INFO'),
+        module_levels=os.getenv('LOG_LEVELS', ''),
+        sample_rate=float(os.getenv('LOG_SAMPLE_RATE', '1.0')),
+        mode=os.getenv('LOG_MODE', 'queue'),
+        redact=os.getenv('LOG_REDACT_PII', 'true').lower() == 'true'
+    )
 
 def validate_environment():
     """Valida que todas las variables de entorno requeridas estén presentes"""
     required_vars = ['TELEGRAM_BOT_TOKEN', 'GROQ_API_KEY', 'HUBSPOT_ACCESS_TOKEN']
+    # Sin Groq en ninguna tarea (todo en el servidor local) no hace falta su API key
+    if os.getenv('LLM_BACKEND', 'groq') != 'groq' and 'groq' not in os.getenv('LLM_TASK_BACKENDS', ''):
+        required_vars.remove('GROQ_API_KEY')
     missing_vars = [var for var in required_vars if not os.getenv(var)]
     
     if missing_vars:
-        logger.error(f"Variables de entorno faltantes: {missing_vars}")
+        logger.error("Variables de entorno faltantes: %s", missing_vars)
         return False
     
-    return True 
\ No newline at end of file
+    return True 
@@ -2,45 +2,280 @@
 Gestión de conversaciones del chatbot
 """
 
+import asyncio
+import logging
+import time
+import weakref
 from datetime import datetime
-from typing import Dict
-from models import Lead, ConversationState
+from typing import Dict, Optional, Set, List
+from models import Lead, ConversationState, characteristic_description, equipment_question_count
 from inventory import InventoryManager
 from hubspot import HubSpotManager
-from llm import LLMManager
-from config import logger
+from llm import LLMManager, QUOTATION_FIELDS
+from journal import LeadJournal
+from analytics import ConversationExporter
+from replies import ReplyPlanner
+from speculation import ReplySpeculator, Speculation
+from tracing import span
+from metrics import REGISTRY
+from ratelimit import KeyedTokenBuckets
+from deadline import Deadline, DeadlineExceeded, deadline_scope, within
+from location import extract_user_place
+from config import (
+    NEAREST_INVENTORY_LIMIT,
+    PARALLEL_FIELD_EXTRACTION,
+    EXTRACTION_MAX_CONCURRENCY,
+    EXTRACTION_MIN_CONFIDENCE,
+    HUBSPOT_SYNC_RETRY_DELAY,
+    RESET_USER_RATE,
+    RESET_USER_BURST,
+    JOURNAL_COMPACT_INTERVAL,
+    ANALYTICS_FLUSH_INTERVAL,
+    ANALYTICS_IDLE_TIMEOUT
+)
+
+logger = logging.getLogger(__name__)
+
+RESETS = REGISTRY.counter("chatbot_resets_total", "Comandos /reset por resultado", ["outcome"])
+CONVERSATIONS_EVICTED = REGISTRY.counter(
+    "chatbot_conversations_evicted_total", "Conversaciones exportadas e inactivas sacadas de memoria"
+)
 
 class ConversationManager:
     def __init__(self, inventory_manager: InventoryManager, 
                  hubspot_manager: HubSpotManager,
-                 llm_manager: LLMManager):
+                 llm_manager: LLMManager,
+                 journal: Optional[LeadJournal] = None,
+                 exporter: Optional[ConversationExporter] = None,
+                 reply_planner: Optional[ReplyPlanner] = None,
+                 speculator: Optional[ReplySpeculator] = None):
         self.inventory = inventory_manager
         self.hubspot = hubspot_manager
         self.llm = llm_manager
+        self.journal = journal
+        self.exporter = exporter
+        self.reply_planner = reply_planner
+        self.speculator = speculator
         self.conversations: Dict[str, Dict] = {}
+        # Leads cuya sincronización con HubSpot falló y se reintentará en segundo plano
+        self.pending_sync: Set[str] = set()
+        self.sync_queue: asyncio.Queue = asyncio.Queue()
+        # Leads anteriores a un /reset que aún no se sincronizaron, por clave de archivo
+        self.archived_leads: Dict[str, Lead] = {}
+        self._sync_tasks: Set[asyncio.Task] = set()
+        self._background_tasks: List[asyncio.Task] = []
+        # Límite de /reset por usuario (evita tormentas de reinicios)
+        self.reset_limiter = KeyedTokenBuckets(RESET_USER_RATE, RESET_USER_BURST)
+        # Un lock por usuario: turnos, respuestas de respaldo y /reset no se intercalan sobre la
+        # misma conversación (el lock desaparece cuando nadie lo tiene ni lo espera)
+        self._user_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+    
+    async def start_background_tasks(self):
+        """Arranca las tareas de fondo una vez que el event loop está corriendo"""
+        if not self.inventory.ready.is_set():
+            self.inventory.start_background_load()
+        if self.journal is not None:
+            await self.restore_from_journal()
+            await self.journal.start()
+            if JOURNAL_COMPACT_INTERVAL:
+                self._background_tasks.append(
+                    asyncio.create_task(self.journal.compact_periodically(JOURNAL_COMPACT_INTERVAL))
+                )
+        self._background_tasks.append(asyncio.create_task(self._sync_retry_worker()))
+        if self.exporter is not None:
+            self._background_tasks.append(
+                asyncio.create_task(self.exporter.run_periodic_flush(ANALYTICS_FLUSH_INTERVAL))
+            )
+            self._background_tasks.append(asyncio.create_task(self._export_idle_periodically()))
+    
+    async def stop_background_tasks(self):
+        """Detiene las tareas de fondo, espera las sincronizaciones en curso y cierra el journal"""
+        for task in self._background_tasks:
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        self._background_tasks = []
+        if self._sync_tasks:
+            await asyncio.gather(*self._sync_tasks, return_exceptions=True)
+        if self.exporter is not None:
+            await self.exporter.flush()
+        if self.journal is not None:
+            await self.journal.stop()
+    
+    def _new_conversation(self, lead: Lead) -> Dict:
+        return {
+            'state': ConversationState.INITIAL,
+            'lead': lead,
+            'history': [],
+            'inventory_results': [],
+            'field_confidence': {},
+            'turns': 0,
+            'last_activity': time.time(),
+            'exported': None,  # ended_reason del último registro de analítica
+            'exported_activity': None  # last_activity al exportarlo
+        }
     
     def get_conversation(self, telegram_id: str) -> Dict:
         """Obtiene o crea una conversación"""
         if telegram_id not in self.conversations:
-            self.conversations[telegram_id] = {
-                'state': ConversationState.INITIAL,
-                'lead': Lead(telegram_id=telegram_id, created_at=datetime.now().isoformat()),
-                'history': [],
-                'inventory_results': []
-            }
+            self.conversations[telegram_id] = self._new_conversation(
+                Lead(telegram_id=telegram_id, created_at=datetime.now().isoformat())
+            )
         return self.conversations[telegram_id]
     
-    async def process_message(self, telegram_id: str, message: str) -> str:
-        """Procesa un mensaje y genera respuesta"""
+    def _user_lock(self, telegram_id: str) -> asyncio.Lock:
+        return self._user_locks.setdefault(telegram_id, asyncio.Lock())
+    
+    def _is_busy(self, telegram_id: str) -> bool:
+        lock = self._user_locks.get(telegram_id)
+        return lock is not None and lock.locked()
+    
+    def current_state(self, telegram_id: str) -> ConversationState:
+        """Estado actual de la conversación sin crearla (para priorizar el turno)"""
+        conv = self.conversations.get(telegram_id)
+        return conv['state'] if conv else ConversationState.INITIAL
+    
+    async def shed_reply(self, telegram_id: str, message: str) -> str:
+        """Responde un turno descartado por sobrecarga con la respuesta de respaldo del estado, sin LLM ni CRM.
+
+        El mensaje queda en el historial; el dato que contenía se vuelve a pedir en la respuesta.
+        """
+        async with self._user_lock(telegram_id):
+            return await self._shed_reply(telegram_id, message)
+    
+    async def _shed_reply(self, telegram_id: str, message: str) -> str:
         conv = self.get_conversation(telegram_id)
         current_state = conv['state']
         lead = conv['lead']
+        response = self.llm._get_fallback_response(current_state, lead.to_dict())
+        conv['history'].append({"role": "user", "content": message})
+        conv['history'].append({"role": "assistant", "content": response})
+        conv['turns'] += 1
+        conv['last_activity'] = time.time()
+        if current_state == ConversationState.INITIAL:
+            # El saludo predefinido ya pregunta el nombre, igual que el turno normal
+            conv['state'] = ConversationState.WAITING_NAME
+        await self._journal(
+            {"type": "message", "telegram_id": telegram_id, "role": "user", "content": message},
+            {"type": "message", "telegram_id": telegram_id, "role": "assistant", "content": response},
+            {"type": "lead", "telegram_id": telegram_id, "state": conv['state'].value,
+             "lead": lead.to_dict(), "pending_sync": telegram_id in self.pending_sync}
+        )
+        return response
+    
+    async def restore_from_journal(self):
+        """Reconstruye las conversaciones desde el journal y reencola los leads sin sincronizar"""
+        start = time.perf_counter()
+        restored = await asyncio.to_thread(self.journal.replay)
+        for telegram_id, entry in restored.items():
+            if entry['lead'] is None:
+                continue
+            lead = Lead(**entry['lead'])
+            if entry['archived']:
+                # Lead anterior a un /reset: solo vuelve para terminar su sincronización
+                if entry['pending_sync']:
+                    self.archived_leads[telegram_id] = lead
+                    self._schedule_sync_retry(telegram_id, delay=0)
+                continue
+            if not entry['pending_sync']:
+                lead.pop_dirty()
+            conv = self._new_conversation(lead)
+            conv['state'] = ConversationState(entry['state'])
+            conv['history'] = entry['history']
+            conv['turns'] = sum(1 for item in entry['history'] if item['role'] == 'user')
+            conv['exported'] = "completed" if entry['completed'] else None
+            self.conversations[telegram_id] = conv
+            if entry['pending_sync']:
+                self._schedule_sync_retry(telegram_id, delay=0)
+        logger.info("Conversaciones restauradas desde el journal: %s (%s pendientes de sincronizar) en %.3fs",
+                    len(restored), len(self.pending_sync), time.perf_counter() - start)
+    
+    def _export(self, conv: Dict, ended_reason: str):
+        """Envía una conversación terminada al exportador de analítica.
+
+        Una completada es definitiva; una abandonada puede volver a exportarse si el usuario
+        regresa, y el registro nuevo reemplaza al anterior en las consultas (`conversation_id`).
+        """
+        if self.exporter is None or conv['exported'] == "completed":
+            return
+        conv['exported'] = ended_reason
+        conv['exported_activity'] = conv['last_activity']
+        self.exporter.record(conv, ended_reason)
+    
+    def export_idle_conversations(self, max_idle: float) -> int:
+        """Exporta como abandonadas las conversaciones sin actividad por más de `max_idle` segundos.
+
+        Las que ya se exportaron y siguen inactivas otro periodo completo (o completadas e inactivas)
+        se sacan de memoria, salvo que tengan una sincronización pendiente o un turno en curso.
+        """
+        now = time.time()
+        cutoff = now - max_idle
+        exported = 0
+        for telegram_id, conv in list(self.conversations.items()):
+            if conv['last_activity'] >= cutoff:
+                continue
+            if conv['turns'] and conv['exported'] != "completed" and conv['exported_activity'] != conv['last_activity']:
+                self._export(conv, "abandoned")
+                exported += 1
+            elif (conv['exported'] == "completed" or conv['last_activity'] < cutoff - max_idle) \
+                    and telegram_id not in self.pending_sync and not self._is_busy(telegram_id):
+                del self.conversations[telegram_id]
+                CONVERSATIONS_EVICTED.inc()
+        return exported
+    
+    async def _export_idle_periodically(self):
+        while True:
+            await asyncio.sleep(min(ANALYTICS_IDLE_TIMEOUT, ANALYTICS_FLUSH_INTERVAL))
+            exported = self.export_idle_conversations(ANALYTICS_IDLE_TIMEOUT)
+            if exported:
+                logger.info("Conversaciones abandonadas exportadas: %s", exported)
+    
+    async def _journal(self, *events: Dict):
+        """Escribe eventos en el journal; un fallo de disco no debe impedir responder al usuario"""
+        if self.journal is None:
+            return
+        try:
+            with span("journal.append"):
+                await self.journal.append(*events)
+        except Exception as e:
+            logger.error("Error escribiendo en el journal: %s", e)
+    
+    async def process_message(self, telegram_id: str, message: str, deadline: Optional[Deadline] = None) -> str:
+        """Procesa un mensaje y genera respuesta dentro del presupuesto del update (si se indica)"""
+        async with self._user_lock(telegram_id):
+            with span("conversation.process_message"), deadline_scope(deadline):
+                return await self._process_message(telegram_id, message)
+
+    async def _process_message(self, telegram_id: str, message: str) -> str:
+        conv = self.get_conversation(telegram_id)
+        current_state = conv['state']
+        lead = conv['lead']
+
+        # Registrar el mensaje en el journal antes de procesarlo (write-ahead)
+        await self._journal({"type": "message", "telegram_id": telegram_id, "role": "user", "content": message})
 
         # Agregar mensaje del usuario al historial
         conv['history'].append({"role": "user", "content": message})
+        conv['turns'] += 1
+        conv['last_activity'] = time.time()
+
+        # Ciudad del usuario (gazetteer local): la última que mencione con una expresión locativa
+        place = extract_user_place(message)
+        if place is not None and place.name != lead.city:
+            lead.city = place.name
+            logger.debug("Ubicación del usuario: %s", lead.city)
+        self._refresh_inventory_results(conv)
+        
+        # Especular la respuesta del estado predicho mientras corren la extracción y la sincronización
+        # (solo si la respuesta va a requerir el LLM)
+        speculation = None
+        if self.speculator is not None and (self.reply_planner is None or self.reply_planner.is_off_script(message)):
+            speculation = self.speculator.start(
+                current_state, lead, message, conv['history'], conv.get('inventory_results')
+            )
+        sync_needed = False
         
         # Procesar según el estado actual
-        logger.info(f"Procesando mensaje en estado: {current_state.value}")
+        logger.info("Procesando mensaje en estado: %s", current_state.value)
         
         if current_state == ConversationState.INITIAL:
             # En el estado inicial, solo cambiar a WAITING_NAME después de generar la respuesta
@@ -48,49 +283,46 @@ class ConversationManager:
 
         elif current_state == ConversationState.WAITING_NAME:
             lead.name = await self.llm.extract_field(message, "name")
-            logger.info(f"Nombre extraído: {lead.name}")
+            logger.debug("Nombre extraído: %s", lead.name)
             if lead.name:
                 conv['state'] = ConversationState.WAITING_EQUIPMENT
-                await self._sync_to_hubspot(lead)
+                sync_needed = True
 
         elif current_state == ConversationState.WAITING_EQUIPMENT:
             lead.equipment_interest = await self.llm.extract_field(message, "equipment")
-            logger.info(f"Equipo de interés extraído: {lead.equipment_interest}")
+            logger.info("Equipo de interés extraído: %s", lead.equipment_interest)
             if lead.equipment_interest:
                 # Inicializar lista de características de máquina y índice de pregunta
                 lead.machine_characteristics = []
                 lead.current_question_index = 0
                 conv['state'] = ConversationState.WAITING_EQUIPMENT_QUESTIONS
-                await self._sync_to_hubspot(lead)
+                sync_needed = True
 
         elif current_state == ConversationState.WAITING_EQUIPMENT_QUESTIONS:
             # Agregar la respuesta a las características de la máquina
-            if lead.machine_characteristics is None:
-                lead.machine_characteristics = []
-            
             # Crear una descripción de la respuesta basada en el tipo de equipo y pregunta actual
             equipment_type = lead.equipment_interest.lower()
             characteristic_description = self._create_characteristic_description(equipment_type, message, lead.current_question_index)
             
             if characteristic_description:
-                lead.machine_characteristics.append(characteristic_description)
-                logger.info(f"Característica agregada: {characteristic_description}")
+                lead.add_machine_characteristic(characteristic_description)
+                logger.debug("Característica agregada: %s", characteristic_description)
             
             # Verificar si hay más preguntas que hacer
             if self._has_more_questions(equipment_type, lead.current_question_index):
                 # Incrementar índice de pregunta y continuar en el mismo estado
                 lead.current_question_index += 1
-                logger.info(f"Siguiente pregunta para {equipment_type}, índice: {lead.current_question_index}")
-                await self._sync_to_hubspot(lead)
+                logger.info("Siguiente pregunta para %s, índice: %s", equipment_type, lead.current_question_index)
+                sync_needed = True
             else:
                 # No hay más preguntas, cambiar al siguiente estado
                 conv['state'] = ConversationState.WAITING_DISTRIBUTOR
-                logger.info(f"Todas las preguntas completadas para {equipment_type}, cambiando a WAITING_DISTRIBUTOR")
-                await self._sync_to_hubspot(lead)
+                logger.info("Todas las preguntas completadas para %s, cambiando a WAITING_DISTRIBUTOR", equipment_type)
+                sync_needed = True
 
         elif current_state == ConversationState.WAITING_DISTRIBUTOR:
             is_distributor = await self.llm.extract_field(message, "is_distributor")
-            logger.info(f"Tipo de cliente extraído: {is_distributor}")
+            logger.info("Tipo de cliente extraído: %s", is_distributor)
             
             if is_distributor:
                 # Convertir a booleano
@@ -110,12 +342,26 @@ class ConversationManager:
                 
                 if lead.is_distributor is not None:
                     conv['state'] = ConversationState.WAITING_QUOTATION_DATA
-                    await self._sync_to_hubspot(lead)
+                    sync_needed = True
 
         elif current_state == ConversationState.WAITING_QUOTATION_DATA:
-            # Extraer todos los datos de cotización de una vez
-            quotation_data = await self.llm.extract_quotation_data(message)
-            logger.info(f"Datos de cotización extraídos: {quotation_data}")
+            if PARALLEL_FIELD_EXTRACTION:
+                # Extracción conjunta + extractores por campo (solo los que faltan) en paralelo
+                missing_fields = [field for field in QUOTATION_FIELDS if not getattr(lead, field)]
+                extracted = await self.llm.extract_quotation_data_parallel(
+                    message, missing_fields, EXTRACTION_MAX_CONCURRENCY
+                )
+                conv['field_confidence'].update(
+                    {field: data['confidence'] for field, data in extracted.items()}
+                )
+                quotation_data = {
+                    field: data['value'] for field, data in extracted.items()
+                    if data['confidence'] >= EXTRACTION_MIN_CONFIDENCE
+                }
+            else:
+                # Extraer todos los datos de cotización de una vez
+                quotation_data = await self.llm.extract_quotation_data(message)
+            logger.info("Datos de cotización extraídos: %s", quotation_data)
             
             if quotation_data:
                 # Actualizar el lead con los datos extraídos
@@ -132,24 +378,26 @@ class ConversationManager:
                 
                 # Marcar como completado
                 conv['state'] = ConversationState.COMPLETED
-                await self._sync_to_hubspot(lead)
+                sync_needed = True
 
-        # Si la conversación está completada, enviar mensaje de despedida
-        if conv['state'] == ConversationState.COMPLETED:
-            response = f"Perfecto {lead.name}, un asesor se pondrá en contacto contigo pronto para dar seguimiento a tu solicitud de {lead.equipment_interest}. ¡Gracias por tu interés!"
-            
-            # TODO: Guardar conversación completada
-        else:
-            # Generar respuesta con LLM para otros estados
-            response = await self.llm.generate_response(
-                conv['history'], 
-                conv['state'], 
-                conv.get('inventory_results'),
-                {
-                    'equipment_interest': lead.equipment_interest,
-                    'current_question_index': lead.current_question_index
-                }
-            )
+        # Si cambió el equipo de interés, la respuesta especulada usaba otras unidades cercanas
+        if self._refresh_inventory_results(conv) and speculation is not None:
+            self.speculator.discard(speculation)
+            speculation = None
+
+        # La sincronización con HubSpot corre en paralelo con la generación de la respuesta
+        sync_task = self._start_sync(self._sync_to_hubspot_unbounded(lead)) if sync_needed else None
+        try:
+            # Si la conversación está completada, enviar mensaje de despedida
+            if conv['state'] == ConversationState.COMPLETED:
+                if speculation is not None:
+                    self.speculator.discard(speculation)
+                response = f"Perfecto {lead.name}, un asesor se pondrá en contacto contigo pronto para dar seguimiento a tu solicitud de {lead.equipment_interest}. ¡Gracias por tu interés!"
+            else:
+                response = await self._generate_reply(telegram_id, conv, current_state, message, speculation)
+        finally:
+            if sync_task is not None:
+                await self._await_sync(lead, sync_task)
 
         # Agregar respuesta al historial
         conv['history'].append({"role": "assistant", "content": response})
@@ -157,103 +405,201 @@ class ConversationManager:
         # Cambiar estado después de generar respuesta en estado inicial
         if current_state == ConversationState.INITIAL:
             conv['state'] = ConversationState.WAITING_NAME
-            logger.info(f"Estado cambiado de INITIAL a WAITING_NAME")
+            logger.info("Estado cambiado de INITIAL a WAITING_NAME")
 
         # Limpiar historial si es muy largo
         if len(conv['history']) > 20:
             conv['history'] = conv['history'][-10:]
 
+        # Guardar la respuesta y el estado del lead (y la conversación completada) en el journal
+        events = [
+            {"type": "message", "telegram_id": telegram_id, "role": "assistant", "content": response},
+            {"type": "lead", "telegram_id": telegram_id, "state": conv['state'].value,
+             "lead": lead.to_dict(), "pending_sync": telegram_id in self.pending_sync}
+        ]
+        if conv['state'] == ConversationState.COMPLETED and current_state != ConversationState.COMPLETED:
+            events.append({"type": "completed", "telegram_id": telegram_id})
+            self._export(conv, "completed")
+        await self._journal(*events)
+
         return response
     
+    async def _generate_reply(self, telegram_id: str, conv: Dict, previous_state: ConversationState,
+                              message: str, speculation: Optional[Speculation] = None) -> str:
+        """Responde con plantilla los turnos deterministas; el LLM solo ante preguntas fuera de guion o
+        si la extracción del turno falló"""
+        lead = conv['lead']
+        lead_data = {
+            'equipment_interest': lead.equipment_interest,
+            'current_question_index': lead.current_question_index
+        }
+        reason = "disabled"
+        if self.reply_planner is not None:
+            response, reason = self.reply_planner.plan(
+                telegram_id, conv['state'], previous_state, message,
+                dict(lead_data, name=lead.name), conv['history']
+            )
+            if response is not None:
+                if speculation is not None:
+                    self.speculator.discard(speculation)
+                self.reply_planner.record(conv['state'], "template", reason)
+                return response
+        
+        if speculation is not None:
+            response = await self.speculator.take(speculation, conv['state'], lead_data)
+            if response is not None:
+                if self.reply_planner is not None:
+                    self.reply_planner.record(conv['state'], "speculative", reason)
+                return response
+        
+        # Generar respuesta con LLM
+        start = time.perf_counter()
+        response = await self.llm.generate_response(
+            conv['history'], 
+            conv['state'], 
+            conv.get('inventory_results'),
+            lead_data
+        )
+        if self.reply_planner is not None:
+            self.reply_planner.record(conv['state'], "llm", reason, time.perf_counter() - start)
+        return response
+    
+    def _refresh_inventory_results(self, conv: Dict) -> bool:
+        """Actualiza las unidades disponibles más cercanas al usuario; True si cambiaron"""
+        lead = conv['lead']
+        if not NEAREST_INVENTORY_LIMIT or lead.city is None:
+            return False
+        results = self.inventory.search_equipment(
+            near=lead.city, equipment=lead.equipment_interest, limit=NEAREST_INVENTORY_LIMIT
+        )
+        if results == conv.get('inventory_results'):
+            return False
+        conv['inventory_results'] = results
+        return True
+    
     def _create_characteristic_description(self, equipment_type: str, message: str, question_index: int) -> str:
         """Crea una descripción de la característica basada en el tipo de equipo y el índice de pregunta"""
-        equipment_type = equipment_type.lower()
-        
-        if 'soldadora' in equipment_type or 'soldar' in equipment_type:
-            return f"Amperaje/electrodo requerido: {message}"
-        elif 'compresor' in equipment_type:
-            return f"Capacidad de volumen de aire/herramienta: {message}"
-        elif 'torre' in equipment_type and 'iluminacion' in equipment_type:
-            return f"Requerimiento LED: {message}"
-        elif 'lgmg' in equipment_type:
-            if question_index == 0:
-                return f"Altura de trabajo necesaria: {message}"
-            elif question_index == 1:
-                return f"Actividad a realizar: {message}"
-            elif question_index == 2:
-                return f"Ubicación (exterior/interior): {message}"
-            else:
-                return f"Características de trabajo LGMG: {message}"
-        elif 'generador' in equipment_type:
-            if question_index == 0:
-                return f"Actividad para la que se requiere: {message}"
-            elif question_index == 1:
-                return f"Capacidad en kVA o kW: {message}"
-            else:
-                return f"Características del generador: {message}"
-        elif 'rompedor' in equipment_type:
-            return f"Uso del rompedor: {message}"
-        else:
-            return f"Características del equipo: {message}"
+        return characteristic_description(equipment_type, message, question_index)
     
     def _has_more_questions(self, equipment_type: str, current_question_index: int) -> bool:
         """Determina si hay más preguntas para hacer para un tipo de equipo específico."""
-        equipment_type = equipment_type.lower()
-        
-        if 'soldadora' in equipment_type or 'soldar' in equipment_type:
-            return current_question_index < 0  # Solo 1 pregunta (índice 0)
-        elif 'compresor' in equipment_type:
-            return current_question_index < 0  # Solo 1 pregunta (índice 0)
-        elif 'torre' in equipment_type and 'iluminacion' in equipment_type:
-            return current_question_index < 0  # Solo 1 pregunta (índice 0)
-        elif 'lgmg' in equipment_type:
-            return current_question_index < 2  # 3 preguntas (índices 0, 1, 2)
-        elif 'generador' in equipment_type:
-            return current_question_index < 1  # 2 preguntas (índices 0, 1)
-        elif 'rompedor' in equipment_type:
-            return current_question_index < 0  # Solo 1 pregunta (índice 0)
-        else:
-            return False
+        return current_question_index < equipment_question_count(equipment_type) - 1
     
-    async def _sync_to_hubspot(self, lead: Lead):
-        """Sincroniza el lead con HubSpot"""
+    async def _sync_to_hubspot(self, lead: Lead, key: Optional[str] = None) -> bool:
+        """Sincroniza el lead con HubSpot; si falla, lo deja encolado para reintentar.
+
+        `key` es la clave de reintento (el telegram_id, o la de archivo para el lead anterior a un /reset).
+        """
+        key = key or lead.telegram_id
         try:
             lead.updated_at = datetime.now().isoformat()
-            contact_id = await self.hubspot.create_or_update_contact(lead)
+            with span("conversation.sync_hubspot"):
+                contact_id = await self.hubspot.create_or_update_contact(lead)
             if contact_id:
                 lead.hubspot_contact_id = contact_id
-                logger.info(f"Lead sincronizado exitosamente con HubSpot. Contact ID: {contact_id}")
+                self.pending_sync.discard(key)
+                logger.info("Lead sincronizado exitosamente con HubSpot. Contact ID: %s", contact_id)
+                return True
             else:
-                logger.warning(f"No se pudo sincronizar el lead con HubSpot para Telegram ID: {lead.telegram_id}")
+                logger.warning("No se pudo sincronizar el lead con HubSpot para Telegram ID: %s", lead.telegram_id)
         except Exception as e:
-            logger.error(f"Error sincronizando con HubSpot: {e}")
+            logger.error("Error sincronizando con HubSpot: %s", e)
+        self._schedule_sync_retry(key)
+        return False
     
-    async def reset_conversation_with_new_contact(self, telegram_id: str):
-        """Reinicia una conversación y crea un nuevo contacto en HubSpot"""
-        if telegram_id in self.conversations:
-            # Reiniciar conversación
-            del self.conversations[telegram_id]
-            logger.info(f"Conversación reiniciada para usuario {telegram_id}")
-        
-        # Crear nueva conversación con nuevo lead
-        new_lead = Lead(telegram_id=telegram_id, created_at=datetime.now().isoformat())
-        
-        # Crear nuevo contacto en HubSpot
+    def _start_sync(self, coro) -> asyncio.Task:
+        """Lanza una sincronización con referencia fuerte; stop_background_tasks la espera"""
+        task = asyncio.create_task(coro)
+        self._sync_tasks.add(task)
+        task.add_done_callback(self._sync_tasks.discard)
+        return task
+    
+    async def _sync_to_hubspot_unbounded(self, lead: Lead) -> bool:
+        """Sincronización lanzada desde un turno: sin el deadline del turno (solo se acota su espera),
+        cada llamada a HubSpot con su timeout normal"""
+        with deadline_scope(None):
+            return await self._sync_to_hubspot(lead)
+    
+    async def _await_sync(self, lead: Lead, sync_task: asyncio.Future):
+        """Espera la sincronización dentro del presupuesto del turno; si no alcanza, la deja terminar
+        en segundo plano y encola el lead para reintento por si falla"""
         try:
-            contact_id = await self.hubspot.create_new_contact(new_lead)
-            if contact_id:
-                new_lead.hubspot_contact_id = contact_id
-                logger.info(f"Nuevo contacto creado en HubSpot para reset. Contact ID: {contact_id}")
-            else:
-                logger.warning(f"No se pudo crear nuevo contacto en HubSpot para reset. Telegram ID: {telegram_id}")
-        except Exception as e:
-            logger.error(f"Error creando nuevo contacto en HubSpot para reset: {e}")
+            await within("crm", asyncio.shield(sync_task))
+        except DeadlineExceeded:
+            logger.warning("Sincronización con HubSpot diferida por presupuesto - Telegram ID: %s", lead.telegram_id)
+            self._schedule_sync_retry(lead.telegram_id)
+    
+    def _schedule_sync_retry(self, telegram_id: str, delay: Optional[float] = None):
+        """Encola un lead para reintentar su sincronización con HubSpot"""
+        if telegram_id in self.pending_sync:
+            return
+        self.pending_sync.add(telegram_id)
+        delay = HUBSPOT_SYNC_RETRY_DELAY if delay is None else delay
+        self.sync_queue.put_nowait((time.monotonic() + delay, telegram_id))
+    
+    async def _sync_retry_worker(self):
+        """Reintenta en segundo plano las sincronizaciones fallidas o pendientes tras un reinicio"""
+        while True:
+            due, key = await self.sync_queue.get()
+            await asyncio.sleep(max(0.0, due - time.monotonic()))
+            if key in self.pending_sync:
+                await self._sync_pending(key)
+    
+    async def _sync_pending(self, key: str):
+        """Sincroniza un lead pendiente (conversación activa o archivada) y registra el acuse en el journal"""
+        self.pending_sync.discard(key)
+        lead = self.archived_leads.get(key)
+        if lead is None:
+            conv = self.conversations.get(key)
+            if conv is None:
+                return
+            lead = conv['lead']
+        if await self._sync_to_hubspot(lead, key):
+            self.archived_leads.pop(key, None)
+            await self._journal({"type": "synced", "telegram_id": key, "contact_id": lead.hubspot_contact_id})
+    
+    async def reset_conversation(self, telegram_id: str) -> bool:
+        """Reinicia una conversación con un lead nuevo; False si el usuario excedió el límite de reinicios.
+
+        El contacto nuevo en HubSpot no se crea aquí sino en la primera sincronización con datos
+        reales (nombre o equipo), sin buscar el contacto anterior con el mismo telegram_id.
+        """
+        if not self.reset_limiter.try_acquire(telegram_id):
+            RESETS.inc(outcome="rate_limited")
+            logger.info("Reinicio limitado para usuario %s", telegram_id)
+            return False
+        RESETS.inc(outcome="reset")
+        async with self._user_lock(telegram_id):
+            await self._reset_conversation(telegram_id)
+        return True
+    
+    async def _reset_conversation(self, telegram_id: str):
+        events = []
+        archive_key = None
+        if telegram_id in self.conversations:
+            # Reiniciar conversación (la anterior se exporta como reiniciada si no se había exportado)
+            previous = self.conversations.pop(telegram_id)
+            self._export(previous, "reset")
+            if telegram_id in self.pending_sync:
+                # El lead anterior sigue en la cola de reintentos bajo su propia clave (la conversación
+                # nueva usa el telegram_id) y queda en el journal hasta que HubSpot confirme
+                self.pending_sync.discard(telegram_id)
+                archive_key = f"{telegram_id}#{time.time_ns()}"
+                self.archived_leads[archive_key] = previous['lead']
+                self.pending_sync.add(archive_key)
+                events.append({"type": "lead", "telegram_id": archive_key, "state": previous['state'].value,
+                               "lead": previous['lead'].to_dict(), "pending_sync": True, "archived": True})
+            logger.info("Conversación reiniciada para usuario %s", telegram_id)
         
-        # Inicializar nueva conversación
-        self.conversations[telegram_id] = {
-            'state': ConversationState.INITIAL,
-            'lead': new_lead,
-            'history': [],
-            'inventory_results': []
-        }
-        logger.info(f"Nueva conversación inicializada para usuario {telegram_id} con nuevo contacto en HubSpot")
\ No newline at end of file
+        # Crear nueva conversación con nuevo lead (el contacto se crea al capturar el primer dato)
+        new_lead = Lead(telegram_id=telegram_id, created_at=datetime.now().isoformat(), force_new_contact=True)
+        self.conversations[telegram_id] = self._new_conversation(new_lead)
+        await self._journal(
+            *events,
+            {"type": "reset", "telegram_id": telegram_id},
+            {"type": "lead", "telegram_id": telegram_id, "state": ConversationState.INITIAL.value,
+             "lead": new_lead.to_dict(), "pending_sync": False}
+        )
+        logger.info("Nueva conversación inicializada para usuario %s", telegram_id)
+        if archive_key is not None:
+            self._start_sync(self._sync_pending(archive_key))
@@ -0,0 +1,114 @@
+"""
+Presupuesto de tiempo por update (deadline) propagado a las etapas del turno
+
+`TelegramBot` crea un `Deadline` al recibir el update y lo pasa a `ConversationManager`, que lo
+activa en un ContextVar durante el turno; así `LLMManager` y `HubSpotManager` (y las tareas que
+el turno lanza, como la especulación) acotan cada llamada a su parte del tiempo restante. La
+sincronización con HubSpot corre sin deadline: el turno solo acota cuánto la espera. Cuando una etapa se queda sin presupuesto lanza `DeadlineExceeded` y quien la
+llama degrada: extracción vacía, respuesta de respaldo o sincronización diferida.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Optional, TypeVar
+
+from metrics import REGISTRY
+
+T = TypeVar("T")
+
+# Fracción del tiempo restante que puede consumir cada etapa al empezar
+STAGE_SHARES = {
+    "extract": 0.5,  # deja al menos la mitad del presupuesto para la respuesta
+    "reply": 1.0,
+    "crm": 1.0,
+}
+
+DEADLINE_EXCEEDED = REGISTRY.counter(
+    "chatbot_deadline_exceeded_total", "Etapas del turno que agotaron su parte del presupuesto", ["stage"]
+)
+DEADLINE_REMAINING = REGISTRY.histogram(
+    "chatbot_deadline_remaining_seconds", "Presupuesto restante al terminar el turno",
+    buckets=(0, 0.25, 0.5, 1, 2, 4, 8)
+)
+
+
+class DeadlineExceeded(Exception):
+    """La etapa no terminó dentro de su parte del presupuesto del turno"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Presupuesto agotado en la etapa {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """Instante límite (reloj monotónico) para responder un update"""
+
+    __slots__ = ('budget', 'expires_at')
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, stage: str, cap: Optional[float] = None) -> float:
+        """Tiempo asignado a la etapa (acotado por `cap`); lanza DeadlineExceeded si no queda nada"""
+        timeout = self.remaining() * STAGE_SHARES.get(stage, 1.0)
+        if timeout <= 0:
+            DEADLINE_EXCEEDED.inc(stage=stage)
+            raise DeadlineExceeded(stage)
+        return timeout if cap is None else min(timeout, cap)
+
+    async def run(self, stage: str, awaitable: Awaitable[T]) -> T:
+        """Espera `awaitable` como máximo la parte de la etapa; si se agota, lo cancela"""
+        try:
+            timeout = self.timeout(stage)
+        except DeadlineExceeded:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            DEADLINE_EXCEEDED.inc(stage=stage)
+            raise DeadlineExceeded(stage) from None
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("current_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    """Activa el deadline del turno para todo lo que se ejecute (o se lance) dentro del bloque"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+        if deadline is not None:
+            DEADLINE_REMAINING.observe(deadline.remaining())
+
+
+async def within(stage: str, awaitable: Awaitable[T]) -> T:
+    """Acota `awaitable` al deadline activo; sin deadline lo espera sin límite"""
+    deadline = _current_deadline.get()
+    if deadline is None:
+        return await awaitable
+    return await deadline.run(stage, awaitable)
+
+
+def http_timeout(stage: str, default: float) -> float:
+    """Timeout para una llamada HTTP: `default` o lo que quede de la etapa si es menor"""
+    deadline = _current_deadline.get()
+    return default if deadline is None else deadline.timeout(stage, default)
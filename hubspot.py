@@ -2,16 +2,65 @@
 Integración con HubSpot CRM
 """
 
+import asyncio
+import logging
 import httpx
-import requests
 import os
-from typing import Dict, Optional, Callable, Any
+from typing import Dict, Optional, Callable, Any, Iterable, NamedTuple, List, Set
 from models import Lead
-from config import logger
+from metrics import REGISTRY
+from tracing import span
+from deadline import http_timeout
+
+logger = logging.getLogger(__name__)
+
+# Máximo de contactos por llamada a los endpoints batch de HubSpot
+BATCH_LIMIT = 100
+# Reintentos ante 429 (límite de tasa) en llamadas batch
+BATCH_MAX_RETRIES = 5
+# Timeout de cada request (el default de httpx); dentro de un turno se acota a su presupuesto restante
+HTTP_TIMEOUT = 5.0
+
+HUBSPOT_REQUESTS = REGISTRY.counter(
+    "chatbot_hubspot_requests_total", "Llamadas a la API de HubSpot", ["operation", "status"]
+)
+HUBSPOT_AVOIDED_CALLS = REGISTRY.counter(
+    "chatbot_hubspot_avoided_calls_total",
+    "Sincronizaciones omitidas porque ningún campo mapeado cambió o el delta quedó vacío"
+)
+
+
+class PropertyMapping(NamedTuple):
+    field: str  # Atributo del Lead
+    property: str  # Propiedad del contacto en HubSpot
+    formatter: Optional[Callable[[Any], str]] = None
+    optional: bool = False  # Solo se envía si la propiedad está habilitada en HUBSPOT_OPTIONAL_PROPERTIES
+
+
+class BatchUpdateResult(NamedTuple):
+    updated: List[Lead]  # Contactos que HubSpot confirmó
+    failed: List[Lead]  # Enviados pero no actualizados (error de la llamada o del contacto en un 207)
+
+
+# Mapeo de campos del Lead a propiedades de contacto en HubSpot
+CONTACT_PROPERTY_MAP: List[PropertyMapping] = [
+    PropertyMapping("name", "firstname"),
+    PropertyMapping("company_name", "empresa_asociada"),
+    PropertyMapping("phone", "phone"),
+    PropertyMapping("email", "email"),
+    PropertyMapping("equipment_interest", "equipo_interesado"),
+    PropertyMapping("city", "city"),
+    # TODO: Propiedades pendientes de crear en HubSpot; habilitarlas con HUBSPOT_OPTIONAL_PROPERTIES
+    PropertyMapping("company_business", "giro_empresa", optional=True),
+    PropertyMapping("machine_characteristics", "caracteristicas_maquina",
+                    lambda value: "; ".join(value), optional=True),
+    PropertyMapping("is_distributor", "tipo_cliente",
+                    lambda value: "distribuidor" if value else "cliente_final", optional=True),
+]
 
 
 class HubSpotManager:
-    def __init__(self, access_token: str):
+    def __init__(self, access_token: str, optional_properties: Optional[Iterable[str]] = None):
         self.access_token = access_token
         self.base_url = "https://api.hubapi.com"
         self.headers = {
@@ -22,6 +71,16 @@ class HubSpotManager:
         self.refresh_token = os.getenv("HUBSPOT_REFRESH_TOKEN")
         self.client_id = os.getenv("HUBSPOT_CLIENT_ID")
         self.client_secret = os.getenv("HUBSPOT_CLIENT_SECRET")
+        # Propiedades opcionales habilitadas (las que ya existen en la cuenta de HubSpot)
+        if optional_properties is None:
+            optional_properties = [
+                name.strip() for name in os.getenv("HUBSPOT_OPTIONAL_PROPERTIES", "").split(",") if name.strip()
+            ]
+        enabled = set(optional_properties)
+        self.property_map = [
+            mapping for mapping in CONTACT_PROPERTY_MAP
+            if not mapping.optional or mapping.property in enabled
+        ]
 
     async def _refresh_access_token(self) -> bool:
         """Obtiene un nuevo access token usando el refresh token y actualiza self.access_token y self.headers"""
@@ -34,7 +93,10 @@ class HubSpotManager:
         }
         headers = {"Content-Type": "application/x-www-form-urlencoded"}
         try:
-            response = requests.post(url, data=data, headers=headers)
+            import requests
+            with span("hubspot.refresh_token"):
+                response = requests.post(url, data=data, headers=headers)
+            HUBSPOT_REQUESTS.inc(operation="refresh_token", status=response.status_code)
             if response.status_code == 200:
                 token_data = response.json()
                 self.access_token = token_data["access_token"]
@@ -42,10 +104,10 @@ class HubSpotManager:
                 logger.info("Nuevo access token de HubSpot obtenido correctamente.")
                 return True
             else:
-                logger.error(f"Error al refrescar token de HubSpot: {response.status_code} - {response.text}")
+                logger.error("Error al refrescar token de HubSpot: %s - %s", response.status_code, response.text)
                 return False
         except Exception as e:
-            logger.error(f"Excepción al refrescar token de HubSpot: {e}")
+            logger.error("Excepción al refrescar token de HubSpot: %s", e)
             return False
 
     async def _with_token_refresh(self, func: Callable[..., Any], *args, **kwargs) -> Any:
@@ -64,163 +126,215 @@ class HubSpotManager:
             # Si la función interna ya maneja el error, solo lo relanzamos
             raise
     
-    async def create_or_update_contact(self, lead: Lead) -> Optional[str]:
-        """Crea o actualiza un contacto en HubSpot, refrescando el token si es necesario"""
-        async def _core():
-            # Preparar propiedades del contacto
+    def _http_client(self) -> httpx.AsyncClient:
+        """Cliente HTTP con el timeout acotado al deadline del turno, si hay uno activo"""
+        return httpx.AsyncClient(timeout=http_timeout("crm", HTTP_TIMEOUT))
+    
+    def _build_properties(self, lead: Lead, fields: Optional[Iterable[str]] = None,
+                          include_base: bool = True) -> Dict[str, str]:
+        """Construye las propiedades del contacto a partir de la tabla de mapeo.
+
+        Si se indica `fields`, solo se incluyen esas propiedades (para enviar deltas).
+        """
+        properties = {}
+        if include_base:
             properties = {
                 "telegram_id": lead.telegram_id,
                 "telegram_lead": "true",
                 "lifecyclestage": "lead"
             }
-            if lead.name:
-                properties["firstname"] = lead.name
-            if lead.company_name:
-                properties["empresa_asociada"] = lead.company_name
-            if lead.phone:
-                properties["phone"] = lead.phone
-            if lead.email:
-                properties["email"] = lead.email
-            if lead.equipment_interest:
-                properties["equipo_interesado"] = lead.equipment_interest
-            
-            # TODO: Agregar campo para giro de empresa cuando se cree en HubSpot
-            # if lead.company_business:
-            #     properties["giro_empresa"] = lead.company_business
-            
-            # TODO: Agregar campo para características de máquina cuando se cree en HubSpot
-            # if lead.machine_characteristics:
-            #     properties["caracteristicas_maquina"] = "; ".join(lead.machine_characteristics)
-            
-            # TODO: Agregar campo para tipo de cliente (distribuidor/cliente final) cuando se cree en HubSpot
-            # if lead.is_distributor is not None:
-            #     properties["tipo_cliente"] = "distribuidor" if lead.is_distributor else "cliente_final"
-            
-            logger.info(f"Preparando contacto para HubSpot - Telegram ID: {lead.telegram_id}")
-            logger.info(f"Propiedades a enviar: {properties}")
+        for mapping in self.property_map:
+            if fields is not None and mapping.field not in fields:
+                continue
+            value = getattr(lead, mapping.field)
+            if value is None or value == "" or value == []:
+                continue
+            properties[mapping.property] = mapping.formatter(value) if mapping.formatter else value
+        return properties
+    
+    async def create_or_update_contact(self, lead: Lead) -> Optional[str]:
+        """Crea o actualiza un contacto en HubSpot, refrescando el token si es necesario.
+
+        Si el lead ya tiene contacto y ningún campo mapeado cambió desde la última sincronización
+        (o los cambios no producen propiedades, p. ej. un campo que quedó vacío), no se hace ninguna
+        llamada; si cambió algo, solo se envían las propiedades modificadas.
+        """
+        dirty = lead.pop_dirty()
+        changed = {mapping.field for mapping in self.property_map if mapping.field in dirty}
+        # Un campo que cambió a vacío (extracción fallida) no genera propiedad: el delta puede quedar vacío
+        delta = self._build_properties(lead, changed, include_base=False) if lead.hubspot_contact_id else {}
+        
+        if lead.hubspot_contact_id and not delta:
+            lead.avoided_syncs += 1
+            HUBSPOT_AVOIDED_CALLS.inc()
+            logger.debug("Sin cambios para HubSpot, se omite la sincronización - Telegram ID: %s", lead.telegram_id)
+            return lead.hubspot_contact_id
+        
+        async def _core():
+            logger.info("Preparando contacto para HubSpot - Telegram ID: %s", lead.telegram_id)
             
-            # Intentar actualizar contacto existente primero
+            # Intentar actualizar contacto existente primero, enviando solo el delta
             if lead.hubspot_contact_id:
-                result = await self._update_contact(lead.hubspot_contact_id, properties)
-                if result:
-                    return result
-            # Buscar contacto existente por telegram_id
-            existing_contact = await self._find_contact_by_telegram_id(lead.telegram_id)
-            if existing_contact:
-                result = await self._update_contact(existing_contact, properties)
+                logger.debug("Propiedades a enviar: %s", delta)
+                result = await self._update_contact(lead.hubspot_contact_id, delta)
                 if result:
                     return result
+            
+            properties = self._build_properties(lead)
+            logger.debug("Propiedades a enviar: %s", properties)
+            # Buscar contacto existente por telegram_id (salvo tras /reset: el anterior no se reutiliza)
+            if not lead.force_new_contact:
+                existing_contact = await self._find_contact_by_telegram_id(lead.telegram_id)
+                if existing_contact:
+                    result = await self._update_contact(existing_contact, properties)
+                    if result:
+                        return result
             # Crear nuevo contacto
             logger.info("Creando nuevo contacto en HubSpot")
-            return await self._create_contact(properties)
+            contact_id = await self._create_contact(properties)
+            if contact_id:
+                lead.force_new_contact = False
+            return contact_id
+        
+        result = None
         try:
-            return await self._with_token_refresh(_core)
+            result = await self._with_token_refresh(_core)
+            return result
         except Exception as e:
-            logger.error(f"Error en HubSpot: {e}")
+            logger.error("Error en HubSpot: %s", e)
             return None
+        finally:
+            if not result:
+                # La sincronización falló: conservar los cambios para el siguiente intento
+                lead.mark_dirty(dirty)
     
-    async def create_new_contact(self, lead: Lead) -> Optional[str]:
-        """Crea un nuevo contacto en HubSpot sin verificar si existe uno previo"""
-        async def _core():
-            # Preparar propiedades del contacto
-            properties = {
-                "telegram_id": lead.telegram_id,
-                "telegram_lead": "true",
-                "lifecyclestage": "lead"
-            }
-            if lead.name:
-                properties["firstname"] = lead.name
-            if lead.company_name:
-                properties["empresa_asociada"] = lead.company_name
-            if lead.phone:
-                properties["phone"] = lead.phone
-            if lead.email:
-                properties["email"] = lead.email
-            if lead.equipment_interest:
-                properties["equipo_interesado"] = lead.equipment_interest
-            
-            # TODO: Agregar campo para giro de empresa cuando se cree en HubSpot
-            # if lead.company_business:
-            #     properties["giro_empresa"] = lead.company_business
-            
-            # TODO: Agregar campo para características de máquina cuando se cree en HubSpot
-            # if lead.machine_characteristics:
-            #     properties["caracteristicas_maquina"] = "; ".join(lead.machine_characteristics)
-            
-            # TODO: Agregar campo para tipo de cliente (distribuidor/cliente final) cuando se cree en HubSpot
-            # if lead.is_distributor is not None:
-            #     properties["tipo_cliente"] = "distribuidor" if lead.is_distributor else "cliente_final"
-            
-            logger.info(f"Creando nuevo contacto en HubSpot para reset - Telegram ID: {lead.telegram_id}")
-            logger.info(f"Propiedades a enviar: {properties}")
-            
-            return await self._create_contact(properties)
-        
+    async def batch_update_contacts(self, leads: List[Lead], fields: Iterable[str]) -> BatchUpdateResult:
+        """Actualiza hasta BATCH_LIMIT contactos existentes en una sola llamada con los campos indicados.
+
+        Devuelve los leads actualizados y los que fallaron; los que no tienen contacto o no tienen
+        nada que enviar no aparecen en ninguno de los dos.
+        """
+        if len(leads) > BATCH_LIMIT:
+            raise ValueError(f"Máximo {BATCH_LIMIT} contactos por llamada batch")
+        fields = set(fields)
+        inputs = []
+        sent = []
+        for lead in leads:
+            properties = self._build_properties(lead, fields, include_base=False)
+            if lead.hubspot_contact_id and properties:
+                inputs.append({"id": lead.hubspot_contact_id, "properties": properties})
+                sent.append(lead)
+        if not inputs:
+            return BatchUpdateResult([], [])
         try:
-            return await self._with_token_refresh(_core)
+            updated_ids = await self._with_token_refresh(self._batch_update, inputs)
         except Exception as e:
-            logger.error(f"Error creando nuevo contacto en HubSpot: {e}")
-            return None
+            logger.error("Error en actualización batch de HubSpot: %s", e)
+            updated_ids = set()
+        return BatchUpdateResult(
+            [lead for lead in sent if lead.hubspot_contact_id in updated_ids],
+            [lead for lead in sent if lead.hubspot_contact_id not in updated_ids]
+        )
     
     async def _create_contact(self, properties: Dict) -> Optional[str]:
         """Crea un nuevo contacto"""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/crm/v3/objects/contacts",
-                headers=self.headers,
-                json={"properties": properties}
-            )
+        async with self._http_client() as client:
+            with span("hubspot.create_contact"):
+                response = await client.post(
+                    f"{self.base_url}/crm/v3/objects/contacts",
+                    headers=self.headers,
+                    json={"properties": properties}
+                )
+            HUBSPOT_REQUESTS.inc(operation="create_contact", status=response.status_code)
             if response.status_code == 201:
                 data = response.json()
-                logger.info(f"Contacto creado exitosamente: {data['id']}")
-                logger.info(f"Propiedades del contacto creado: {properties}")
+                logger.info("Contacto creado exitosamente: %s", data['id'])
+                logger.debug("Propiedades del contacto creado: %s", properties)
                 return data['id']
             elif response.status_code == 401:
                 # Token expirado, lanzar para que _with_token_refresh lo maneje
                 raise httpx.HTTPStatusError("Token expirado", request=response.request, response=response)
             else:
-                logger.error(f"Error creando contacto: {response.status_code}")
-                logger.error(f"Respuesta de HubSpot: {response.text}")
-                logger.error(f"Propiedades que se intentaron enviar: {properties}")
+                logger.error("Error creando contacto: %s", response.status_code)
+                logger.error("Respuesta de HubSpot: %s", response.text)
+                logger.error("Propiedades que se intentaron enviar: %s", properties)
                 return None
     
     async def _update_contact(self, contact_id: str, properties: Dict) -> Optional[str]:
         """Actualiza un contacto existente"""
-        async with httpx.AsyncClient() as client:
-            response = await client.patch(
-                f"{self.base_url}/crm/v3/objects/contacts/{contact_id}",
-                headers=self.headers,
-                json={"properties": properties}
-            )
+        async with self._http_client() as client:
+            with span("hubspot.update_contact"):
+                response = await client.patch(
+                    f"{self.base_url}/crm/v3/objects/contacts/{contact_id}",
+                    headers=self.headers,
+                    json={"properties": properties}
+                )
+            HUBSPOT_REQUESTS.inc(operation="update_contact", status=response.status_code)
             if response.status_code == 200:
-                logger.info(f"Contacto actualizado exitosamente: {contact_id}")
-                logger.info(f"Propiedades actualizadas: {properties}")
+                logger.info("Contacto actualizado exitosamente: %s", contact_id)
+                logger.debug("Propiedades actualizadas: %s", properties)
                 return contact_id
             elif response.status_code == 401:
                 # Token expirado, lanzar para que _with_token_refresh lo maneje
                 raise httpx.HTTPStatusError("Token expirado", request=response.request, response=response)
             else:
-                logger.error(f"Error actualizando contacto {contact_id}: {response.status_code}")
-                logger.error(f"Respuesta de HubSpot: {response.text}")
-                logger.error(f"Propiedades que se intentaron actualizar: {properties}")
+                logger.error("Error actualizando contacto %s: %s", contact_id, response.status_code)
+                logger.error("Respuesta de HubSpot: %s", response.text)
+                logger.error("Propiedades que se intentaron actualizar: %s", properties)
                 return None
     
+    async def _batch_update(self, inputs: List[Dict]) -> Set[str]:
+        """Actualiza contactos con el endpoint batch, esperando Retry-After si HubSpot responde 429.
+
+        Devuelve los ids de los contactos actualizados.
+        """
+        async with self._http_client() as client:
+            for attempt in range(BATCH_MAX_RETRIES + 1):
+                with span("hubspot.batch_update"):
+                    response = await client.post(
+                        f"{self.base_url}/crm/v3/objects/contacts/batch/update",
+                        headers=self.headers,
+                        json={"inputs": inputs}
+                    )
+                HUBSPOT_REQUESTS.inc(operation="batch_update", status=response.status_code)
+                if response.status_code == 429 and attempt < BATCH_MAX_RETRIES:
+                    retry_after = float(response.headers.get("Retry-After", 10))
+                    logger.warning("Límite de tasa de HubSpot alcanzado, reintentando en %ss", retry_after)
+                    await asyncio.sleep(retry_after)
+                    continue
+                break
+            if response.status_code in (200, 207):
+                # 207: algunos contactos fallaron; solo se devuelven los actualizados
+                data = response.json()
+                if data.get('errors'):
+                    logger.error("Errores en actualización batch: %s", data['errors'])
+                return {str(result['id']) for result in data.get('results', []) if 'id' in result}
+            elif response.status_code == 401:
+                # Token expirado, lanzar para que _with_token_refresh lo maneje
+                raise httpx.HTTPStatusError("Token expirado", request=response.request, response=response)
+            else:
+                logger.error("Error en actualización batch: %s", response.status_code)
+                logger.error("Respuesta de HubSpot: %s", response.text)
+                return set()
+    
     async def _find_contact_by_telegram_id(self, telegram_id: str) -> Optional[str]:
         """Busca un contacto por telegram_id"""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/crm/v3/objects/contacts/search",
-                headers=self.headers,
-                json={
-                    "filterGroups": [{
-                        "filters": [{
-                            "propertyName": "telegram_id",
-                            "operator": "EQ",
-                            "value": telegram_id
+        async with self._http_client() as client:
+            with span("hubspot.search_contact"):
+                response = await client.post(
+                    f"{self.base_url}/crm/v3/objects/contacts/search",
+                    headers=self.headers,
+                    json={
+                        "filterGroups": [{
+                            "filters": [{
+                                "propertyName": "telegram_id",
+                                "operator": "EQ",
+                                "value": telegram_id
+                            }]
                         }]
-                    }]
-                }
-            )
+                    }
+                )
+            HUBSPOT_REQUESTS.inc(operation="search_contact", status=response.status_code)
             if response.status_code == 200:
                 data = response.json()
                 if data.get('results'):
@@ -2,14 +2,32 @@
 Gestión del inventario de maquinaria
 """
 
-from typing import List
+import asyncio
+import logging
+from typing import List, Optional
 from models import InventoryItem
-from config import logger
+from location import LocationIndex, find_place
+
+logger = logging.getLogger(__name__)
 
 class InventoryManager:
-    def __init__(self):
+    def __init__(self, autoload: bool = True):
         self.inventory: List[InventoryItem] = []
-        self.load_inventory()
+        self.locations: Optional[LocationIndex] = None
+        self.ready = asyncio.Event()
+        self._load_task: Optional[asyncio.Task] = None
+        if autoload:
+            self.load_inventory()
+            self.ready.set()
+    
+    def start_background_load(self) -> asyncio.Task:
+        """Carga el inventario en un hilo mientras el bot ya acepta updates"""
+        if self._load_task is None:
+            async def _load():
+                await asyncio.to_thread(self.load_inventory)
+                self.ready.set()
+            self._load_task = asyncio.create_task(_load())
+        return self._load_task
     
     def load_inventory(self):
         """Carga el inventario desde la base de datos (todas las máquinas se consideran disponibles)"""
@@ -23,11 +41,26 @@ class InventoryManager:
                     ubicacion="Cualquier ubicación",
                 )
             ]
-            logger.info(f"Inventario cargado: {len(self.inventory)} items")
+            logger.info("Inventario cargado: %s items", len(self.inventory))
         except Exception as e:
-            logger.error(f"Error cargando inventario: {e}")
+            logger.error("Error cargando inventario: %s", e)
             self.inventory = []
+        # Índice espacial de las unidades disponibles con ubicación reconocida
+        self.locations = LocationIndex(self.inventory)
+        logger.info("Índice de ubicaciones: %s sitios, %s unidades sin ubicación reconocida",
+                    len(self.locations.sites), self.locations.unlocated)
     
-    def search_equipment(self) -> List[InventoryItem]:
-        """Busca equipos en el inventario basado en la consulta"""
-        return self.inventory
\ No newline at end of file
+    def search_equipment(self, near: Optional[str] = None, equipment: Optional[str] = None,
+                         limit: int = 5) -> List[InventoryItem]:
+        """Busca equipos en el inventario basado en la consulta (vacío mientras se carga en segundo plano).
+
+        Con `near` (ciudad o estado) devuelve las unidades disponibles más cercanas, de la familia
+        de `equipment` si se indica; vacío si la ubicación no se reconoce.
+        """
+        if near is None:
+            return self.inventory
+        place = find_place(near)
+        if place is None or self.locations is None:
+            return []
+        return [item for item, _ in self.locations.nearest(place, equipment, limit)]
+
@@ -0,0 +1,330 @@
+"""
+Journal local append-only de leads y conversaciones (write-ahead log con group commit)
+
+Cada evento se escribe como una línea `<crc32> <json>` en segmentos `journal-<n>.log` que rotan
+por tamaño. Los appends concurrentes se agrupan: mientras un lote se escribe y se hace fsync en
+un hilo, los siguientes se acumulan y se confirman juntos con un solo flush a disco.
+
+Uso (compactación manual, con el bot detenido):
+    python journal.py compact --dir data/journal
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+import zlib
+from typing import Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_RE = re.compile(r'^journal-(\d{10})\.log$')
+MAX_HISTORY = 20
+
+
+def _segment_name(seq: int) -> str:
+    return f"journal-{seq:010d}.log"
+
+
+def fsync_directory(path: str):
+    """Hace durable la creación, el renombrado o el borrado de archivos dentro de `path` (POSIX)"""
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def encode_event(event: Dict) -> bytes:
+    """Serializa un evento como línea con checksum para detectar escrituras truncadas"""
+    payload = json.dumps(event, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return b'%08x ' % zlib.crc32(payload) + payload + b'\n'
+
+
+def decode_line(line: bytes) -> Optional[Dict]:
+    """Devuelve el evento o None si la línea está truncada o corrupta"""
+    if not line.endswith(b'\n') or len(line) < 10:
+        return None
+    checksum, payload = line[:8], line[9:-1]
+    try:
+        if int(checksum, 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload)
+    except ValueError:
+        return None
+
+
+def _new_entry() -> Dict:
+    return {'state': None, 'lead': None, 'history': [], 'pending_sync': False, 'completed': False,
+            'archived': False}
+
+
+def fold_events(events) -> Dict[str, Dict]:
+    """Reduce una secuencia de eventos al último estado conocido por telegram_id.
+
+    Un lead archivado (el anterior a un /reset, aún sin sincronizar) va bajo su propia clave
+    (`archived: true`), así el evento 'reset' de la conversación no lo descarta.
+    """
+    conversations: Dict[str, Dict] = {}
+    for event in events:
+        telegram_id = event.get('telegram_id')
+        event_type = event.get('type')
+        if telegram_id is None:
+            continue
+        if event_type == 'snapshot':
+            conversations[telegram_id] = {
+                'state': event.get('state'),
+                'lead': event.get('lead'),
+                'history': event.get('history', []),
+                'pending_sync': event.get('pending_sync', False),
+                'completed': event.get('completed', False),
+                'archived': event.get('archived', False)
+            }
+        elif event_type == 'reset':
+            conversations.pop(telegram_id, None)
+        elif event_type == 'message':
+            entry = conversations.setdefault(telegram_id, _new_entry())
+            entry['history'].append({'role': event['role'], 'content': event['content']})
+            if len(entry['history']) > MAX_HISTORY:
+                entry['history'] = entry['history'][-MAX_HISTORY:]
+        elif event_type == 'lead':
+            entry = conversations.setdefault(telegram_id, _new_entry())
+            entry['state'] = event['state']
+            entry['lead'] = event['lead']
+            entry['pending_sync'] = event.get('pending_sync', False)
+            entry['archived'] = event.get('archived', False)
+        elif event_type == 'synced':
+            entry = conversations.setdefault(telegram_id, _new_entry())
+            entry['pending_sync'] = False
+            if entry['lead'] is not None:
+                entry['lead']['hubspot_contact_id'] = event.get('contact_id')
+        elif event_type == 'completed':
+            conversations.setdefault(telegram_id, _new_entry())['completed'] = True
+    return conversations
+
+
+class LeadJournal:
+    def __init__(self, directory: str, segment_max_bytes: int = 64 * 1024 * 1024, fsync: bool = True):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync = fsync
+        self._pending: List[Tuple[bytes, asyncio.Future]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._file = None
+        self._segment_seq = 0
+        self.appends = 0
+        self.commits = 0
+
+    # Segmentos
+
+    def segments(self) -> List[Tuple[int, str]]:
+        """Segmentos existentes ordenados por número de secuencia"""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in os.listdir(self.directory):
+            match = SEGMENT_RE.match(name)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return sorted(found)
+
+    def _open_segment(self, seq: int):
+        self._segment_seq = seq
+        self._file = open(os.path.join(self.directory, _segment_name(seq)), 'ab')
+        if self.fsync:
+            # La entrada del segmento nuevo en el directorio también tiene que sobrevivir a una caída
+            fsync_directory(self.directory)
+
+    def _rotate(self):
+        self._file.close()
+        self._open_segment(self._segment_seq + 1)
+
+    # Escritura
+
+    async def start(self):
+        """Abre un segmento nuevo y arranca el escritor (los segmentos previos quedan sellados)"""
+        if self._writer_task is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        existing = self.segments()
+        self._open_segment(existing[-1][0] + 1 if existing else 1)
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._writer_task = asyncio.create_task(self._writer())
+
+    async def append(self, *events: Dict):
+        """Agrega eventos al journal y espera a que estén en disco"""
+        if self._writer_task is None or self._closing:
+            raise RuntimeError("El journal no está iniciado")
+        now = time.time()
+        data = b''.join(encode_event({'ts': now, **event}) for event in events)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((data, future))
+        self.appends += len(events)
+        self._wakeup.set()
+        await future
+
+    def _write_batch(self, data: bytes):
+        start = self._file.tell()
+        try:
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        except Exception:
+            self._abandon_segment(start)
+            raise
+        if self._file.tell() >= self.segment_max_bytes:
+            self._rotate()
+
+    def _abandon_segment(self, start: int):
+        """Tras una escritura fallida recorta el segmento a `start` y sigue en uno nuevo.
+
+        Sin esto la línea a medias quedaría sin salto de línea y la primera del lote siguiente se
+        le pegaría, perdiéndose ambas en el replay.
+        """
+        path = self._file.name
+        try:
+            self._file.close()
+        except OSError:
+            pass  # El buffer sin escribir se descarta: el lote ya se reporta como fallido
+        try:
+            os.truncate(path, start)
+        except OSError as e:
+            logger.error("No se pudo recortar %s tras una escritura fallida: %s", path, e)
+        self._open_segment(self._segment_seq + 1)
+
+    async def _writer(self):
+        """Group commit: todo lo que se acumuló mientras se escribía el lote anterior va en un solo flush.
+
+        Termina cuando `stop()` marca el cierre y ya no queda nada pendiente.
+        """
+        while True:
+            if not self._pending:
+                if self._closing:
+                    return
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+            batch, self._pending = self._pending, []
+            try:
+                await asyncio.to_thread(self._write_batch, b''.join(data for data, _ in batch))
+                self.commits += 1
+                for _, future in batch:
+                    if not future.done():
+                        future.set_result(None)
+            except Exception as e:
+                logger.error("Error escribiendo en el journal: %s", e)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    async def stop(self):
+        """Confirma lo pendiente y cierra el segmento actual.
+
+        El escritor no se cancela: termina el lote que esté escribiendo en su hilo, vacía lo que
+        quede en cola y sale; solo entonces se cierra el archivo.
+        """
+        if self._writer_task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._writer_task
+        self._writer_task = None
+        self._file.close()
+
+    # Lectura y recuperación
+
+    def read_events(self, segments: Optional[List[Tuple[int, str]]] = None) -> Iterator[Dict]:
+        """Itera los eventos de los segmentos en orden, omitiendo líneas truncadas o corruptas"""
+        for seq, path in segments if segments is not None else self.segments():
+            with open(path, 'rb') as f:
+                for line_number, line in enumerate(f, 1):
+                    event = decode_line(line)
+                    if event is None:
+                        logger.warning("Línea inválida en %s:%s, se omite", path, line_number)
+                        continue
+                    yield event
+
+    def replay(self) -> Dict[str, Dict]:
+        """Reconstruye el último estado de cada conversación a partir del journal"""
+        return fold_events(self.read_events())
+
+    # Compactación
+
+    def compact(self, drop_completed: bool = False) -> int:
+        """Reescribe los segmentos sellados como un único segmento de snapshots.
+
+        El snapshot reemplaza atómicamente al último segmento sellado y después se borran los
+        anteriores; si el proceso cae entre ambos pasos, el replay sigue siendo correcto porque
+        los snapshots sobrescriben el estado acumulado y cada conversación descartada lleva un
+        evento 'reset' que la borra de lo que digan los segmentos viejos. Devuelve el número de
+        segmentos eliminados.
+        """
+        sealed = [segment for segment in self.segments()
+                  if self._writer_task is None or segment[0] < self._segment_seq]
+        if len(sealed) < 2 and not drop_completed:
+            return 0
+        if not sealed:
+            return 0
+
+        conversations = fold_events(self.read_events(sealed))
+        last_seq, last_path = sealed[-1]
+        tmp_path = last_path + '.compact'
+        with open(tmp_path, 'wb') as f:
+            for telegram_id, entry in conversations.items():
+                # Los leads archivados solo se conservan mientras no se hayan sincronizado
+                if not entry['pending_sync'] and (entry['archived'] or (drop_completed and entry['completed'])):
+                    f.write(encode_event({'type': 'reset', 'telegram_id': telegram_id}))
+                    continue
+                f.write(encode_event({'type': 'snapshot', 'telegram_id': telegram_id, **entry}))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, last_path)
+        fsync_directory(self.directory)
+        for seq, path in sealed[:-1]:
+            os.remove(path)
+        fsync_directory(self.directory)
+        logger.info("Journal compactado: %s segmentos en %s (%s conversaciones)",
+                    len(sealed), _segment_name(last_seq), len(conversations))
+        return len(sealed) - 1
+
+    async def compact_periodically(self, interval: float, drop_completed: bool = False):
+        """Compacta los segmentos sellados cada `interval` segundos"""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.compact, drop_completed)
+            except Exception as e:
+                logger.error("Error compactando el journal: %s", e)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Herramientas del journal de leads")
+    parser.add_argument("command", choices=["compact", "stats"])
+    parser.add_argument("--dir", default=os.getenv("JOURNAL_DIR", "data/journal"))
+    parser.add_argument("--drop-completed", action="store_true",
+                        help="Descarta conversaciones completadas y ya sincronizadas")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    journal = LeadJournal(args.dir)
+    if args.command == "compact":
+        removed = journal.compact(drop_completed=args.drop_completed)
+        print(f"Segmentos eliminados: {removed}")
+    else:
+        conversations = journal.replay()
+        pending = sum(1 for entry in conversations.values() if entry['pending_sync'])
+        print(f"Segmentos: {len(journal.segments())}  conversaciones: {len(conversations)}  "
+              f"pendientes de sincronizar: {pending}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,17 +2,138 @@
 Gestión del LLM (Groq)
 """
 
+import asyncio
 import json
+import logging
 import re
-from typing import List, Dict
-from groq import Groq
+from typing import List, Dict, Any, Tuple
 from models import ConversationState, InventoryItem
-from config import logger
+from deadline import DeadlineExceeded, within
+from llm_backends import GroqBackend, LLMBackend, select_backend
+from tracing import span, record_token_usage
+
+logger = logging.getLogger(__name__)
+
+# Campos que se solicitan en el estado WAITING_QUOTATION_DATA (mismos nombres que en Lead)
+QUOTATION_FIELDS = ('name', 'company_name', 'company_business', 'email', 'phone')
+
+# Confianza base según el origen de la extracción
+EXTRACTION_CONFIDENCE = {
+    'combined': 0.6,  # extract_quotation_data (un solo prompt para todos los campos)
+    'field': 0.8      # extract_field (prompt específico por campo)
+}
+
+# Validadores de formato para ajustar la confianza de campos estructurados
+FIELD_VALIDATORS = {
+    'email': re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$'),
+    'phone': re.compile(r'^\+?[\d\s\-\(\)\.]{7,20}$')
+}
+
+
+def normalize_extracted_value(value: Any) -> str:
+    """Normaliza un valor extraído por el LLM a cadena; vacíos y nulos ('null', {'value': null}, etc.) dan ''"""
+    if isinstance(value, dict):
+        value = value.get('value')
+    if value is None:
+        return ""
+    value = str(value).strip()
+    return "" if value.lower() in ('null', 'none', 'n/a') else value
+
+
+# Prompts de extracción por tipo de campo
+EXTRACTION_PROMPTS = {
+    "company_name": (
+        "Extrae el nombre de la empresa del siguiente mensaje si el mensaje solo contiene la empresa o si el usuario indica explícitamente que trabaja en, representa, pertenece a, es de, o su empresa es la mencionada. "
+        "Ignora marcas, equipos o palabras genéricas. Si no hay una indicación clara de relación laboral o pertenencia, responde con 'value': null. "
+        "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
+    ),
+    "company_business": (
+        "Extrae el giro o actividad de la empresa del siguiente mensaje si el usuario menciona explícitamente el tipo de negocio, giro, actividad o sector de su empresa. "
+        "Ignora nombres de empresas, marcas o equipos. Si no hay una indicación clara del giro empresarial, responde con 'value': null. "
+        "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
+    ),
+    "name": (
+        "Extrae el nombre de la persona del siguiente mensaje si el mensaje solo contiene un nombre o si el usuario lo menciona explícitamente como su nombre, o si se presenta como tal. "
+        "Ignora saludos, apodos, nombres de empresas, marcas o equipos. Si no hay una indicación clara de nombre personal, responde con 'value': null. "
+        "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
+    ),
+    "phone": (
+        "Extrae el número de teléfono del siguiente mensaje si el usuario lo proporciona de cualquier forma, por ejemplo: 'mi número es', 'puedes contactarme al', 'es', 'te dejo mi número', etc. "
+        "Acepta cualquier número con formato de teléfono (dígitos, espacios, guiones, paréntesis, etc.) que parezca un número de contacto. Si no hay un número de teléfono válido, responde con 'value': null. "
+        "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
+    ),
+    "email": (
+        "Extrae la dirección de email del siguiente mensaje si el mensaje solo contiene un email o si el usuario la proporciona explícitamente como su correo electrónico, el correo de su empresa o el correo al que se puede contactar. "
+        "Ignora textos que no tengan formato de email o que no estén acompañados de una indicación clara de ser un email. Si no hay un email válido, responde con 'value': null. "
+        "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
+    ),
+    "equipment": (
+        "Extrae el tipo de equipo o maquinaria del siguiente mensaje si el mensaje solo contiene un tipo de equipo o maquinaria o si el usuario lo menciona explícitamente como el equipo que busca, requiere o le interesa. "
+        "Ignora menciones genéricas, marcas, empresas o equipos que no sean solicitados explícitamente. Si no hay una indicación clara de equipo de interés, responde con 'value': null. "
+        "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
+    ),
+    "is_distributor": (
+        "Determina si el usuario es distribuidor basándote en el siguiente mensaje. "
+        "Si el usuario menciona que es distribuidor, revendedor, que va a revender, distribuir, rentar, o cualquier actividad comercial, responde con 'value': true. "
+        "Si el usuario menciona que es para uso propio, de su empresa, o uso final, responde con 'value': false. "
+        "Si no hay una indicación clara, responde con 'value': null. "
+        "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
+    ),
+    "use_type": (
+        "Determina el tipo de uso del equipo basándote en el siguiente mensaje. "
+        "Si el usuario menciona que es para uso propio, de su empresa, o uso final, responde con 'value': 'uso_empresa'. "
+        "Si el usuario menciona que es para revender, distribuir, rentar, o cualquier actividad comercial, responde con 'value': 'venta'. "
+        "Si no hay una indicación clara, responde con 'value': null. "
+        "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
+    )
+}
 
 class LLMManager:
-    def __init__(self, api_key: str):
-        self.client = Groq(api_key=api_key)
-        self.model = "meta-llama/llama-4-scout-17b-16e-instruct"
+    def __init__(self, api_key: str, http_client=None, batch_window: float = 0.0, max_batch: int = 20,
+                 backends: Dict[str, LLMBackend] = None, default_backend: str = "groq",
+                 task_backends: List[Tuple[str, str]] = None):
+        self.api_key = api_key
+        # Backends por nombre; Groq siempre está disponible y es el de por defecto
+        self.groq = GroqBackend(api_key, http_client)
+        self.backends: Dict[str, LLMBackend] = {"groq": self.groq, **(backends or {})}
+        self.default_backend = default_backend
+        # Reglas (patrón, backend) por tarea, p. ej. [("extract*", "local")]
+        self.task_backends = task_backends or []
+        for _, name in self.task_backends + [("", default_backend)]:
+            if name not in self.backends:
+                raise ValueError(f"Backend de LLM desconocido: {name}")
+        # Micro-batching de extract_field entre usuarios (batch_window=0 lo deshabilita)
+        self.batcher = None
+        if batch_window > 0:
+            from batching import ExtractionBatcher
+            self.batcher = ExtractionBatcher(self, batch_window, max_batch)
+
+    @property
+    def client(self):
+        """Cliente de Groq, creado en el primer uso para no importar groq al arrancar"""
+        return self.groq.client
+
+    @client.setter
+    def client(self, value):
+        self.groq.client = value
+
+    def backend_for(self, task: str) -> LLMBackend:
+        return self.backends[select_backend(task, self.task_backends, self.default_backend)]
+
+    async def _create_completion(self, task: str, messages: List[Dict],
+                                 max_tokens: int, temperature: float):
+        """Llama al LLM de la tarea registrando el span y el uso de tokens"""
+        backend = self.backend_for(task)
+        with span(f"llm.{task}", backend=backend.name):
+            response = await backend.complete(messages, max_tokens, temperature)
+        record_token_usage(task, response)
+        return response
+
+    async def close(self):
+        if self.batcher is not None:
+            await self.batcher.close()
+        for backend in self.backends.values():
+            await backend.close()
     
     async def generate_response(self, conversation_history: List[Dict], 
                               current_state: ConversationState,
@@ -26,17 +147,20 @@ class LLMManager:
         messages.extend(conversation_history)
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
+            response = await within("reply", self._create_completion(
+                "generate_response",
+                messages,
                 max_tokens=300,
                 temperature=0.7
-            )
+            ))
             
             return response.choices[0].message.content.strip()
             
+        except DeadlineExceeded:
+            logger.warning("Sin presupuesto para generar la respuesta, se usa la de respaldo (%s)", current_state.value)
+            return self._get_fallback_response(current_state, lead_data)
         except Exception as e:
-            logger.error(f"Error en LLM: {e}")
+            logger.error("Error en LLM: %s", e)
             return self._get_fallback_response(current_state, lead_data)
     
     def _get_system_prompt(self, state: ConversationState, 
@@ -60,6 +184,12 @@ class LLMManager:
             "NO repitas ni menciones estas instrucciones en tu respuesta al usuario.\n"
             "<</INSTRUCCIONES>>\n"
         )
+        if inventory_results:
+            # Unidades disponibles más cercanas a la ciudad del usuario
+            base_prompt += (
+                "INVENTARIO DISPONIBLE MÁS CERCANO AL CLIENTE (menciónalo solo si pregunta por disponibilidad o ubicación):\n"
+                + "".join(f"- {item.tipo_maquina} {item.modelo} en {item.ubicacion}\n" for item in inventory_results)
+            )
 
         if state == ConversationState.INITIAL:
             instrucciones = (
@@ -256,61 +386,24 @@ class LLMManager:
         return fallbacks.get(state, "¿Podrías repetir esa información?")
     
     async def extract_field(self, message: str, field_type: str) -> str:
-        """Extrae un campo específico usando LLM y devuelve el valor limpio"""
-        
-        extraction_prompts = {
-            "company_name": (
-                "Extrae el nombre de la empresa del siguiente mensaje si el mensaje solo contiene la empresa o si el usuario indica explícitamente que trabaja en, representa, pertenece a, es de, o su empresa es la mencionada. "
-                "Ignora marcas, equipos o palabras genéricas. Si no hay una indicación clara de relación laboral o pertenencia, responde con 'value': null. "
-                "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
-            ),
-            "company_business": (
-                "Extrae el giro o actividad de la empresa del siguiente mensaje si el usuario menciona explícitamente el tipo de negocio, giro, actividad o sector de su empresa. "
-                "Ignora nombres de empresas, marcas o equipos. Si no hay una indicación clara del giro empresarial, responde con 'value': null. "
-                "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
-            ),
-            "name": (
-                "Extrae el nombre de la persona del siguiente mensaje si el mensaje solo contiene un nombre o si el usuario lo menciona explícitamente como su nombre, o si se presenta como tal. "
-                "Ignora saludos, apodos, nombres de empresas, marcas o equipos. Si no hay una indicación clara de nombre personal, responde con 'value': null. "
-                "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
-            ),
-            "phone": (
-                "Extrae el número de teléfono del siguiente mensaje si el usuario lo proporciona de cualquier forma, por ejemplo: 'mi número es', 'puedes contactarme al', 'es', 'te dejo mi número', etc. "
-                "Acepta cualquier número con formato de teléfono (dígitos, espacios, guiones, paréntesis, etc.) que parezca un número de contacto. Si no hay un número de teléfono válido, responde con 'value': null. "
-                "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
-            ),
-            "email": (
-                "Extrae la dirección de email del siguiente mensaje si el mensaje solo contiene un email o si el usuario la proporciona explícitamente como su correo electrónico, el correo de su empresa o el correo al que se puede contactar. "
-                "Ignora textos que no tengan formato de email o que no estén acompañados de una indicación clara de ser un email. Si no hay un email válido, responde con 'value': null. "
-                "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
-            ),
-            "equipment": (
-                "Extrae el tipo de equipo o maquinaria del siguiente mensaje si el mensaje solo contiene un tipo de equipo o maquinaria o si el usuario lo menciona explícitamente como el equipo que busca, requiere o le interesa. "
-                "Ignora menciones genéricas, marcas, empresas o equipos que no sean solicitados explícitamente. Si no hay una indicación clara de equipo de interés, responde con 'value': null. "
-                "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
-            ),
-            "is_distributor": (
-                "Determina si el usuario es distribuidor basándote en el siguiente mensaje. "
-                "Si el usuario menciona que es distribuidor, revendedor, que va a revender, distribuir, rentar, o cualquier actividad comercial, responde con 'value': true. "
-                "Si el usuario menciona que es para uso propio, de su empresa, o uso final, responde con 'value': false. "
-                "Si no hay una indicación clara, responde con 'value': null. "
-                "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
-            ),
-            "use_type": (
-                "Determina el tipo de uso del equipo basándote en el siguiente mensaje. "
-                "Si el usuario menciona que es para uso propio, de su empresa, o uso final, responde con 'value': 'uso_empresa'. "
-                "Si el usuario menciona que es para revender, distribuir, rentar, o cualquier actividad comercial, responde con 'value': 'venta'. "
-                "Si no hay una indicación clara, responde con 'value': null. "
-                "Responde ÚNICAMENTE en formato JSON con la clave 'value'."
-            )
-        }
+        """Extrae un campo específico usando LLM y devuelve el valor limpio (vacío si se agota el presupuesto)"""
+        try:
+            if self.batcher is not None:
+                return await within("extract", self.batcher.extract(field_type, message))
+            return await within("extract", self._extract_field_single(message, field_type))
+        except DeadlineExceeded:
+            logger.warning("Sin presupuesto para extraer %s", field_type)
+            return ""
+
+    async def _extract_field_single(self, message: str, field_type: str) -> str:
+        """Extrae un campo con una llamada propia al LLM"""
         
-        prompt = f"{extraction_prompts[field_type]}\n\nMensaje: {message}"
+        prompt = f"{EXTRACTION_PROMPTS[field_type]}\n\nMensaje: {message}"
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
+            response = await self._create_completion(
+                f"extract_field.{field_type}",
+                [{"role": "user", "content": prompt}],
                 max_tokens=100,
                 temperature=0.1
             )
@@ -319,7 +412,7 @@ class LLMManager:
             return self._parse_json_response(result)
             
         except Exception as e:
-            logger.error(f"Error extrayendo {field_type}: {e}")
+            logger.error("Error extrayendo %s: %s", field_type, e)
             return ""
 
     async def extract_quotation_data(self, message: str) -> Dict[str, str]:
@@ -339,20 +432,77 @@ class LLMManager:
         )
         
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
+            response = await within("extract", self._create_completion(
+                "extract_quotation_data",
+                [{"role": "user", "content": prompt}],
                 max_tokens=200,
                 temperature=0.1
-            )
+            ))
             
             result = response.choices[0].message.content.strip()
             return self._parse_quotation_data_response(result)
             
+        except DeadlineExceeded:
+            logger.warning("Sin presupuesto para extraer los datos de cotización")
+            return {}
         except Exception as e:
-            logger.error(f"Error extrayendo datos de cotización: {e}")
+            logger.error("Error extrayendo datos de cotización: %s", e)
             return {}
 
+    async def extract_quotation_data_parallel(self, message: str, missing_fields: List[str],
+                                              max_concurrency: int = 4) -> Dict[str, Dict[str, Any]]:
+        """Extrae los datos de cotización combinando extract_quotation_data con extract_field
+        para los campos que aún faltan en el lead, todo en paralelo y con límite de concurrencia.
+
+        Devuelve {campo: {'value': str, 'confidence': float}} con el valor de mayor confianza por campo.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _limited(coro_factory):
+            async with semaphore:
+                return await coro_factory()
+
+        field_types = [field for field in missing_fields if field in QUOTATION_FIELDS]
+        results = await asyncio.gather(
+            _limited(lambda: self.extract_quotation_data(message)),
+            *[_limited(lambda field=field: self.extract_field(message, field)) for field in field_types],
+            return_exceptions=True
+        )
+
+        candidates: Dict[str, List[Tuple[str, float]]] = {}
+
+        combined = results[0] if isinstance(results[0], dict) else {}
+        for field in QUOTATION_FIELDS:
+            value = normalize_extracted_value(combined.get(field))
+            if value:
+                candidates.setdefault(field, []).append((value, self._field_confidence(field, value, 'combined')))
+
+        for field, result in zip(field_types, results[1:]):
+            if isinstance(result, Exception):
+                logger.error("Error extrayendo %s en paralelo: %s", field, result)
+                continue
+            value = normalize_extracted_value(result)
+            if value:
+                candidates.setdefault(field, []).append((value, self._field_confidence(field, value, 'field')))
+
+        return {field: self._merge_candidates(values) for field, values in candidates.items()}
+
+    def _field_confidence(self, field_type: str, value: str, source: str) -> float:
+        """Calcula la confianza de un valor extraído según su origen y su formato"""
+        confidence = EXTRACTION_CONFIDENCE[source]
+        validator = FIELD_VALIDATORS.get(field_type)
+        if validator:
+            confidence = confidence + 0.15 if validator.match(value) else confidence * 0.3
+        return round(min(confidence, 1.0), 2)
+
+    def _merge_candidates(self, candidates: List[Tuple[str, float]]) -> Dict[str, Any]:
+        """Elige el valor de mayor confianza; si ambas extracciones coinciden se refuerza la confianza"""
+        value, confidence = max(candidates, key=lambda candidate: candidate[1])
+        matches = [c for c in candidates if c[0].strip().lower() == value.strip().lower()]
+        if len(matches) > 1:
+            confidence = min(confidence + 0.15, 1.0)
+        return {'value': value, 'confidence': round(confidence, 2)}
+
     def _parse_quotation_data_response(self, result: str) -> Dict[str, str]:
         """Parsea la respuesta JSON de datos de cotización"""
         
@@ -377,7 +527,7 @@ class LLMManager:
                 'phone': parsed.get('phone', '')
             }
         except json.JSONDecodeError:
-            logger.warning(f"JSON inválido en datos de cotización: {result}")
+            logger.warning("JSON inválido en datos de cotización: %s", result)
             return {}
 
     def _parse_json_response(self, result: str) -> str:
@@ -396,29 +546,21 @@ class LLMManager:
         try:
             # Intentar parsear como JSON
             parsed = json.loads(result)
-            value = parsed.get('value')
-            
-            # Normalizar valores nulos o vacíos
-            if value is None or (isinstance(value, str) and value.strip().lower() in ('null', '', 'n/a')):
-                return ""
-            
-            return str(value).strip()
+            return normalize_extracted_value(parsed.get('value'))
             
         except json.JSONDecodeError:
             # Fallback: extraer valor usando regex
-            logger.warning(f"JSON inválido, usando fallback: {result}")
+            logger.warning("JSON inválido, usando fallback: %s", result)
             
             # Buscar patrón "value": "contenido"
             value_match = re.search(r'"value":\s*"([^"]*)"', result)
             if value_match:
-                value = value_match.group(1)
-                return "" if value.lower() in ('null', 'n/a') else value
+                return normalize_extracted_value(value_match.group(1))
             
             # Buscar patrón value: contenido (sin comillas)
             value_match = re.search(r'"?value"?:\s*([^,}\n]+)', result)
             if value_match:
-                value = value_match.group(1).strip().strip('"')
-                return "" if value.lower() in ('null', 'n/a') else value
+                return normalize_extracted_value(value_match.group(1).strip().strip('"'))
             
             # Si todo falla, devolver vacío
             return ""
\ No newline at end of file
@@ -0,0 +1,176 @@
+"""
+Backends de inferencia para LLMManager: Groq (remoto) y un servidor local estilo llama.cpp
+
+Todos exponen `complete(messages, max_tokens, temperature)` y devuelven una respuesta con la
+forma de la API de chat de OpenAI (`choices[0].message.content` y `usage`), así el resto de
+LLMManager no depende del proveedor. El backend de cada tarea (`generate_response`,
+`extract_field.<campo>`, `extract_field_batch.<campo>`, `extract_quotation_data`) se elige con
+reglas `patrón=backend` (fnmatch), por ejemplo `extract*=local` para extraer en local y
+responder con Groq.
+
+El backend local habla con `llama-server` de llama.cpp (modelo GGUF en CPU) por su API
+compatible con OpenAI. El servidor hace el batching continuo entre las solicitudes en vuelo de
+distintas conversaciones (`--parallel N`); el cliente mantiene hasta N conexiones abiertas para
+que esas solicitudes lleguen a la vez y pide `cache_prompt` para reutilizar la caché KV del
+prefijo común (el prompt de sistema o la instrucción de extracción, que siempre van primero).
+"""
+
+import abc
+import fnmatch
+import logging
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+GROQ_MODEL = "meta-llama/llama-4-scout-17b-16e-instruct"
+
+LLM_BACKEND_REQUESTS = REGISTRY.counter(
+    "chatbot_llm_backend_requests_total", "Solicitudes al LLM por backend y resultado", ["backend", "status"]
+)
+LLM_CACHED_PROMPT_TOKENS = REGISTRY.counter(
+    "chatbot_llm_cached_prompt_tokens_total", "Tokens de prompt servidos desde la caché de prefijos", ["backend"]
+)
+
+
+class LLMBackend(abc.ABC):
+    """Interfaz de un backend de completions de chat"""
+
+    name = "base"
+
+    @abc.abstractmethod
+    async def complete(self, messages: List[Dict], max_tokens: int, temperature: float):
+        """Devuelve la respuesta con la forma de la API de chat de OpenAI"""
+
+    async def close(self):
+        pass
+
+
+class GroqBackend(LLMBackend):
+    """Groq por su SDK asíncrono; el cliente se crea en el primer uso para no importar groq al arrancar"""
+
+    name = "groq"
+
+    def __init__(self, api_key: str, http_client=None, model: str = GROQ_MODEL):
+        self.api_key = api_key
+        self.http_client = http_client
+        self.model = model
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from groq import AsyncGroq
+            self._client = AsyncGroq(api_key=self.api_key, http_client=self.http_client)
+        return self._client
+
+    @client.setter
+    def client(self, value):
+        self._client = value
+
+    async def complete(self, messages: List[Dict], max_tokens: int, temperature: float):
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature
+            )
+        except Exception:
+            LLM_BACKEND_REQUESTS.inc(backend=self.name, status="error")
+            raise
+        LLM_BACKEND_REQUESTS.inc(backend=self.name, status="ok")
+        return response
+
+
+class LlamaCppBackend(LLMBackend):
+    """Servidor local de llama.cpp (`llama-server -m modelo.gguf --parallel N --cont-batching`)"""
+
+    name = "local"
+
+    def __init__(self, base_url: str = "http://127.0.0.1:8080", model: str = "local", parallel: int = 4,
+                 cache_prompt: bool = True, seed: Optional[int] = None, timeout: float = 60.0):
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.parallel = parallel
+        self.cache_prompt = cache_prompt
+        self.seed = seed  # Con temperatura y semilla fijas las respuestas son reproducibles
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Un cliente compartido: las conexiones abiertas permiten N solicitudes simultáneas al servidor
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.parallel * 2, max_keepalive_connections=self.parallel * 2)
+            )
+        return self._client
+
+    async def complete(self, messages: List[Dict], max_tokens: int, temperature: float):
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "cache_prompt": self.cache_prompt
+        }
+        if self.seed is not None:
+            payload["seed"] = self.seed
+        try:
+            response = await self.client.post("/v1/chat/completions", json=payload)
+            response.raise_for_status()
+            data = response.json()
+        except Exception:
+            LLM_BACKEND_REQUESTS.inc(backend=self.name, status="error")
+            raise
+        LLM_BACKEND_REQUESTS.inc(backend=self.name, status="ok")
+        return self._to_response(data)
+
+    def _to_response(self, data: Dict):
+        """Convierte el JSON del servidor al objeto de respuesta que usa LLMManager"""
+        usage = data.get("usage") or {}
+        timings = data.get("timings") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        if "prompt_n" in timings and prompt_tokens:
+            # prompt_n: tokens que el servidor tuvo que evaluar; el resto salió de la caché KV
+            LLM_CACHED_PROMPT_TOKENS.inc(max(prompt_tokens - timings["prompt_n"], 0), backend=self.name)
+        return SimpleNamespace(
+            choices=[
+                SimpleNamespace(message=SimpleNamespace(content=choice["message"]["content"]))
+                for choice in data.get("choices", [])
+            ],
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=usage.get("completion_tokens", 0))
+        )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def parse_task_backends(spec: str) -> List[Tuple[str, str]]:
+    """Reglas `patrón=backend` separadas por comas, por ejemplo 'extract*=local,generate_response=groq'"""
+    rules = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        pattern, _, backend = item.partition("=")
+        if not backend.strip():
+            raise ValueError(f"Regla de backend inválida: {item!r}")
+        rules.append((pattern.strip(), backend.strip()))
+    return rules
+
+
+def select_backend(task: str, rules: List[Tuple[str, str]], default: str) -> str:
+    """Primer backend cuya regla coincide con la tarea (o el de por defecto)"""
+    for pattern, backend in rules:
+        if fnmatch.fnmatchcase(task, pattern):
+            return backend
+    return default
@@ -0,0 +1,307 @@
+"""
+Ubicación del cliente y del inventario sin servicios externos
+
+Las ubicaciones (texto libre de `InventoryItem.ubicacion` y los mensajes del usuario) se
+geocodifican con un gazetteer local de ciudades y estados de México; un estado sin ciudad se
+ubica en su capital. Los sitios con coordenadas se indexan en un KD-tree sobre vectores
+unitarios 3D (la distancia euclidiana entre ellos es monótona con la distancia sobre la
+esfera), y la búsqueda best-first recorre los sitios del más cercano al más lejano hasta
+reunir las unidades disponibles que se piden.
+"""
+
+import heapq
+import logging
+import math
+import re
+import unicodedata
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from models import InventoryItem, get_equipment_family
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0
+
+
+@dataclass(frozen=True)
+class Place:
+    name: str
+    state: str
+    lat: float
+    lon: float
+    kind: str = "city"  # "city" o "state" (ubicado en su capital)
+
+
+# Ciudad, estado, latitud, longitud
+_CITIES = [
+    ("Aguascalientes", "Aguascalientes", 21.88, -102.29),
+    ("Mexicali", "Baja California", 32.62, -115.45),
+    ("Tijuana", "Baja California", 32.51, -117.04),
+    ("Ensenada", "Baja California", 31.87, -116.60),
+    ("La Paz", "Baja California Sur", 24.14, -110.31),
+    ("San José del Cabo", "Baja California Sur", 23.06, -109.70),
+    ("Cabo San Lucas", "Baja California Sur", 22.89, -109.92),
+    ("Campeche", "Campeche", 19.85, -90.53),
+    ("Ciudad del Carmen", "Campeche", 18.65, -91.83),
+    ("Tuxtla Gutiérrez", "Chiapas", 16.75, -93.12),
+    ("Tapachula", "Chiapas", 14.91, -92.26),
+    ("Chihuahua", "Chihuahua", 28.63, -106.09),
+    ("Ciudad Juárez", "Chihuahua", 31.69, -106.42),
+    ("Ciudad de México", "Ciudad de México", 19.43, -99.13),
+    ("Saltillo", "Coahuila", 25.42, -101.00),
+    ("Torreón", "Coahuila", 25.54, -103.41),
+    ("Monclova", "Coahuila", 26.91, -101.42),
+    ("Piedras Negras", "Coahuila", 28.70, -100.52),
+    ("Colima", "Colima", 19.24, -103.72),
+    ("Manzanillo", "Colima", 19.05, -104.32),
+    ("Durango", "Durango", 24.02, -104.65),
+    ("Gómez Palacio", "Durango", 25.57, -103.50),
+    ("Guanajuato", "Guanajuato", 21.02, -101.26),
+    ("León", "Guanajuato", 21.12, -101.68),
+    ("Irapuato", "Guanajuato", 20.67, -101.35),
+    ("Celaya", "Guanajuato", 20.52, -100.81),
+    ("Silao", "Guanajuato", 20.94, -101.43),
+    ("Chilpancingo", "Guerrero", 17.55, -99.50),
+    ("Acapulco", "Guerrero", 16.85, -99.82),
+    ("Pachuca", "Hidalgo", 20.12, -98.73),
+    ("Guadalajara", "Jalisco", 20.67, -103.35),
+    ("Zapopan", "Jalisco", 20.72, -103.39),
+    ("Tlaquepaque", "Jalisco", 20.64, -103.31),
+    ("Puerto Vallarta", "Jalisco", 20.65, -105.23),
+    ("Toluca", "Estado de México", 19.29, -99.66),
+    ("Ecatepec", "Estado de México", 19.60, -99.06),
+    ("Naucalpan", "Estado de México", 19.48, -99.24),
+    ("Tlalnepantla", "Estado de México", 19.54, -99.19),
+    ("Morelia", "Michoacán", 19.70, -101.19),
+    ("Uruapan", "Michoacán", 19.42, -102.06),
+    ("Lázaro Cárdenas", "Michoacán", 17.96, -102.20),
+    ("Cuernavaca", "Morelos", 18.92, -99.23),
+    ("Tepic", "Nayarit", 21.50, -104.89),
+    ("Monterrey", "Nuevo León", 25.69, -100.32),
+    ("Apodaca", "Nuevo León", 25.78, -100.19),
+    ("San Pedro Garza García", "Nuevo León", 25.66, -100.40),
+    ("Oaxaca", "Oaxaca", 17.07, -96.73),
+    ("Salina Cruz", "Oaxaca", 16.17, -95.19),
+    ("Puebla", "Puebla", 19.04, -98.21),
+    ("Tehuacán", "Puebla", 18.46, -97.39),
+    ("Querétaro", "Querétaro", 20.59, -100.39),
+    ("San Juan del Río", "Querétaro", 20.39, -99.99),
+    ("Chetumal", "Quintana Roo", 18.50, -88.30),
+    ("Cancún", "Quintana Roo", 21.16, -86.85),
+    ("Playa del Carmen", "Quintana Roo", 20.63, -87.08),
+    ("San Luis Potosí", "San Luis Potosí", 22.16, -100.99),
+    ("Ciudad Valles", "San Luis Potosí", 21.99, -99.01),
+    ("Culiacán", "Sinaloa", 24.81, -107.39),
+    ("Mazatlán", "Sinaloa", 23.25, -106.41),
+    ("Los Mochis", "Sinaloa", 25.79, -108.99),
+    ("Hermosillo", "Sonora", 29.07, -110.96),
+    ("Ciudad Obregón", "Sonora", 27.49, -109.94),
+    ("Nogales", "Sonora", 31.31, -110.94),
+    ("Villahermosa", "Tabasco", 17.99, -92.93),
+    ("Ciudad Victoria", "Tamaulipas", 23.74, -99.15),
+    ("Reynosa", "Tamaulipas", 26.09, -98.28),
+    ("Matamoros", "Tamaulipas", 25.87, -97.50),
+    ("Nuevo Laredo", "Tamaulipas", 27.48, -99.52),
+    ("Tampico", "Tamaulipas", 22.23, -97.86),
+    ("Tlaxcala", "Tlaxcala", 19.32, -98.24),
+    ("Xalapa", "Veracruz", 19.54, -96.91),
+    ("Veracruz", "Veracruz", 19.17, -96.13),
+    ("Coatzacoalcos", "Veracruz", 18.13, -94.46),
+    ("Poza Rica", "Veracruz", 20.53, -97.46),
+    ("Córdoba", "Veracruz", 18.88, -96.93),
+    ("Mérida", "Yucatán", 20.97, -89.62),
+    ("Zacatecas", "Zacatecas", 22.77, -102.58),
+    ("Fresnillo", "Zacatecas", 23.17, -102.87),
+]
+
+# Capital de cada estado (el estado sin ciudad se ubica ahí)
+_STATE_CAPITALS = {
+    "Aguascalientes": "Aguascalientes", "Baja California": "Mexicali", "Baja California Sur": "La Paz",
+    "Campeche": "Campeche", "Chiapas": "Tuxtla Gutiérrez", "Chihuahua": "Chihuahua",
+    "Ciudad de México": "Ciudad de México", "Coahuila": "Saltillo", "Colima": "Colima",
+    "Durango": "Durango", "Guanajuato": "Guanajuato", "Guerrero": "Chilpancingo", "Hidalgo": "Pachuca",
+    "Jalisco": "Guadalajara", "Estado de México": "Toluca", "Michoacán": "Morelia",
+    "Morelos": "Cuernavaca", "Nayarit": "Tepic", "Nuevo León": "Monterrey", "Oaxaca": "Oaxaca",
+    "Puebla": "Puebla", "Querétaro": "Querétaro", "Quintana Roo": "Chetumal",
+    "San Luis Potosí": "San Luis Potosí", "Sinaloa": "Culiacán", "Sonora": "Hermosillo",
+    "Tabasco": "Villahermosa", "Tamaulipas": "Ciudad Victoria", "Tlaxcala": "Tlaxcala",
+    "Veracruz": "Xalapa", "Yucatán": "Mérida", "Zacatecas": "Zacatecas",
+}
+
+# Abreviaturas y nombres alternos (ya normalizados) -> nombre del gazetteer
+_ALIASES = {
+    "cdmx": "Ciudad de México", "df": "Ciudad de México", "distrito federal": "Ciudad de México",
+    "mexico df": "Ciudad de México", "mty": "Monterrey", "gdl": "Guadalajara", "qro": "Querétaro",
+    "slp": "San Luis Potosí", "edomex": "Estado de México", "edo mex": "Estado de México",
+    "edo de mexico": "Estado de México", "jalapa": "Xalapa", "los cabos": "San José del Cabo",
+    "san pedro garza garcia": "San Pedro Garza García", "nl": "Nuevo León",
+    "coahuila de zaragoza": "Coahuila", "michoacan de ocampo": "Michoacán",
+    "veracruz de ignacio de la llave": "Veracruz", "tuxtla": "Tuxtla Gutiérrez",
+}
+
+
+def normalize(text: str) -> str:
+    """Minúsculas sin acentos ni puntuación; 'cd.' se expande a 'ciudad'"""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r"[^a-z0-9ñ]+", " ", text).strip()
+    return re.sub(r"\bcd\b", "ciudad", text)
+
+
+def _build_gazetteer() -> Dict[str, Place]:
+    places: Dict[str, Place] = {}
+    cities = {name: Place(name, state, lat, lon) for name, state, lat, lon in _CITIES}
+    for state, capital in _STATE_CAPITALS.items():
+        city = cities[capital]
+        places[normalize(state)] = Place(state, state, city.lat, city.lon, "state")
+    # Las ciudades homónimas de su estado (Chihuahua, Durango...) prevalecen sobre el estado
+    for city in cities.values():
+        places[normalize(city.name)] = city
+    for alias, target in _ALIASES.items():
+        places[alias] = places[normalize(target)]
+    return places
+
+
+GAZETTEER: Dict[str, Place] = _build_gazetteer()
+_NAMES_PATTERN = "|".join(re.escape(name) for name in sorted(GAZETTEER, key=len, reverse=True))
+_PLACE_RE = re.compile(r"\b(" + _NAMES_PATTERN + r")\b")
+# En los mensajes del usuario se exige una expresión locativa antes del lugar ("estoy en Mérida",
+# "soy de Monterrey", "envío a Puebla"). Un "de" o "a" sueltos no bastan: "Ana de León" o
+# "atiende a Córdoba" son apellidos, no ciudades
+_LOCATIVE_CUES = [
+    r"en", r"desde", r"hacia", r"rumbo a", r"cerca de", r"zona de", r"zona",
+    r"(?:soy|somos|vengo|venimos|escribo|escribimos|hablo|hablamos) de",
+    r"(?:envio|envios|entrega|entregas|flete|traslado|llevar|llevarlo|llevarla|mandar|enviar|entregar) a",
+]
+_USER_PLACE_RE = re.compile(
+    r"\b(?:" + "|".join(_LOCATIVE_CUES) + r")\s+(?:la\s+|el\s+)?(" + _NAMES_PATTERN + r")\b"
+)
+
+
+def find_place(text: Optional[str], require_preposition: bool = False) -> Optional[Place]:
+    """Primera ciudad mencionada en el texto (o el primer estado si no hay ciudad)"""
+    if not text:
+        return None
+    pattern = _USER_PLACE_RE if require_preposition else _PLACE_RE
+    matches = [GAZETTEER[match.group(1)] for match in pattern.finditer(normalize(text))]
+    if not matches:
+        return None
+    return next((place for place in matches if place.kind == "city"), matches[0])
+
+
+def extract_user_place(message: str) -> Optional[Place]:
+    """Ciudad (o estado) del usuario mencionada en un mensaje de la conversación"""
+    return find_place(message, require_preposition=True)
+
+
+def to_unit_vector(lat: float, lon: float) -> Tuple[float, float, float]:
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def chord_to_km(squared_chord: float) -> float:
+    """Distancia sobre la esfera a partir de la cuerda al cuadrado entre vectores unitarios"""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(squared_chord) / 2))
+
+
+class _Node:
+    __slots__ = ("point", "value", "axis", "left", "right")
+
+    def __init__(self, point, value, axis, left, right):
+        self.point = point
+        self.value = value
+        self.axis = axis
+        self.left = left
+        self.right = right
+
+
+class KDTree:
+    """KD-tree estático de puntos 3D con búsqueda best-first (vecinos en orden de distancia)"""
+
+    def __init__(self, points: Sequence[Tuple[Tuple[float, float, float], object]]):
+        self.size = len(points)
+        self.root = self._build(list(points))
+
+    def _build(self, points: List) -> Optional[_Node]:
+        if not points:
+            return None
+        # Se divide por el eje de mayor dispersión, en la mediana
+        axis = max(range(3), key=lambda a: max(p[0][a] for p in points) - min(p[0][a] for p in points))
+        points.sort(key=lambda p: p[0][axis])
+        median = len(points) // 2
+        point, value = points[median]
+        return _Node(point, value, axis, self._build(points[:median]), self._build(points[median + 1:]))
+
+    def iter_nearest(self, target: Tuple[float, float, float]) -> Iterator[Tuple[float, object]]:
+        """Genera (distancia euclidiana al cuadrado, valor) del punto más cercano al más lejano"""
+        if self.root is None:
+            return
+        tx, ty, tz = target
+        counter = 0
+        # (cota inferior, desempate, es_punto, nodo): un punto sale cuando ninguna rama pendiente puede tener uno más cercano
+        heap = [(0.0, counter, False, self.root)]
+        while heap:
+            bound, _, is_point, node = heapq.heappop(heap)
+            if is_point:
+                yield bound, node.value
+                continue
+            px, py, pz = node.point
+            counter += 1
+            heapq.heappush(heap, ((px - tx) ** 2 + (py - ty) ** 2 + (pz - tz) ** 2, counter, True, node))
+            diff = target[node.axis] - node.point[node.axis]
+            near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+            if near is not None:
+                counter += 1
+                heapq.heappush(heap, (bound, counter, False, near))
+            if far is not None:
+                counter += 1
+                heapq.heappush(heap, (max(bound, diff * diff), counter, False, far))
+
+    def nearest(self, target: Tuple[float, float, float], k: int = 1) -> List[Tuple[float, object]]:
+        results = []
+        for item in self.iter_nearest(target):
+            results.append(item)
+            if len(results) >= k:
+                break
+        return results
+
+
+class LocationIndex:
+    """Índice espacial del inventario: sitios geocodificados con sus unidades disponibles por familia"""
+
+    def __init__(self, items: Sequence[InventoryItem], geocode: Callable[[str], Optional[Place]] = find_place):
+        sites: Dict[Place, Dict[str, List[InventoryItem]]] = {}
+        cache: Dict[str, Optional[Place]] = {}
+        self.unlocated = 0
+        for item in items:
+            if not item.disponible:
+                continue
+            if item.ubicacion not in cache:
+                cache[item.ubicacion] = geocode(item.ubicacion)
+            place = cache[item.ubicacion]
+            if place is None:
+                self.unlocated += 1
+                continue
+            sites.setdefault(place, {}).setdefault(get_equipment_family(item.tipo_maquina), []).append(item)
+        self.sites = sites
+        self.tree = KDTree([(to_unit_vector(place.lat, place.lon), place) for place in sites])
+
+    def nearest(self, place: Place, equipment: Optional[str] = None,
+                limit: int = 5) -> List[Tuple[InventoryItem, float]]:
+        """Hasta `limit` unidades disponibles (de la familia del equipo, si se indica) con su distancia en km"""
+        family = get_equipment_family(equipment) if equipment else None
+        if family in ("desconocido", "otro"):
+            family = None
+        results: List[Tuple[InventoryItem, float]] = []
+        for squared_chord, site in self.tree.iter_nearest(to_unit_vector(place.lat, place.lon)):
+            by_family = self.sites[site]
+            units = by_family.get(family, []) if family else [unit for group in by_family.values() for unit in group]
+            if not units:
+                continue
+            distance = chord_to_km(squared_chord)
+            for unit in units[:limit - len(results)]:
+                results.append((unit, distance))
+            if len(results) >= limit:
+                break
+        return results
@@ -0,0 +1,207 @@
+"""
+Configuración de logging para el hot path: handler en cola, muestreo, niveles por módulo y redacción de PII
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import sys
+from enum import Enum
+from typing import Dict, Optional
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Claves cuyo valor se oculta cuando se registran diccionarios (propiedades de HubSpot, datos de cotización)
+PII_KEYS = {
+    'firstname', 'name', 'email', 'phone', 'empresa_asociada', 'company_name',
+    'company_business', 'giro_empresa'
+}
+EMAIL_RE = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+# Teléfonos con prefijo internacional, con separadores, o 10 dígitos seguidos solo después de una
+# palabra de teléfono: un número pelado de 10 dígitos suele ser un telegram_id y se conserva
+PHONE_RE = re.compile(
+    r'\+\d{10,13}\b|\(?\b\d{2,3}\)?[\s\-.]\d{3,4}[\s\-.]\d{4}\b'
+    r'|\b((?:tel[eé]fono|tel|cel(?:ular)?|whats(?:app)?|n[uú]mero)\.?:?\s*)\d{10}\b',
+    re.IGNORECASE
+)
+# Conversiones de una cadena de formato %: clave opcional (%(clave)s) y tipo de conversión
+CONVERSION_RE = re.compile(r'%(?:\(([^)]*)\))?[#0\- +]*(?:\*|\d+)?(?:\.(?:\*|\d+))?[hlL]?([a-zA-Z%])')
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def redact_text(text: str) -> str:
+    """Oculta emails y teléfonos en un texto libre"""
+    return PHONE_RE.sub(lambda match: (match.group(1) or '') + '[phone]', EMAIL_RE.sub('[email]', text))
+
+
+def _redact_value(value):
+    if isinstance(value, dict):
+        return {
+            key: ('[redacted]' if key in PII_KEYS and item else _redact_value(item))
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return type(value)(_redact_value(item) for item in value)
+    return value
+
+
+class RedactingFormatter(logging.Formatter):
+    """Formatter que interpola el mensaje y oculta PII; corre en el hilo del QueueListener"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        if record.args:
+            args = record.args
+            if isinstance(args, dict):
+                args = _redact_value(args)
+            else:
+                args = tuple(_redact_value(arg) for arg in args)
+            record.msg = str(record.msg) % args
+            record.args = None
+        record.msg = redact_text(str(record.msg))
+        return super().format(record)
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar solo una fracción de los registros INFO/DEBUG; WARNING o superior siempre pasan"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or self.rate >= 1.0:
+            return True
+        if random.random() < self.rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class _Frozen:
+    """Texto de un argumento arbitrario tomado al emitir el log, en la forma que pide el mensaje"""
+
+    __slots__ = ('text',)
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def __str__(self):
+        return self.text
+
+    def __repr__(self):
+        return self.text
+
+
+def _snapshot(value, conversion: str = 'r'):
+    """Copia los contenedores y congela los objetos mutables de los argumentos de un log.
+
+    Solo se calcula la forma que usa el formato: `str()` para %s, `repr()` para %r y para los
+    elementos de un contenedor; con conversiones numéricas (%d, %f) el objeto pasa tal cual.
+    """
+    if value is None or isinstance(value, (str, bytes, int, float, Enum)):
+        return value
+    if isinstance(value, dict):
+        return {key: _snapshot(item) for key, item in value.items()}
+    if type(value) in (list, tuple, set, frozenset):
+        return type(value)(_snapshot(item) for item in value)
+    if conversion == 's':
+        return _Frozen(str(value))
+    if conversion == 'r':
+        return _Frozen(repr(value))
+    if conversion == 'a':
+        return _Frozen(ascii(value))
+    return value
+
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que no formatea en el hilo que emite: el mensaje se interpola en el listener.
+
+    QueueHandler.prepare() formatea el registro antes de encolarlo, lo que deja el costo de
+    formateo en el event loop. Aquí se encola el registro con una copia de sus argumentos, para
+    que el listener no lea diccionarios (propiedades del lead, datos de cotización) que el event
+    loop sigue modificando. prepare() solo corre para registros que pasaron el nivel del logger y
+    los filtros del handler (muestreo), y de cada argumento se toma solo la forma que usa el mensaje.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if not isinstance(record.msg, str):
+            record.msg = str(record.msg)
+        if record.args:
+            conversions = [(key, conversion) for key, conversion in CONVERSION_RE.findall(record.msg)
+                           if conversion != '%']
+            if isinstance(record.args, dict):
+                by_key = {key: conversion for key, conversion in conversions if key}
+                if by_key:
+                    record.args = {key: _snapshot(item, by_key.get(key, 'r'))
+                                   for key, item in record.args.items()}
+                else:
+                    # Un solo diccionario con %s: se formatea completo, sus valores con repr()
+                    record.args = _snapshot(record.args)
+            else:
+                kinds = [conversion for _, conversion in conversions]
+                record.args = tuple(
+                    _snapshot(arg, kinds[index] if index < len(kinds) else 's')
+                    for index, arg in enumerate(record.args)
+                )
+        return record
+
+
+def parse_module_levels(spec: str) -> Dict[str, int]:
+    """Convierte 'hubspot=WARNING,llm=DEBUG' en {'hubspot': 30, 'llm': 10}"""
+    levels: Dict[str, int] = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, level = item.partition('=')
+        levels[name.strip()] = logging.getLevelName(level.strip().upper())
+    return levels
+
+
+def setup_logging(level: str = 'INFO', module_levels: str = '', sample_rate: float = 1.0,
+                  mode: str = 'queue', redact: bool = True, stream=None) -> Optional[logging.handlers.QueueListener]:
+    """Configura el logging raíz.
+
+    mode='queue' usa LazyQueueHandler + QueueListener para que el I/O y el formateo no bloqueen
+    el event loop; mode='sync' escribe directamente (comportamiento anterior).
+    """
+    global _listener
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+    root.setLevel(level.upper())
+    for name, module_level in parse_module_levels(module_levels).items():
+        logging.getLogger(name).setLevel(module_level)
+
+    target = logging.StreamHandler(stream or sys.stderr)
+    target.setFormatter(RedactingFormatter(LOG_FORMAT) if redact else logging.Formatter(LOG_FORMAT))
+
+    if mode == 'sync':
+        handler = target
+    else:
+        handler = LazyQueueHandler(queue.SimpleQueue())
+        _listener = logging.handlers.QueueListener(handler.queue, target, respect_handler_level=True)
+        _listener.start()
+
+    if sample_rate < 1.0:
+        handler.addFilter(SamplingFilter(sample_rate))
+    root.addHandler(handler)
+    return _listener
+
+
+def stop_logging():
+    """Vacía la cola de logs y detiene el listener"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
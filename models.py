@@ -4,7 +4,7 @@ Modelos de datos para el chatbot
 
 from dataclasses import dataclass
 from enum import Enum
-from typing import Optional, List
+from typing import Optional, List, Dict, Any, FrozenSet, Iterable
 
 class ConversationState(Enum):
     INITIAL = "initial"
@@ -15,24 +15,148 @@ class ConversationState(Enum):
     WAITING_QUOTATION_DATA = "waiting_quotation_data"
     COMPLETED = "completed"
 
-@dataclass
 class Lead:
-    telegram_id: str
-    name: Optional[str] = None
-    equipment_interest: Optional[str] = None
-    machine_characteristics: Optional[List[str]] = None  # Lista de respuestas a preguntas del equipo
-    current_question_index: Optional[int] = None  # Índice de la pregunta actual en la secuencia
-    is_distributor: Optional[bool] = None  # True si es distribuidor, False si es cliente final
-    company_name: Optional[str] = None  # Nombre de la empresa
-    company_business: Optional[str] = None  # Giro de la empresa
-    email: Optional[str] = None
-    phone: Optional[str] = None
-    hubspot_contact_id: Optional[str] = None
-    created_at: Optional[str] = None
-    updated_at: Optional[str] = None
+    """Lead compacto (__slots__) que registra los campos modificados desde la última sincronización con el CRM"""
+
+    FIELDS = (
+        'telegram_id',
+        'name',
+        'equipment_interest',
+        'machine_characteristics',  # Lista de respuestas a preguntas del equipo
+        'current_question_index',  # Índice de la pregunta actual en la secuencia
+        'is_distributor',  # True si es distribuidor, False si es cliente final
+        'company_name',  # Nombre de la empresa
+        'company_business',  # Giro de la empresa
+        'email',
+        'phone',
+        'city',  # Ciudad (o estado) del usuario detectada en la conversación
+        'hubspot_contact_id',
+        'created_at',
+        'updated_at',
+        'force_new_contact',  # Tras /reset: la primera sincronización crea un contacto sin buscar el anterior
+    )
+    __slots__ = FIELDS + ('_dirty', 'avoided_syncs')
+
+    def __init__(self, telegram_id: str, name: Optional[str] = None,
+                 equipment_interest: Optional[str] = None,
+                 machine_characteristics: Optional[List[str]] = None,
+                 current_question_index: Optional[int] = None,
+                 is_distributor: Optional[bool] = None,
+                 company_name: Optional[str] = None,
+                 company_business: Optional[str] = None,
+                 email: Optional[str] = None,
+                 phone: Optional[str] = None,
+                 city: Optional[str] = None,
+                 hubspot_contact_id: Optional[str] = None,
+                 created_at: Optional[str] = None,
+                 updated_at: Optional[str] = None,
+                 force_new_contact: bool = False):
+        values = locals()
+        object.__setattr__(self, '_dirty', set())
+        object.__setattr__(self, 'avoided_syncs', 0)  # Llamadas al CRM evitadas por no haber cambios
+        for field in self.FIELDS:
+            object.__setattr__(self, field, values[field])
+            if values[field] is not None:
+                self._dirty.add(field)
+
+    def __setattr__(self, name: str, value: Any):
+        if name in self.FIELDS and getattr(self, name) != value:
+            self._dirty.add(name)
+        object.__setattr__(self, name, value)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Lead):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.FIELDS)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.FIELDS)
+        return f"Lead({fields})"
+
+    @property
+    def dirty_fields(self) -> FrozenSet[str]:
+        """Campos modificados desde la última sincronización exitosa"""
+        return frozenset(self._dirty)
+
+    def pop_dirty(self) -> FrozenSet[str]:
+        """Devuelve y limpia los campos modificados (antes de enviar al CRM)"""
+        dirty = frozenset(self._dirty)
+        self._dirty.clear()
+        return dirty
+
+    def mark_dirty(self, fields: Iterable[str]):
+        """Vuelve a marcar campos como modificados (por ejemplo, si la sincronización falló)"""
+        self._dirty.update(fields)
+
+    def add_machine_characteristic(self, characteristic: str):
+        """Agrega una característica reasignando la lista para que el cambio quede registrado"""
+        self.machine_characteristics = (self.machine_characteristics or []) + [characteristic]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+# Orden de los estados en el flujo (para métricas de embudo)
+STATE_ORDER = [
+    ConversationState.INITIAL,
+    ConversationState.WAITING_NAME,
+    ConversationState.WAITING_EQUIPMENT,
+    ConversationState.WAITING_EQUIPMENT_QUESTIONS,
+    ConversationState.WAITING_DISTRIBUTOR,
+    ConversationState.WAITING_QUOTATION_DATA,
+    ConversationState.COMPLETED,
+]
+
+def get_equipment_family(equipment_type: Optional[str]) -> str:
+    """Clasifica el equipo de interés en la familia que determina las preguntas del flujo"""
+    equipment_type = (equipment_type or '').lower()
+    if not equipment_type:
+        return 'desconocido'
+    if 'soldadora' in equipment_type or 'soldar' in equipment_type:
+        return 'soldadora'
+    if 'compresor' in equipment_type:
+        return 'compresor'
+    if 'torre' in equipment_type and 'iluminacion' in equipment_type:
+        return 'torre_iluminacion'
+    if 'lgmg' in equipment_type:
+        return 'lgmg'
+    if 'generador' in equipment_type:
+        return 'generador'
+    if 'rompedor' in equipment_type:
+        return 'rompedor'
+    return 'otro'
+
+# Etiqueta de cada pregunta específica por familia de equipo (una pregunta por etiqueta)
+EQUIPMENT_QUESTION_LABELS = {
+    'soldadora': ["Amperaje/electrodo requerido"],
+    'compresor': ["Capacidad de volumen de aire/herramienta"],
+    'torre_iluminacion': ["Requerimiento LED"],
+    'lgmg': ["Altura de trabajo necesaria", "Actividad a realizar", "Ubicación (exterior/interior)"],
+    'generador': ["Actividad para la que se requiere", "Capacidad en kVA o kW"],
+    'rompedor': ["Uso del rompedor"],
+}
+# Etiqueta para respuestas fuera de la secuencia de preguntas de la familia
+EQUIPMENT_FALLBACK_LABELS = {
+    'lgmg': "Características de trabajo LGMG",
+    'generador': "Características del generador",
+}
+
+def equipment_question_count(equipment_type: Optional[str]) -> int:
+    """Número de preguntas específicas que se hacen para el equipo (al menos una)"""
+    return len(EQUIPMENT_QUESTION_LABELS.get(get_equipment_family(equipment_type), [None]))
+
+def characteristic_description(equipment_type: Optional[str], message: str, question_index: int) -> str:
+    """Describe la respuesta del usuario según la pregunta del equipo que estaba contestando"""
+    family = get_equipment_family(equipment_type)
+    labels = EQUIPMENT_QUESTION_LABELS.get(family)
+    if labels and family in EQUIPMENT_FALLBACK_LABELS and question_index >= len(labels):
+        return f"{EQUIPMENT_FALLBACK_LABELS[family]}: {message}"
+    if labels:
+        return f"{labels[min(question_index, len(labels) - 1)]}: {message}"
+    return f"Características del equipo: {message}"
 
 @dataclass
 class InventoryItem:
     tipo_maquina: str
     modelo: str
-    ubicacion: str
\ No newline at end of file
+    ubicacion: str
+    disponible: bool = True
\ No newline at end of file
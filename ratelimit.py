@@ -0,0 +1,64 @@
+"""
+Limitadores de tasa (token bucket) para llamadas a APIs externas
+"""
+
+import asyncio
+import time
+from typing import Dict, Optional
+
+
+class TokenBucket:
+    """Token bucket: repone `rate` tokens por segundo y admite ráfagas de hasta `capacity`"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate debe ser mayor que cero")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Consume tokens si hay disponibles, sin esperar"""
+        self._refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1.0):
+        """Espera hasta que haya tokens suficientes y los consume (en orden de llegada)"""
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class KeyedTokenBuckets:
+    """Un token bucket por clave (por ejemplo, por usuario), descartando los llenos si hay demasiados"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, max_keys: int = 10_000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def try_acquire(self, key: str, tokens: float = 1.0) -> bool:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune()
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity)
+        return bucket.try_acquire(tokens)
+
+    def _prune(self):
+        """Descarta los buckets llenos (claves inactivas) para que el diccionario no crezca sin límite"""
+        for key, bucket in list(self._buckets.items()):
+            bucket.try_acquire(0)
+            if bucket.tokens >= bucket.capacity:
+                del self._buckets[key]
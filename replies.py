@@ -0,0 +1,171 @@
+"""
+Planificador de respuestas: plantillas para los turnos deterministas y LLM solo cuando hace falta
+
+En los estados con intención fija (pedir nombre, equipo, preguntas del equipo, distribuidor,
+datos de cotización) la respuesta es una variante redactada de antemano. Se recurre al LLM
+cuando el usuario hace una pregunta fuera de guion o cuando la extracción del turno falló
+(la conversación no avanzó), para que la respuesta atienda lo que dijo el usuario.
+"""
+
+import logging
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+from models import ConversationState, get_equipment_family
+
+logger = logging.getLogger(__name__)
+
+REPLY_SOURCE = REGISTRY.counter(
+    "chatbot_reply_source_total", "Respuestas por estado según su origen (plantilla o LLM) y motivo",
+    ["state", "source", "reason"]
+)
+REPLY_SECONDS_SAVED = REGISTRY.counter(
+    "chatbot_reply_llm_seconds_saved_total", "Latencia de generate_response estimada que se evitó con plantillas",
+    ["state"]
+)
+
+# Variantes por (estado, familia de equipo, índice de pregunta); None aplica a cualquier valor
+REPLY_TEMPLATES: Dict[Tuple[ConversationState, Optional[str], Optional[int]], List[str]] = {
+    (ConversationState.INITIAL, None, None): [
+        "¡Hola! Soy Juan, tu asistente de ventas especializado en maquinaria ligera. ¿Con quién tengo el gusto?",
+        "¡Hola! Soy Juan, asesor de ventas de maquinaria ligera. Para atenderte mejor, ¿cuál es tu nombre?",
+        "¡Bienvenido! Soy Juan y te ayudo a encontrar la maquinaria ligera que necesitas. ¿Con quién tengo el gusto?",
+    ],
+    (ConversationState.WAITING_NAME, None, None): [
+        "Para brindarte atención personalizada, ¿con quién tengo el gusto?",
+        "Para darte una atención personalizada, ¿me compartes tu nombre?",
+    ],
+    (ConversationState.WAITING_EQUIPMENT, None, None): [
+        "Mucho gusto{name}. ¿Qué modelo o equipo requiere? Así reviso la disponibilidad en inventario.",
+        "Gracias{name}. ¿Qué tipo de maquinaria estás buscando? Con eso reviso nuestro inventario.",
+        "¡Un gusto{name}! ¿Qué equipo necesitas? Lo consulto en nuestro inventario.",
+    ],
+    (ConversationState.WAITING_EQUIPMENT_QUESTIONS, 'soldadora', None): [
+        "¿Qué amperaje requiere?",
+        "¿Qué amperaje o tipo de electrodo necesita para la soldadora?",
+    ],
+    (ConversationState.WAITING_EQUIPMENT_QUESTIONS, 'compresor', None): [
+        "¿Qué capacidad de volumen de aire requiere?",
+        "¿Qué volumen de aire o qué herramienta va a conectar al compresor?",
+    ],
+    (ConversationState.WAITING_EQUIPMENT_QUESTIONS, 'torre_iluminacion', None): [
+        "¿La requiere de LED?",
+        "¿Necesita que la torre de iluminación sea LED?",
+    ],
+    (ConversationState.WAITING_EQUIPMENT_QUESTIONS, 'lgmg', 0): [
+        "¿Qué altura de trabajo necesita?",
+        "¿A qué altura de trabajo necesita llegar?",
+    ],
+    (ConversationState.WAITING_EQUIPMENT_QUESTIONS, 'lgmg', 1): [
+        "¿Qué actividad va a realizar?",
+        "¿Qué actividad va a realizar con la plataforma?",
+    ],
+    (ConversationState.WAITING_EQUIPMENT_QUESTIONS, 'lgmg', None): [
+        "¿Es en exterior o interior?",
+        "¿El trabajo será en exterior o en interior?",
+    ],
+    (ConversationState.WAITING_EQUIPMENT_QUESTIONS, 'generador', 0): [
+        "¿Para qué actividad lo requiere?",
+        "¿Para qué actividad necesita el generador?",
+    ],
+    (ConversationState.WAITING_EQUIPMENT_QUESTIONS, 'generador', None): [
+        "¿Qué capacidad en kVA o kW?",
+        "¿Qué capacidad necesita, en kVA o kW?",
+    ],
+    (ConversationState.WAITING_EQUIPMENT_QUESTIONS, 'rompedor', None): [
+        "¿Para qué lo vas a utilizar?",
+        "¿En qué tipo de trabajo vas a usar el rompedor?",
+    ],
+    (ConversationState.WAITING_EQUIPMENT_QUESTIONS, None, None): [
+        "¿Podrías darme más detalles sobre las características que necesitas?",
+        "¿Qué características necesitas en el equipo?",
+    ],
+    (ConversationState.WAITING_DISTRIBUTOR, None, None): [
+        "¿Es distribuidor?",
+        "Una pregunta más: ¿es distribuidor o es para uso de su empresa?",
+    ],
+    (ConversationState.WAITING_QUOTATION_DATA, None, None): [
+        "Para poder ayudarte con la cotización necesito estos datos:\n1. ¿Es para uso de la empresa o para venta?\n"
+        "2. Nombre completo\n3. Nombre y giro de tu empresa\n4. Correo electrónico\n5. Número telefónico",
+        "¡Perfecto! Para preparar tu cotización compárteme por favor:\n1. ¿Es para uso de la empresa o para venta?\n"
+        "2. Nombre completo\n3. Nombre y giro de tu empresa\n4. Correo electrónico\n5. Número telefónico",
+    ],
+}
+
+# Estados en los que el turno debe extraer un dato para avanzar
+EXTRACTION_STATES = {
+    ConversationState.WAITING_NAME,
+    ConversationState.WAITING_EQUIPMENT,
+    ConversationState.WAITING_DISTRIBUTOR,
+    ConversationState.WAITING_QUOTATION_DATA,
+}
+
+# Preguntas del usuario fuera de guion: signos de interrogación o arranques interrogativos
+QUESTION_RE = re.compile(
+    r"[¿?]|^\s*(qu[eé]|cu[aá]l(es)?|cu[aá]nto|c[oó]mo|d[oó]nde|cu[aá]ndo|por\s*qu[eé]|tienen|manejan|"
+    r"hay|venden|rentan|precio|me\s+puedes|podr[ií]as)\b",
+    re.IGNORECASE
+)
+
+
+class ReplyPlanner:
+    """Elige la respuesta de plantilla del turno o indica que se necesita el LLM"""
+
+    def __init__(self, templates: Optional[Dict] = None, ewma_alpha: float = 0.2):
+        self.templates = templates or REPLY_TEMPLATES
+        self.ewma_alpha = ewma_alpha
+        # Latencia media de generate_response por estado (para estimar lo ahorrado)
+        self.llm_latency: Dict[ConversationState, float] = {}
+        self.bypassed: Dict[ConversationState, int] = {}
+
+    def _variants(self, state: ConversationState, lead_data: Dict) -> Optional[List[str]]:
+        family = get_equipment_family(lead_data.get('equipment_interest'))
+        index = lead_data.get('current_question_index') or 0
+        for key in ((state, family, index), (state, family, None), (state, None, None)):
+            if key in self.templates:
+                return self.templates[key]
+        return None
+
+    def is_off_script(self, message: str) -> bool:
+        """True si el mensaje incluye una pregunta que la plantilla no respondería"""
+        return bool(QUESTION_RE.search(message))
+
+    def plan(self, telegram_id: str, state: ConversationState, previous_state: ConversationState,
+             message: str, lead_data: Dict, history: List[Dict]) -> Tuple[Optional[str], str]:
+        """Devuelve (respuesta, motivo); la respuesta es None si el turno necesita el LLM"""
+        if self.is_off_script(message):
+            return None, "off_script"
+        if state == previous_state and state in EXTRACTION_STATES:
+            return None, "extraction_failed"
+        variants = self._variants(state, lead_data)
+        if not variants:
+            return None, "no_template"
+
+        # Variante estable por usuario y turno, sin repetir la última respuesta enviada
+        last_reply = next((m['content'] for m in reversed(history) if m['role'] == 'assistant'), None)
+        start = zlib.crc32(f"{telegram_id}:{len(history)}".encode()) % len(variants)
+        name = lead_data.get('name')
+        for offset in range(len(variants)):
+            reply = variants[(start + offset) % len(variants)].replace("{name}", f", {name}" if name else "")
+            if reply != last_reply:
+                break
+        return reply, "template"
+
+    def record(self, state: ConversationState, source: str, reason: str, llm_seconds: Optional[float] = None):
+        """Registra el origen de la respuesta y actualiza la latencia media del LLM por estado"""
+        REPLY_SOURCE.inc(state=state.value, source=source, reason=reason)
+        if llm_seconds is not None:
+            previous = self.llm_latency.get(state)
+            self.llm_latency[state] = (
+                llm_seconds if previous is None
+                else previous + self.ewma_alpha * (llm_seconds - previous)
+            )
+        elif source == "template":
+            self.bypassed[state] = self.bypassed.get(state, 0) + 1
+            estimate = self.llm_latency.get(state)
+            if estimate is None and self.llm_latency:
+                estimate = sum(self.llm_latency.values()) / len(self.llm_latency)
+            if estimate:
+                REPLY_SECONDS_SAVED.inc(estimate, state=state.value)
@@ -0,0 +1,169 @@
+"""
+Pre-generación especulativa de la respuesta del turno
+
+El prompt de `generate_response` depende solo del estado siguiente, de la familia de equipo y
+del índice de pregunta, y casi siempre se pueden predecir antes de la extracción. Mientras la
+extracción y la sincronización con HubSpot corren, se genera la respuesta para el estado
+predicho; si la extracción termina en otro estado, la especulación se descarta. Un presupuesto
+de tokens desperdiciados por ventana de tiempo detiene la especulación si falla demasiado.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+from models import ConversationState, equipment_question_count, get_equipment_family
+from replies import EXTRACTION_STATES, QUESTION_RE
+
+logger = logging.getLogger(__name__)
+
+SPECULATION_OUTCOMES = REGISTRY.counter(
+    "chatbot_speculation_total", "Respuestas especulativas por estado predicho y resultado",
+    ["state", "outcome"]
+)
+SPECULATION_SECONDS_SAVED = REGISTRY.counter(
+    "chatbot_speculation_seconds_saved_total", "Tiempo de generación adelantado por especulaciones acertadas",
+    ["state"]
+)
+SPECULATION_WASTED_TOKENS = REGISTRY.counter(
+    "chatbot_speculation_wasted_tokens_total", "Tokens estimados de especulaciones descartadas"
+)
+
+
+def _estimate_tokens(text: str) -> int:
+    """Aproximación de tokens (~4 caracteres por token)"""
+    return len(text) // 4 + 1
+
+
+def predict_reply(state: ConversationState, lead, message: str) -> Optional[Tuple[ConversationState, Dict]]:
+    """Estado y lead_data con los que se generará la respuesta si la extracción del turno tiene éxito"""
+    lead_data = {
+        'equipment_interest': lead.equipment_interest,
+        'current_question_index': lead.current_question_index
+    }
+    if state == ConversationState.INITIAL:
+        return state, lead_data
+    family = get_equipment_family(message)
+    if QUESTION_RE.search(message) and state in EXTRACTION_STATES and not (
+        state == ConversationState.WAITING_EQUIPMENT and family not in ('otro', 'desconocido')
+    ):
+        # Una pregunta fuera de guion casi nunca trae el dato: el estado no avanza
+        return state, lead_data
+    if state == ConversationState.WAITING_NAME:
+        return ConversationState.WAITING_EQUIPMENT, lead_data
+    if state == ConversationState.WAITING_EQUIPMENT:
+        # El prompt solo depende de la familia: se predice con el texto del mensaje
+        if family in ('otro', 'desconocido'):
+            return None
+        return ConversationState.WAITING_EQUIPMENT_QUESTIONS, {
+            'equipment_interest': message, 'current_question_index': 0
+        }
+    if state == ConversationState.WAITING_EQUIPMENT_QUESTIONS:
+        index = lead.current_question_index or 0
+        if index < equipment_question_count(lead.equipment_interest) - 1:
+            return state, dict(lead_data, current_question_index=index + 1)
+        return ConversationState.WAITING_DISTRIBUTOR, lead_data
+    if state == ConversationState.WAITING_DISTRIBUTOR:
+        return ConversationState.WAITING_QUOTATION_DATA, lead_data
+    # WAITING_QUOTATION_DATA termina en COMPLETED, cuya respuesta es fija
+    return None
+
+
+def _prompt_key(state: ConversationState, lead_data: Dict) -> Tuple:
+    """Lo que determina el prompt de generate_response (ver LLMManager._get_system_prompt)"""
+    family = None
+    index = None
+    if state == ConversationState.WAITING_EQUIPMENT_QUESTIONS:
+        family = get_equipment_family(lead_data.get('equipment_interest'))
+        index = lead_data.get('current_question_index') or 0
+    return state, family, index
+
+
+class Speculation:
+    __slots__ = ('key', 'state', 'task', 'started', 'prompt_tokens', 'finished')
+
+    def __init__(self, key: Tuple, state: ConversationState, task: asyncio.Task, prompt_tokens: int):
+        self.key = key
+        self.state = state
+        self.task = task
+        self.started = time.monotonic()
+        self.prompt_tokens = prompt_tokens
+        self.finished: Optional[float] = None
+
+
+class ReplySpeculator:
+    """Lanza y resuelve respuestas especulativas con un tope de tokens desperdiciados por ventana"""
+
+    def __init__(self, llm, waste_token_budget: int = 50_000, budget_window: float = 3600.0):
+        self.llm = llm
+        self.waste_token_budget = waste_token_budget
+        self.budget_window = budget_window
+        self._window_started = time.monotonic()
+        self._wasted_in_window = 0
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self.wasted_tokens = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _budget_available(self) -> bool:
+        now = time.monotonic()
+        if now - self._window_started >= self.budget_window:
+            self._window_started = now
+            self._wasted_in_window = 0
+        return self._wasted_in_window < self.waste_token_budget
+
+    def start(self, state: ConversationState, lead, message: str, history: List[Dict],
+              inventory_results=None) -> Optional[Speculation]:
+        """Empieza a generar la respuesta para el estado predicho; None si no hay predicción o presupuesto"""
+        prediction = predict_reply(state, lead, message)
+        if prediction is None:
+            return None
+        next_state, lead_data = prediction
+        if not self._budget_available():
+            SPECULATION_OUTCOMES.inc(state=next_state.value, outcome="skipped_budget")
+            return None
+        history = list(history)
+        prompt_tokens = sum(_estimate_tokens(m['content']) for m in history) + _estimate_tokens(
+            self.llm._get_system_prompt(next_state, inventory_results, lead_data)
+        )
+        task = asyncio.ensure_future(
+            self.llm.generate_response(history, next_state, inventory_results, lead_data)
+        )
+        speculation = Speculation(_prompt_key(next_state, lead_data), next_state, task, prompt_tokens)
+        task.add_done_callback(lambda _: setattr(speculation, 'finished', time.monotonic()))
+        return speculation
+
+    async def take(self, speculation: Speculation, state: ConversationState, lead_data: Dict) -> Optional[str]:
+        """Devuelve la respuesta especulada si el turno terminó en el estado predicho; si no, la descarta"""
+        if _prompt_key(state, lead_data) != speculation.key:
+            self.discard(speculation)
+            return None
+        # Tiempo de generación que ya había transcurrido cuando se necesitó la respuesta
+        saved = (speculation.finished or time.monotonic()) - speculation.started
+        response = await speculation.task
+        self.hits += 1
+        self.seconds_saved += saved
+        SPECULATION_OUTCOMES.inc(state=speculation.state.value, outcome="hit")
+        SPECULATION_SECONDS_SAVED.inc(saved, state=speculation.state.value)
+        return response
+
+    def discard(self, speculation: Speculation):
+        """Cancela la especulación y suma sus tokens al presupuesto de desperdicio"""
+        tokens = speculation.prompt_tokens
+        if speculation.task.done() and not speculation.task.cancelled() and speculation.task.exception() is None:
+            tokens += _estimate_tokens(speculation.task.result())
+        else:
+            speculation.task.cancel()
+        self.misses += 1
+        self.wasted_tokens += tokens
+        self._wasted_in_window += tokens
+        SPECULATION_OUTCOMES.inc(state=speculation.state.value, outcome="miss")
+        SPECULATION_WASTED_TOKENS.inc(tokens)
+        logger.debug("Especulación descartada para %s (%s tokens)", speculation.state.value, tokens)
@@ -0,0 +1,210 @@
+"""
+Transcripción local de notas de voz (CPU) en un pool de procesos acotado
+
+Cada worker del pool carga una vez el modelo de faster-whisper (dependencia opcional que solo
+se importa dentro de los workers) y transcribe clips completos, así el event loop nunca se
+bloquea con la decodificación ni con la inferencia. Antes de descargar o encolar un clip se
+valida su duración y se reserva su lugar en la cola (`reserve`), así las notas de voz
+concurrentes no descargan archivos que después no caben; lo que excede los límites se rechaza
+con `TranscriptionRejected` para que el bot pida el mensaje por escrito. Si el pool se rompe
+(p. ej. el modelo no carga en un worker) se recrea, y tras varios fallos seguidos la
+transcripción queda deshabilitada.
+"""
+
+import asyncio
+import importlib.util
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional, Tuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Frecuencia de muestreo que espera Whisper
+SAMPLE_RATE = 16000
+# Pools rotos seguidos (sin una transcripción exitosa entre ellos) antes de deshabilitar las notas de voz
+MAX_POOL_FAILURES = 3
+
+TRANSCRIPTION_SECONDS = REGISTRY.histogram(
+    "chatbot_transcription_seconds", "Tiempo desde que se encola un clip hasta tener su transcripción",
+    buckets=(0.5, 1, 2, 4, 8, 16, 32, 64)
+)
+TRANSCRIPTION_AUDIO_SECONDS = REGISTRY.counter(
+    "chatbot_transcription_audio_seconds_total", "Segundos de audio transcritos"
+)
+TRANSCRIPTION_REJECTED = REGISTRY.counter(
+    "chatbot_transcription_rejected_total", "Clips no transcritos por motivo", ["reason"]
+)
+TRANSCRIPTION_QUEUE_DEPTH = REGISTRY.gauge(
+    "chatbot_transcription_queue_depth", "Clips en transcripción o en espera de un worker"
+)
+
+
+class TranscriptionRejected(Exception):
+    """El clip no se transcribe: too_long, queue_full, empty o unavailable (sin transcriptor o pool roto)"""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class TranscriptionSlot:
+    """Lugar reservado en la cola de transcripción; se libera al salir del bloque `with`"""
+
+    def __init__(self, transcriber: "Transcriber"):
+        self.transcriber = transcriber
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.transcriber._pending -= 1
+            TRANSCRIPTION_QUEUE_DEPTH.set(self.transcriber._pending)
+
+    def __enter__(self) -> "TranscriptionSlot":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+def speech_available() -> bool:
+    """True si faster-whisper está instalado (sin importarlo en el proceso principal)"""
+    return importlib.util.find_spec("faster_whisper") is not None
+
+
+# Estado de cada proceso del pool
+_model = None
+
+
+def load_model(model_size: str, compute_type: str, cpu_threads: int):
+    """Inicializador de los workers: carga el modelo una sola vez por proceso"""
+    global _model
+    from faster_whisper import WhisperModel
+    _model = WhisperModel(model_size, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+def transcribe_clip(audio: bytes, max_duration: float, language: str) -> Tuple[str, float]:
+    """Decodifica el clip (OGG/Opus u otro formato de PyAV), lo recorta a `max_duration` y lo transcribe.
+
+    Devuelve (texto, segundos de audio procesados).
+    """
+    from faster_whisper.audio import decode_audio
+    samples = decode_audio(io.BytesIO(audio), sampling_rate=SAMPLE_RATE)
+    samples = samples[:int(max_duration * SAMPLE_RATE)]
+    segments, _ = _model.transcribe(samples, language=language, beam_size=1, vad_filter=True)
+    text = " ".join(segment.text.strip() for segment in segments).strip()
+    return text, len(samples) / SAMPLE_RATE
+
+
+class Transcriber:
+    """Pool de procesos de transcripción con cola acotada y tope de duración por clip"""
+
+    def __init__(self, model_size: str = "base", workers: int = 2, max_queue: int = 8,
+                 max_duration: float = 60.0, language: str = "es", compute_type: str = "int8",
+                 cpu_threads: int = 2,
+                 initializer: Callable = load_model, transcribe_fn: Callable = transcribe_clip,
+                 initargs: Optional[tuple] = None):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.max_duration = max_duration
+        self.language = language
+        self.initializer = initializer
+        self.transcribe_fn = transcribe_fn
+        self.initargs = (model_size, compute_type, cpu_threads) if initargs is None else initargs
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0  # Clips reservados: descargándose, en un worker o esperando uno
+        self._pool_failures = 0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_queue
+
+    def start(self):
+        """Crea el pool; los workers (y el modelo) se cargan en el primer clip.
+
+        Se usa "spawn" para no heredar con fork los hilos del bot (event loop, logging en cola).
+        """
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=self.initializer,
+                initargs=self.initargs
+            )
+            logger.info("Pool de transcripción iniciado: %s workers, cola de %s, clips de hasta %ss",
+                        self.workers, self.max_queue, self.max_duration)
+
+    def stop(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def available(self) -> bool:
+        return self._pool_failures < MAX_POOL_FAILURES
+
+    def check(self, duration: Optional[float]):
+        """Valida el clip antes de descargarlo; lanza TranscriptionRejected si excede los límites"""
+        if not self.available:
+            TRANSCRIPTION_REJECTED.inc(reason="unavailable")
+            raise TranscriptionRejected("unavailable")
+        if duration is not None and duration > self.max_duration:
+            TRANSCRIPTION_REJECTED.inc(reason="too_long")
+            raise TranscriptionRejected("too_long")
+        if self._pending >= self.capacity:
+            TRANSCRIPTION_REJECTED.inc(reason="queue_full")
+            raise TranscriptionRejected("queue_full")
+
+    def reserve(self, duration: Optional[float]) -> TranscriptionSlot:
+        """Valida el clip y reserva su lugar en la cola antes de descargarlo"""
+        self.check(duration)
+        self._pending += 1
+        TRANSCRIPTION_QUEUE_DEPTH.set(self._pending)
+        return TranscriptionSlot(self)
+
+    def _restart_pool(self, error: Exception):
+        """Descarta un pool roto; el siguiente clip crea uno nuevo salvo que ya haya fallado demasiadas veces"""
+        self._pool_failures += 1
+        logger.error("Pool de transcripción roto (%s/%s): %s", self._pool_failures, MAX_POOL_FAILURES, error)
+        self.stop()
+        if not self.available:
+            logger.error("Transcripción de notas de voz deshabilitada tras %s fallos del pool", self._pool_failures)
+
+    async def transcribe(self, audio: bytes, duration: Optional[float] = None,
+                         slot: Optional[TranscriptionSlot] = None) -> str:
+        """Transcribe un clip en el pool sin bloquear el event loop (con el lugar de `reserve` si se indica)"""
+        if slot is None:
+            slot = self.reserve(duration)
+        with slot:
+            self.start()
+            executor = self._executor
+            start = time.perf_counter()
+            try:
+                text, audio_seconds = await asyncio.get_running_loop().run_in_executor(
+                    executor, self.transcribe_fn, audio, self.max_duration, self.language
+                )
+            except BrokenProcessPool as e:
+                # Otro clip pudo haber recreado ya el pool
+                if executor is self._executor:
+                    self._restart_pool(e)
+                TRANSCRIPTION_REJECTED.inc(reason="unavailable")
+                raise TranscriptionRejected("unavailable") from e
+        self._pool_failures = 0
+        TRANSCRIPTION_SECONDS.observe(time.perf_counter() - start)
+        TRANSCRIPTION_AUDIO_SECONDS.inc(audio_seconds)
+        if not text:
+            TRANSCRIPTION_REJECTED.inc(reason="empty")
+            raise TranscriptionRejected("empty")
+        return text
+
+
+def default_cpu_threads(workers: int) -> int:
+    """Hilos de inferencia por worker para no sobresuscribir los núcleos"""
+    return max(1, (os.cpu_count() or 1) // max(workers, 1))
@@ -2,16 +2,49 @@
 Bot de Telegram para el chatbot
 """
 
+import logging
+from datetime import datetime, timezone
+from typing import Optional
 from telegram import Update
 from telegram.ext import Application, MessageHandler, CommandHandler, ContextTypes, filters
 from conversation import ConversationManager
-from config import logger
+from admission import AdmissionController, Shed
+from deadline import Deadline
+from speech import Transcriber, TranscriptionRejected
+from metrics import start_metrics_server
+from tracing import trace_update, span, record_span
+from config import METRICS_HOST, METRICS_PORT, TURN_DEADLINE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Respuesta cuando una nota de voz no se transcribe, por motivo
+VOICE_REJECTED_REPLIES = {
+    "too_long": "Tu nota de voz es muy larga para procesarla. ¿Podrías enviarla más corta (máximo {max_duration:.0f} segundos) o escribir tu mensaje?",
+    "queue_full": "En este momento no puedo escuchar notas de voz. ¿Podrías escribir tu mensaje?",
+    "unavailable": "Por ahora no puedo escuchar notas de voz. ¿Podrías escribir tu mensaje?",
+    "empty": "No logré entender la nota de voz. ¿Podrías repetirla o escribir tu mensaje?",
+}
 
 class TelegramBot:
-    def __init__(self, token: str, conversation_manager: ConversationManager):
+    def __init__(self, token: str, conversation_manager: ConversationManager,
+                 admission: Optional[AdmissionController] = None,
+                 transcriber: Optional[Transcriber] = None):
         self.token = token
         self.conversation_manager = conversation_manager
-        self.application = Application.builder().token(token).build()
+        self.admission = admission
+        self.transcriber = transcriber
+        self.metrics_server = None
+        builder = (
+            Application.builder()
+            .token(token)
+            .post_init(self._post_init)
+            .post_shutdown(self._post_shutdown)
+        )
+        if admission is not None:
+            # Los handlers corren en paralelo y el control de admisión limita el trabajo real;
+            # el margen deja que los turnos excedentes lleguen a él y se descarten de inmediato
+            builder = builder.concurrent_updates(2 * admission.capacity)
+        self.application = builder.build()
         self._setup_handlers()
     
     def _setup_handlers(self):
@@ -19,37 +52,142 @@ class TelegramBot:
         self.application.add_handler(CommandHandler("start", self.start_command))
         self.application.add_handler(CommandHandler("reset", self.reset_command))
         self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message))
+        self.application.add_handler(MessageHandler(filters.VOICE | filters.AUDIO, self.handle_voice))
+    
+    async def _post_init(self, application: Application):
+        """Inicia servicios auxiliares una vez que el event loop está corriendo"""
+        await self.conversation_manager.start_background_tasks()
+        if self.admission is not None:
+            await self.admission.start()
+        if self.transcriber is not None:
+            self.transcriber.start()
+        try:
+            self.metrics_server = await start_metrics_server(METRICS_HOST, METRICS_PORT)
+        except OSError as e:
+            logger.error("No se pudo iniciar el endpoint de métricas: %s", e)
+    
+    async def _post_shutdown(self, application: Application):
+        """Detiene las tareas de fondo y confirma lo pendiente en el journal"""
+        if self.admission is not None:
+            await self.admission.stop()
+        if self.transcriber is not None:
+            self.transcriber.stop()
+        await self.conversation_manager.stop_background_tasks()
+        await self.conversation_manager.llm.close()
+        if self.metrics_server is not None:
+            self.metrics_server.close()
+    
+    def _record_queue_wait(self, update: Update):
+        """Registra el tiempo entre que Telegram recibió el mensaje y que empezamos a procesarlo"""
+        if update.message and update.message.date:
+            wait = (datetime.now(timezone.utc) - update.message.date).total_seconds()
+            record_span("telegram.queue_wait", max(wait, 0.0))
+    
+    def _new_deadline(self) -> Optional[Deadline]:
+        """Presupuesto del update desde que llega (incluye la espera en la cola de admisión)"""
+        return Deadline(TURN_DEADLINE_SECONDS) if TURN_DEADLINE_SECONDS > 0 else None
+    
+    async def _process(self, telegram_id: str, message: str, deadline: Optional[Deadline] = None) -> str:
+        """Procesa el turno pasando por el control de admisión; si se descarta, responde con la
+        respuesta de respaldo del estado actual"""
+        if self.admission is None:
+            return await self.conversation_manager.process_message(telegram_id, message, deadline)
+        state = self.conversation_manager.current_state(telegram_id)
+        try:
+            return await self.admission.submit(
+                telegram_id,
+                self.admission.priority_for(state),
+                lambda: self.conversation_manager.process_message(telegram_id, message, deadline)
+            )
+        except Shed as e:
+            logger.info("Turno descartado (%s) - Telegram ID: %s", e.reason, telegram_id)
+            return await self.conversation_manager.shed_reply(telegram_id, message)
+    
+    async def _reply(self, update: Update, text: str):
+        """Envía la respuesta al usuario midiendo el envío"""
+        with span("telegram.send"):
+            await update.message.reply_text(text)
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handler para el comando /start"""
         telegram_id = str(update.effective_user.id)
-        response = await self.conversation_manager.process_message(
-            telegram_id, 
-            "Hola, quiero información sobre maquinaria"
-        )
-        await update.message.reply_text(response)
+        with trace_update(telegram_id, "start"):
+            self._record_queue_wait(update)
+            response = await self._process(
+                telegram_id, "Hola, quiero información sobre maquinaria", self._new_deadline()
+            )
+            await self._reply(update, response)
     
     async def reset_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handler para reiniciar conversación"""
         telegram_id = str(update.effective_user.id)
-        await self.conversation_manager.reset_conversation_with_new_contact(telegram_id)
-        await update.message.reply_text(
-            "Conversación reiniciada. Se ha creado un nuevo contacto en el CRM. Puedes comenzar de nuevo con /start"
-        )
+        with trace_update(telegram_id, "reset"):
+            self._record_queue_wait(update)
+            if await self.conversation_manager.reset_conversation(telegram_id):
+                await self._reply(update, "Conversación reiniciada. Puedes comenzar de nuevo con /start")
+            else:
+                await self._reply(
+                    update,
+                    "Ya reiniciaste la conversación hace un momento. Espera unos segundos antes de volver a intentarlo."
+                )
      
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handler para mensajes de texto"""
         telegram_id = str(update.effective_user.id)
         message = update.message.text
         
-        try:
-            response = await self.conversation_manager.process_message(telegram_id, message)
-            await update.message.reply_text(response)
-        except Exception as e:
-            logger.error(f"Error procesando mensaje: {e}")
-            await update.message.reply_text(
-                "Disculpa, hubo un problema técnico. ¿Podrías repetir tu mensaje?"
-            )
+        deadline = self._new_deadline()
+        
+        with trace_update(telegram_id, "message"):
+            self._record_queue_wait(update)
+            try:
+                response = await self._process(telegram_id, message, deadline)
+                await self._reply(update, response)
+            except Exception as e:
+                logger.error("Error procesando mensaje: %s", e)
+                await self._reply(
+                    update,
+                    "Disculpa, hubo un problema técnico. ¿Podrías repetir tu mensaje?"
+                )
+    
+    async def handle_voice(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handler para notas de voz y audios: se transcriben y se procesan como un mensaje de texto"""
+        telegram_id = str(update.effective_user.id)
+        media = update.message.voice or update.message.audio
+        
+        with trace_update(telegram_id, "voice"):
+            self._record_queue_wait(update)
+            try:
+                if self.transcriber is None:
+                    raise TranscriptionRejected("unavailable")
+                # Validar la duración y reservar el lugar en la cola antes de descargar el archivo
+                with self.transcriber.reserve(media.duration) as slot:
+                    with span("telegram.download_voice"):
+                        audio_file = await media.get_file()
+                        audio = bytes(await audio_file.download_as_bytearray())
+                    with span("speech.transcribe"):
+                        message = await self.transcriber.transcribe(audio, media.duration, slot)
+            except TranscriptionRejected as e:
+                logger.info("Nota de voz no transcrita (%s) - Telegram ID: %s", e.reason, telegram_id)
+                max_duration = self.transcriber.max_duration if self.transcriber else 0
+                await self._reply(update, VOICE_REJECTED_REPLIES[e.reason].format(max_duration=max_duration))
+                return
+            except Exception as e:
+                logger.error("Error transcribiendo nota de voz: %s", e)
+                await self._reply(update, VOICE_REJECTED_REPLIES["empty"])
+                return
+            
+            logger.debug("Nota de voz transcrita: %s", message)
+            try:
+                # El presupuesto del turno empieza al tener el texto (la transcripción tiene su propio tope)
+                response = await self._process(telegram_id, message, self._new_deadline())
+                await self._reply(update, response)
+            except Exception as e:
+                logger.error("Error procesando mensaje: %s", e)
+                await self._reply(
+                    update,
+                    "Disculpa, hubo un problema técnico. ¿Podrías repetir tu mensaje?"
+                )
     
     def run(self):
         """Inicia el bot"""
@@ -59,4 +197,4 @@ class TelegramBot:
     def stop(self):
         """Detiene el bot"""
         logger.info("Deteniendo bot de Telegram...")
-        self.application.stop() 
\ No newline at end of file
+        self.application.stop()
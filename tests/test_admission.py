@@ -0,0 +1,107 @@
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, Shed
+
+
+def _work(result, started=None, release=None, log=None):
+    async def work():
+        if started is not None:
+            started.set()
+        if release is not None:
+            await release.wait()
+        if log is not None:
+            log.append(result)
+        return result
+    return work
+
+
+async def _settle():
+    """Deja que los workers tomen los turnos encolados"""
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+async def controller():
+    controller = AdmissionController(workers=2, max_queue=4, shed_depth=2, shed_priority=3,
+                                     user_rate=100, user_burst=100)
+    await controller.start()
+    yield controller
+    await controller.stop()
+
+
+async def test_submit_returns_the_result(controller):
+    assert await controller.submit("1", 0, _work("ok")) == "ok"
+
+
+async def test_user_rate_limit_sheds():
+    controller = AdmissionController(workers=1, user_rate=0.001, user_burst=1)
+    await controller.start()
+    try:
+        await controller.submit("1", 0, _work("ok"))
+        with pytest.raises(Shed) as error:
+            await controller.submit("1", 0, _work("ok"))
+        assert error.value.reason == "user_rate"
+    finally:
+        await controller.stop()
+
+
+async def test_low_priority_is_shed_under_overload(controller):
+    release = asyncio.Event()
+    busy = [asyncio.create_task(controller.submit(str(user), 0, _work(user, release=release)))
+            for user in range(4)]
+    await _settle()
+    assert controller.queue_depth == 2
+    with pytest.raises(Shed) as error:
+        await controller.submit("low", 3, _work("low"))
+    assert error.value.reason == "overload"
+    release.set()
+    await asyncio.gather(*busy)
+
+
+async def test_full_queue_evicts_the_lowest_priority(controller):
+    release = asyncio.Event()
+    running = [asyncio.create_task(controller.submit(f"r{n}", 0, _work(n, release=release))) for n in range(2)]
+    await _settle()
+    queued = [asyncio.create_task(controller.submit(f"q{n}", 2, _work(n, release=release))) for n in range(4)]
+    await _settle()
+    urgent = asyncio.create_task(controller.submit("urgent", 0, _work("urgent")))
+    await _settle()
+    release.set()
+    assert await urgent == "urgent"
+    results = await asyncio.gather(*queued, return_exceptions=True)
+    assert [isinstance(result, Shed) and result.reason == "evicted" for result in results] == \
+        [False, False, False, True]
+    await asyncio.gather(*running)
+
+
+async def test_user_turns_run_in_order_without_holding_workers(controller):
+    release = asyncio.Event()
+    log = []
+    burst = [asyncio.create_task(controller.submit("spam", 2, _work(n, release=release, log=log)))
+             for n in range(3)]
+    await _settle()
+    # Con dos workers, el turno de otro usuario no espera a que termine la ráfaga
+    assert await asyncio.wait_for(controller.submit("other", 2, _work("other")), 1) == "other"
+    release.set()
+    assert await asyncio.gather(*burst) == [0, 1, 2]
+    assert log == [0, 1, 2]
+
+
+async def test_stop_resolves_running_and_queued_turns():
+    controller = AdmissionController(workers=1, max_queue=4, user_rate=100, user_burst=100)
+    await controller.start()
+    started = asyncio.Event()
+    running = asyncio.create_task(controller.submit("1", 0, _work("a", started=started, release=asyncio.Event())))
+    queued = asyncio.create_task(controller.submit("2", 0, _work("b")))
+    waiting = asyncio.create_task(controller.submit("1", 0, _work("c")))
+    await started.wait()
+    await controller.stop()
+    for task in (running, queued, waiting):
+        with pytest.raises(Shed) as error:
+            await task
+        assert error.value.reason == "shutdown"
+    with pytest.raises(Shed):
+        await controller.submit("3", 0, _work("d"))
@@ -0,0 +1,81 @@
+from typing import Dict, List, Optional, Set
+
+from hubspot import HubSpotManager
+from models import Lead
+
+
+class RecordingHubSpotManager(HubSpotManager):
+    """HubSpotManager sin red: registra las llamadas y responde lo configurado"""
+
+    def __init__(self, update_ok: bool = True, updated_ids: Optional[Set[str]] = None):
+        super().__init__("token", optional_properties=["giro_empresa"])
+        self.update_ok = update_ok
+        self.updated_ids = updated_ids
+        self.updates: List[Dict] = []
+        self.batches: List[List[Dict]] = []
+
+    async def _update_contact(self, contact_id: str, properties: Dict) -> Optional[str]:
+        self.updates.append(properties)
+        return contact_id if self.update_ok else None
+
+    async def _find_contact_by_telegram_id(self, telegram_id: str) -> Optional[str]:
+        return None
+
+    async def _create_contact(self, properties: Dict) -> Optional[str]:
+        return None
+
+    async def _batch_update(self, inputs: List[Dict]) -> Set[str]:
+        self.batches.append(inputs)
+        return self.updated_ids if self.updated_ids is not None else {item["id"] for item in inputs}
+
+
+def _synced_lead(**fields) -> Lead:
+    lead = Lead("1", hubspot_contact_id="c1", **fields)
+    lead.pop_dirty()
+    return lead
+
+
+async def test_unchanged_lead_skips_the_call():
+    manager = RecordingHubSpotManager()
+    lead = _synced_lead(name="Ana")
+    assert await manager.create_or_update_contact(lead) == "c1"
+    assert manager.updates == []
+    assert lead.avoided_syncs == 1
+
+
+async def test_field_cleared_to_empty_is_an_empty_delta():
+    manager = RecordingHubSpotManager()
+    lead = _synced_lead(email="ana@ejemplo.com")
+    lead.email = ""
+    assert await manager.create_or_update_contact(lead) == "c1"
+    assert manager.updates == []
+
+
+async def test_only_changed_properties_are_sent():
+    manager = RecordingHubSpotManager()
+    lead = _synced_lead(name="Ana", email="ana@ejemplo.com")
+    lead.phone = "55 1234 5678"
+    await manager.create_or_update_contact(lead)
+    assert manager.updates == [{"phone": "55 1234 5678"}]
+    assert lead.dirty_fields == frozenset()
+
+
+async def test_failed_sync_keeps_changes_dirty():
+    manager = RecordingHubSpotManager(update_ok=False)
+    lead = _synced_lead(name="Ana")
+    lead.phone = "55 1234 5678"
+    assert await manager.create_or_update_contact(lead) is None
+    assert "phone" in lead.dirty_fields
+
+
+async def test_batch_update_reports_only_failed_contacts():
+    manager = RecordingHubSpotManager(updated_ids={"c1"})
+    leads = [
+        Lead("1", hubspot_contact_id="c1", company_business="construcción"),
+        Lead("2", hubspot_contact_id="c2", company_business="minería"),
+        Lead("3", company_business="renta"),  # Sin contacto: no se envía
+    ]
+    result = await manager.batch_update_contacts(leads, ["company_business"])
+    assert [lead.telegram_id for lead in result.updated] == ["1"]
+    assert [lead.telegram_id for lead in result.failed] == ["2"]
+    assert len(manager.batches[0]) == 2
@@ -0,0 +1,115 @@
+import shutil
+
+import pytest
+
+from journal import LeadJournal, decode_line, encode_event, fold_events
+
+
+def _lead_event(telegram_id, pending_sync=False, archived=False, state="WAITING_NAME"):
+    return {"type": "lead", "telegram_id": telegram_id, "state": state, "lead": {"telegram_id": telegram_id},
+            "pending_sync": pending_sync, "archived": archived}
+
+
+def test_encode_decode_roundtrip_and_truncated_line():
+    line = encode_event({"type": "message", "telegram_id": "1"})
+    assert decode_line(line) == {"type": "message", "telegram_id": "1"}
+    assert decode_line(line[:-1]) is None
+    assert decode_line(line.replace(b"message", b"messagf")) is None
+
+
+def test_fold_events_last_state_wins():
+    conversations = fold_events([
+        {"type": "message", "telegram_id": "1", "role": "user", "content": "Hola"},
+        _lead_event("1", pending_sync=True),
+        {"type": "synced", "telegram_id": "1", "contact_id": "c1"},
+        {"type": "completed", "telegram_id": "1"},
+    ])
+    entry = conversations["1"]
+    assert entry["history"] == [{"role": "user", "content": "Hola"}]
+    assert entry["pending_sync"] is False
+    assert entry["completed"] is True
+    assert entry["lead"]["hubspot_contact_id"] == "c1"
+
+
+def test_fold_events_reset_keeps_archived_lead():
+    conversations = fold_events([
+        _lead_event("1", pending_sync=True),
+        _lead_event("1#42", pending_sync=True, archived=True),
+        {"type": "reset", "telegram_id": "1"},
+    ])
+    assert "1" not in conversations
+    assert conversations["1#42"]["archived"] is True
+    assert conversations["1#42"]["pending_sync"] is True
+
+
+@pytest.fixture
+async def journal(tmp_path):
+    journal = LeadJournal(str(tmp_path), fsync=False)
+    yield journal
+    await journal.stop()
+
+
+async def _sealed_segments(journal, *batches):
+    """Escribe cada lote en su propio segmento y los deja sellados"""
+    for events in batches:
+        await journal.start()
+        await journal.append(*events)
+        await journal.stop()
+
+
+async def test_compact_drops_synced_archived_and_keeps_pending(journal):
+    await _sealed_segments(
+        journal,
+        [_lead_event("1#1", archived=True), _lead_event("2#1", pending_sync=True, archived=True)],
+        [_lead_event("3"), {"type": "completed", "telegram_id": "3"}],
+    )
+    assert journal.compact() == 1
+    restored = journal.replay()
+    assert set(restored) == {"2#1", "3"}
+    assert len(journal.segments()) == 1
+
+
+async def test_compact_drop_completed(journal):
+    await _sealed_segments(
+        journal, [_lead_event("1"), {"type": "completed", "telegram_id": "1"}], [_lead_event("2")]
+    )
+    journal.compact(drop_completed=True)
+    assert set(journal.replay()) == {"2"}
+
+
+async def test_crash_before_removing_old_segments_does_not_resurrect_dropped_entries(journal, tmp_path):
+    await _sealed_segments(journal, [_lead_event("1#1", archived=True)], [_lead_event("2")])
+    (first_seq, first_path), _ = journal.segments()
+    backup = tmp_path / "backup"
+    shutil.copy(first_path, backup)
+    journal.compact()
+    # Simula una caída entre os.replace y el borrado de los segmentos anteriores
+    shutil.copy(backup, first_path)
+    backup.unlink()
+    assert set(journal.replay()) == {"2"}
+
+
+async def test_failed_write_does_not_corrupt_the_next_batch(journal):
+    await journal.start()
+    real_file = journal._file
+
+    class FailingFile:
+        name = real_file.name
+
+        def tell(self):
+            return real_file.tell()
+
+        def write(self, data):
+            real_file.write(data[:5])
+            real_file.flush()
+            raise OSError("disco lleno")
+
+        def close(self):
+            real_file.close()
+
+    journal._file = FailingFile()
+    with pytest.raises(OSError):
+        await journal.append({"type": "message", "telegram_id": "1", "role": "user", "content": "perdido"})
+    await journal.append({"type": "message", "telegram_id": "1", "role": "user", "content": "conservado"})
+    await journal.stop()
+    assert journal.replay()["1"]["history"] == [{"role": "user", "content": "conservado"}]
@@ -0,0 +1,25 @@
+import pytest
+
+from location import extract_user_place
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("Estoy en Mérida", "Mérida"),
+    ("Somos de Monterrey, Nuevo León", "Monterrey"),
+    ("¿Hacen envío a Puebla?", "Puebla"),
+    ("Trabajamos cerca de Guadalajara", "Guadalajara"),
+    ("Estamos en Jalisco", "Jalisco"),
+])
+def test_place_after_locative_cue(message, expected):
+    place = extract_user_place(message)
+    assert place is not None and place.name == expected
+
+
+@pytest.mark.parametrize("message", [
+    "Me llamo Ana de León",
+    "Mi proveedor atiende a Córdoba",
+    "Busco una soldadora de 250 amperes",
+    "",
+])
+def test_no_place_without_cue(message):
+    assert extract_user_place(message) is None
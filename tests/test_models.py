@@ -0,0 +1,38 @@
+from models import Lead
+
+
+def test_new_lead_marks_given_fields_dirty():
+    lead = Lead("1", name="Ana", email="ana@ejemplo.com")
+    assert {"telegram_id", "name", "email"} <= lead.dirty_fields
+    assert "phone" not in lead.dirty_fields
+
+
+def test_pop_dirty_returns_and_clears():
+    lead = Lead("1", name="Ana")
+    dirty = lead.pop_dirty()
+    assert "name" in dirty
+    assert lead.dirty_fields == frozenset()
+
+
+def test_assigning_same_value_is_not_a_change():
+    lead = Lead("1", name="Ana")
+    lead.pop_dirty()
+    lead.name = "Ana"
+    assert lead.dirty_fields == frozenset()
+    lead.name = "Ana López"
+    assert lead.dirty_fields == {"name"}
+
+
+def test_add_machine_characteristic_is_tracked():
+    lead = Lead("1")
+    lead.pop_dirty()
+    lead.add_machine_characteristic("250 amperes")
+    assert lead.dirty_fields == {"machine_characteristics"}
+    assert lead.machine_characteristics == ["250 amperes"]
+
+
+def test_mark_dirty_restores_fields():
+    lead = Lead("1", email="ana@ejemplo.com")
+    dirty = lead.pop_dirty()
+    lead.mark_dirty(dirty)
+    assert lead.dirty_fields == dirty
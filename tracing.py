@@ -0,0 +1,115 @@
+"""
+Trazas por update (spans) y logs estructurados correlacionados por telegram_id
+"""
+
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+import structlog
+
+from metrics import REGISTRY
+
+SPAN_DURATION = REGISTRY.histogram(
+    "chatbot_span_duration_seconds", "Duración de cada span del hot path", ["span"]
+)
+SPAN_ERRORS = REGISTRY.counter(
+    "chatbot_span_errors_total", "Spans que terminaron con excepción", ["span"]
+)
+UPDATES = REGISTRY.counter(
+    "chatbot_updates_total", "Updates de Telegram procesados", ["handler"]
+)
+LLM_TOKENS = REGISTRY.counter(
+    "chatbot_llm_tokens_total", "Tokens consumidos en el LLM", ["task", "kind"]
+)
+
+log = structlog.get_logger("tracing")
+
+
+class Trace:
+    """Spans registrados durante el procesamiento de un update"""
+
+    def __init__(self, telegram_id: str, handler: str):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.telegram_id = telegram_id
+        self.handler = handler
+        self.started = time.perf_counter()
+        self.spans: List[Dict] = []
+
+    def breakdown(self) -> Dict[str, float]:
+        """Tiempo acumulado por span en milisegundos"""
+        totals: Dict[str, float] = {}
+        for span_data in self.spans:
+            totals[span_data['name']] = totals.get(span_data['name'], 0.0) + span_data['duration_ms']
+        return {name: round(value, 2) for name, value in totals.items()}
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+
+
+def configure_structlog():
+    """Configura structlog sobre logging estándar para que comparta handlers y formato"""
+    structlog.configure(
+        processors=[
+            structlog.contextvars.merge_contextvars,
+            structlog.stdlib.add_log_level,
+            structlog.processors.TimeStamper(fmt="iso"),
+            structlog.processors.JSONRenderer(ensure_ascii=False)
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True
+    )
+
+
+@contextmanager
+def trace_update(telegram_id: str, handler: str):
+    """Abre una traza para un update y enlaza telegram_id/trace_id a los logs estructurados"""
+    trace = Trace(telegram_id, handler)
+    token = _current_trace.set(trace)
+    structlog.contextvars.bind_contextvars(telegram_id=telegram_id, trace_id=trace.trace_id)
+    UPDATES.inc(handler=handler)
+    try:
+        with span("update", handler=handler):
+            yield trace
+    finally:
+        total_ms = (time.perf_counter() - trace.started) * 1000
+        log.info("update_completed", handler=handler, total_ms=round(total_ms, 2), spans=trace.breakdown())
+        structlog.contextvars.unbind_contextvars("telegram_id", "trace_id")
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Mide un tramo del hot path y lo registra en el histograma y en la traza actual"""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        SPAN_ERRORS.inc(span=name)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        SPAN_DURATION.observe(duration, span=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append({'name': name, 'duration_ms': duration * 1000, **attributes})
+
+
+def record_span(name: str, duration: float, **attributes):
+    """Registra un span medido externamente (por ejemplo, tiempo de espera en cola)"""
+    SPAN_DURATION.observe(duration, span=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.spans.append({'name': name, 'duration_ms': duration * 1000, **attributes})
+
+
+def record_token_usage(task: str, response):
+    """Acumula el uso de tokens reportado en la respuesta de completion"""
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, task=task, kind="prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, task=task, kind="completion")